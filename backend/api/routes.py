@@ -13,6 +13,11 @@ from loguru import logger
 from core.pipeline import FloorPlanPipeline
 from utils.file_handler import save_upload_file
 from services.revit_client import RevitClient
+from backend.service.detection.batching import detection_service
+from backend.service.detection.registry import model_registry
+from backend.service.semantic.analysis_cache import semantic_cache
+from backend.service.semantic.cascade import semantic_cascade
+from backend.service.semantic.gemini_client import gemini_limiter
 
 router = APIRouter()
 
@@ -245,6 +250,50 @@ async def download_render(job_id: str):
     return FileResponse(render_path, media_type="image/png")
 
 
+@router.get("/metrics/detection")
+async def detection_metrics():
+    """Batching throughput and latency percentiles for the shared detector"""
+    return detection_service.stats()
+
+
+@router.get("/metrics/gemini")
+async def gemini_metrics():
+    """In-flight Gemini calls, retries, timeouts and latency percentiles"""
+    return gemini_limiter.stats()
+
+
+@router.get("/metrics/semantic-cache")
+async def semantic_cache_metrics():
+    """Hit/miss counts and size of the Stage 4 analysis cache"""
+    return semantic_cache.stats()
+
+
+@router.get("/metrics/semantic-cascade")
+async def semantic_cascade_metrics():
+    """Share of elements resolved without the LLM and the estimated latency saved"""
+    return semantic_cascade.stats()
+
+
+@router.get("/models/status")
+async def models_status():
+    """Readiness of the detection models (idle / loading / ready / failed)"""
+    return model_registry.status()
+
+
+@router.post("/models/reload")
+async def reload_models():
+    """
+    Load the weights currently on disk, warm them up and swap them in
+    without restarting; jobs already running keep the previous models
+    """
+    status = await model_registry.reload()
+    if not status["reloaded"]:
+        # 409: the previous models are still serving; 503: there are none
+        code = 409 if status["state"] == "ready" else 503
+        raise HTTPException(code, f"Model reload failed: {status['error']}")
+    return status
+
+
 @router.get("/health")
 async def health():
     """Health check"""
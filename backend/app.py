@@ -18,9 +18,13 @@ from pathlib import Path
 from dotenv import load_dotenv
 from loguru import logger
 
+from backend.config import configure_torch_threads
 from backend.core.pipeline import FloorPlanPipeline
 from api.routes import router as api_router
 from api.websocket import manager as ws_manager
+from backend.service.detection.batching import detection_service
+from backend.service.detection.registry import model_registry
+from backend.service.semantic.qwen_service import qwen_service
 from utils.logger import setup_logger
 
 # Load environment variables
@@ -56,6 +60,14 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning(f"✗ Cannot connect to Windows Revit server - RVT export will fail")
     
+    # torch's thread pool is process-wide: size it once, before any model runs
+    configure_torch_threads(model_registry.specialised_model_count())
+
+    # Load detection models in the background so startup doesn't wait on weights
+    if os.getenv("PRELOAD_MODELS", "true").lower() == "true":
+        model_registry.start_background_load()
+        logger.info("Detection models loading in background (see /api/models/status)")
+
     logger.info("System ready!")
     
     yield  # Application runs here
@@ -63,6 +75,8 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down Amplify Floor Plan AI System")
     await ws_manager.disconnect_all()
+    await detection_service.shutdown()
+    qwen_service.shutdown()
 
 
 # Create FastAPI app with lifespan
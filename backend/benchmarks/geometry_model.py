@@ -0,0 +1,180 @@
+"""
+Geometry Model Benchmark: Stage 5 per-element dicts vs record arrays with vectorised transforms
+
+Synthetic walls / doors / windows / columns / rooms, no models needed:
+    python -m backend.benchmarks.geometry_model --elements 100000
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import trimesh
+
+from backend.services.stage5_geometry_generator import Stage5GeometryGenerator
+from backend.services.stage6_bim_enrichment import Stage6BIMEnrichment
+from backend.services.stage7_exporters.gltf_exporter import oriented_boxes
+
+
+def synthetic_elements(count: int, seed: int = 0) -> dict:
+    """count elements split 40/20/20/10/10 over walls, doors, windows, columns and rooms"""
+    rng = np.random.default_rng(seed)
+    n_walls, n_doors, n_windows, n_columns = int(count * .4), int(count * .2), int(count * .2), int(count * .1)
+    n_rooms = count - n_walls - n_doors - n_windows - n_columns
+
+    start = rng.uniform(0, 20000, (n_walls, 2)).astype(int)
+    end = start + rng.integers(100, 2000, (n_walls, 2)) * rng.integers(0, 2, (n_walls, 1)) * [[1, 0]]
+    walls = [
+        {"id": i, "endpoints": [s, e], "thickness": 200.0, "wall_function": "exterior" if i % 5 == 0 else "interior"}
+        for i, (s, e) in enumerate(zip(start.tolist(), end.tolist()))
+    ]
+
+    def openings(n: int, kind: str):
+        centers = rng.uniform(0, 20000, (n, 2)).astype(int).tolist()
+        key = "door_type" if kind == "door" else "window_type"
+        return [{"id": i, "center": c, "insertion_point": c, "width": 900, key: "single" if kind == "door" else "fixed",
+                 "host_wall_id": i % max(n_walls, 1)} for i, c in enumerate(centers)]
+
+    columns = [{"id": i, "center": c, "dimensions": {"width_mm": 300.0, "height_mm": 300.0}}
+               for i, c in enumerate(rng.uniform(0, 20000, (n_columns, 2)).astype(int).tolist())]
+    corners = rng.uniform(0, 20000, (n_rooms, 2)).astype(int)
+    rooms = [{"id": i, "center": [x + 200, y + 150], "area_sqm": 12.0, "name": f"Room {i}",
+              "boundary": [[x, y], [x + 400, y], [x + 400, y + 300], [x, y + 300]]}
+             for i, (x, y) in enumerate(corners.tolist())]
+    return {"walls": walls, "doors": openings(n_doors, "door"), "windows": openings(n_windows, "window"),
+            "columns": columns, "rooms": rooms}
+
+
+def dict_path(elements: dict, pixels_per_mm: float, d: Stage5GeometryGenerator) -> dict:
+    """The per-element Stage 5 loops this model replaced, kept as the baseline"""
+    walls = []
+    for wall in elements["walls"]:
+        start_mm = [p / pixels_per_mm for p in wall["endpoints"][0]]
+        end_mm = [p / pixels_per_mm for p in wall["endpoints"][1]]
+        walls.append({
+            "id": wall.get("id"),
+            "start_point": {"x": start_mm[0], "y": start_mm[1], "z": 0},
+            "end_point": {"x": end_mm[0], "y": end_mm[1], "z": 0},
+            "thickness": wall.get("thickness", d.default_wall_thickness),
+            "height": wall.get("ceiling_height", d.default_wall_height),
+            "material": wall.get("material", "Concrete"),
+            "is_structural": wall.get("structural", False),
+            "function": wall.get("wall_function", "Interior")
+        })
+
+    def openings(items, o_type):
+        out = []
+        for op in items:
+            center_mm = [p / pixels_per_mm for p in op.get("insertion_point", op["center"])]
+            param = {
+                "id": op.get("id"),
+                "location": {"x": center_mm[0], "y": center_mm[1], "z": 0 if o_type == "door" else d.default_sill_height},
+                "width": op.get("width", 900 if o_type == "door" else 1200),
+                "height": op.get("height", d.default_door_height if o_type == "door" else d.default_window_height),
+                "type_name": op.get("door_type" if o_type == "door" else "window_type", "Standard"),
+                "host_wall_id": op.get("host_wall_id")
+            }
+            if o_type == "door":
+                param["swing_direction"] = op.get("swing_direction", "Right")
+            out.append(param)
+        return out
+
+    columns = []
+    for col in elements["columns"]:
+        center_mm = [p / pixels_per_mm for p in col["center"]]
+        columns.append({
+            "id": col.get("id"),
+            "location": {"x": center_mm[0], "y": center_mm[1], "z": 0},
+            "width": col["dimensions"]["width_mm"],
+            "depth": col["dimensions"]["height_mm"],
+            "height": d.default_wall_height,
+            "shape": col.get("column_shape", "rectangular"),
+            "material": col.get("material", "Concrete")
+        })
+
+    rooms, floors = [], []
+    for i, room in enumerate(elements["rooms"]):
+        center_mm = [p / pixels_per_mm for p in room["center"]]
+        rooms.append({
+            "id": room.get("id"), "name": room.get("name", "Unnamed Room"), "number": room.get("number"),
+            "purpose": room.get("purpose", "General"), "flooring": room.get("flooring"),
+            "center_point": {"x": center_mm[0], "y": center_mm[1], "z": 0},
+            "area_sqm": room.get("area_sqm", 0), "target_height": room.get("ceiling_height", d.default_wall_height)
+        })
+        floors.append({
+            "id": f"floor_{i}",
+            "boundary_points": [{"x": p[0] / pixels_per_mm, "y": p[1] / pixels_per_mm} for p in room["boundary"]],
+            "thickness": d.default_floor_thickness,
+            "elevation": 0
+        })
+    return {"walls": walls, "doors": openings(elements["doors"], "door"),
+            "windows": openings(elements["windows"], "window"), "columns": columns, "rooms": rooms, "floors": floors}
+
+
+def dict_wall_meshes(walls: list) -> trimesh.Scene:
+    """The per-wall glTF boxes the exporter used to build"""
+    scene = trimesh.Scene()
+    for wall in walls:
+        s, e = wall["start_point"], wall["end_point"]
+        dx, dy = e["x"] - s["x"], e["y"] - s["y"]
+        box = trimesh.creation.box(extents=[np.hypot(dx, dy), wall["thickness"], wall["height"]])
+        transform = trimesh.transformations.translation_matrix([(s["x"] + e["x"]) / 2, (s["y"] + e["y"]) / 2, wall["height"] / 2])
+        rotation = trimesh.transformations.rotation_matrix(np.arctan2(dy, dx), [0, 0, 1])
+        box.apply_transform(trimesh.transformations.concatenate_matrices(transform, rotation))
+        scene.add_geometry(box)
+    return scene
+
+
+def timed(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(count: int, mesh_count: int, runs: int):
+    elements = synthetic_elements(count)
+    scale = {"pixels_per_mm": 0.25}
+    stage5, stage6 = Stage5GeometryGenerator(), Stage6BIMEnrichment()
+
+    dict_s = timed(lambda: dict_path(elements, scale["pixels_per_mm"], stage5), runs)
+    array_s = timed(lambda: asyncio.run(stage5.build(elements, scale)), runs)
+    print(f"elements:                   {count}")
+    print(f"stage 5, per-element dicts: {dict_s * 1000:.0f} ms")
+    print(f"stage 5, record arrays:     {array_s * 1000:.0f} ms  ({dict_s / array_s:.1f}x)")
+
+    model = asyncio.run(stage5.build(elements, scale))
+    legacy = model.to_dict()
+    from_dicts = timed(lambda: asyncio.run(stage6.generate(legacy, "bench")), 1)
+    from_model = timed(lambda: asyncio.run(stage6.generate(model, "bench")), 1)
+    print(f"stage 6, dict input:        {from_dicts * 1000:.0f} ms")
+    print(f"stage 6, from arrays:       {from_model * 1000:.0f} ms  ({from_dicts / from_model:.1f}x)")
+
+    walls = legacy["walls"][:mesh_count]
+    rows = model.walls[:mesh_count]
+    per_wall = timed(lambda: dict_wall_meshes(walls), 1)
+
+    def batched():
+        start, end = rows["start"][:, :2], rows["end"][:, :2]
+        length = np.hypot(*(end - start).T)
+        oriented_boxes((start + end) / 2, (end - start) / np.maximum(length, 1e-9)[:, None], length,
+                       rows["thickness"], rows["height"])
+    batched_s = timed(batched, runs)
+    print(f"glTF walls ({len(walls)}), per wall:   {per_wall * 1000:.0f} ms")
+    print(f"glTF walls ({len(walls)}), one mesh:   {batched_s * 1000:.0f} ms  ({per_wall / batched_s:.0f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--mesh-count", type=int, default=10_000, help="Walls meshed in the glTF comparison")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    run(args.elements, args.mesh_count, args.runs)
+
+
+if __name__ == "__main__":
+    main()
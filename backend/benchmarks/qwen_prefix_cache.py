@@ -0,0 +1,103 @@
+"""
+Qwen Prefix Cache Benchmark: Stage 4 prefill latency with and without KV reuse of the static prompt
+
+Runs the local model on CPU, prefill only (one new token per call):
+    python -m backend.benchmarks.qwen_prefix_cache --runs 5
+    python -m backend.benchmarks.qwen_prefix_cache --image plan.png
+"""
+
+import argparse
+import asyncio
+import statistics
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from backend.service.semantic.qwen_service import qwen_service
+from backend.services.stage4_local_qwen import Stage4LocalQwenAnalyzer
+
+
+def synthetic_plan(rooms_x: int = 4, rooms_y: int = 3, room_px: int = 400) -> np.ndarray:
+    """A grid of rectangular rooms with door gaps, drawn like a scanned plan"""
+    h, w = rooms_y * room_px + 200, rooms_x * room_px + 200
+    image = np.full((h, w, 3), 255, dtype=np.uint8)
+    for i in range(rooms_x + 1):
+        x = 100 + i * room_px
+        cv2.line(image, (x, 100), (x, h - 100), (0, 0, 0), 12)
+    for j in range(rooms_y + 1):
+        y = 100 + j * room_px
+        cv2.line(image, (100, y), (w - 100, y), (0, 0, 0), 12)
+    for i in range(rooms_x):
+        for j in range(rooms_y):
+            x, y = 100 + i * room_px + room_px // 2, 100 + j * room_px
+            cv2.line(image, (x - 45, y), (x + 45, y), (255, 255, 255), 14)
+    return image
+
+
+def synthetic_elements(image: np.ndarray, room_px: int = 400) -> dict:
+    h, w = image.shape[:2]
+    rooms = []
+    for j, y in enumerate(range(100, h - 100 - room_px + 1, room_px)):
+        for i, x in enumerate(range(100, w - 100 - room_px + 1, room_px)):
+            rooms.append({
+                "id": len(rooms),
+                "boundary": [[x, y], [x + room_px, y], [x + room_px, y + room_px], [x, y + room_px]],
+                "center": [x + room_px // 2, y + room_px // 2],
+                "bbox": [x, y, x + room_px, y + room_px],
+                "area_sqm": 16.0,
+                "resolved": False
+            })
+    return {
+        "walls": [{"id": i} for i in range(2 * len(rooms))],
+        "doors": [{"id": i} for i in range(len(rooms))],
+        "windows": [],
+        "rooms": rooms
+    }
+
+
+async def prefill(messages) -> tuple:
+    result = await qwen_service.generate(messages, max_new_tokens=1)
+    return result["prefill_s"], result["prompt_tokens"], result["cached_prefix_tokens"]
+
+
+async def run(image: np.ndarray, runs: int):
+    analyzer = Stage4LocalQwenAnalyzer()
+    image_data = {"image": image}
+    detected = synthetic_elements(image)
+    messages, views, _ = analyzer._build_request(image_data, detected, {"scale_string": "1:100"})
+    logger.info(f"Views: {', '.join(f'{v.size[0]}x{v.size[1]}' for v in views)}")
+
+    await qwen_service.ensure_loaded()
+    await prefill(messages)  # warm-up (allocator, thread pools)
+
+    qwen_service.prefix_cache_enabled = False
+    plain = [await prefill(messages) for _ in range(runs)]
+
+    qwen_service.prefix_cache_enabled = True
+    qwen_service._prefix_cache.clear()
+    cold = await prefill(messages)
+    reused = [await prefill(messages) for _ in range(runs)]
+
+    plain_s = statistics.median(p[0] for p in plain)
+    reused_s = statistics.median(r[0] for r in reused)
+    print(f"prompt tokens:              {plain[0][1]}")
+    print(f"cached prefix tokens:       {reused[0][2]}")
+    print(f"prefill, no reuse (median): {plain_s:.2f}s")
+    print(f"prefill, cold prefix:       {cold[0]:.2f}s")
+    print(f"prefill, reused (median):   {reused_s:.2f}s  ({100 * (1 - reused_s / plain_s):.0f}% less)")
+    qwen_service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Floor plan image (default: synthetic 4x3 room grid)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    image = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB) if args.image else synthetic_plan()
+    asyncio.run(run(image, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+Process-wide settings applied once at startup
+"""
+
+import os
+
+from loguru import logger
+
+
+def configure_torch_threads(model_count: int):
+    """
+    Size torch's intra-op thread pool. The pool is global to the process, so it is set
+    here once rather than from the detection path: DETECTION_INTRA_OP_THREADS if given,
+    otherwise the cores split between specialised models that run side by side.
+    A single model keeps torch's default.
+    """
+    threads = int(os.getenv("DETECTION_INTRA_OP_THREADS", 0))
+    if not threads and model_count > 1:
+        threads = max(1, (os.cpu_count() or 1) // model_count)
+    if not threads:
+        return
+
+    import torch
+    torch.set_num_threads(threads)
+    logger.info(f"torch intra-op threads: {threads} ({model_count} specialised detection models)")
@@ -3,15 +3,17 @@ Agentic AI Supervisor
 Monitors the pipeline and interprets user intent using Qwen2.5-VL
 """
 
-from services.stage4_local_qwen import Stage4LocalQwenAnalyzer
 from loguru import logger
 import json
 
+from backend.service.semantic.qwen_service import get_qwen_client
+
 class SystemSupervisor:
     """Autonomous agent that supervises the generation process"""
     
     def __init__(self):
-        self.qwen = Stage4LocalQwenAnalyzer()
+        # Same shared model as Stage 4 - never a second copy of the weights
+        self.qwen = get_qwen_client()
         
     async def interpret_user_intent(self, user_prompt: str, current_recipe: dict) -> dict:
         """
@@ -39,10 +41,17 @@ class SystemSupervisor:
         }}
         """
         
-        # In a real implementation, we would feed this to Qwen.
-        # For now, we simulate a logic-based response or lightweight LLM call.
+        try:
+            result = await self.qwen.generate(
+                [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+                max_new_tokens=512
+            )
+            text = result["text"].replace('```json', '').replace('```', '').strip()
+            return json.loads(text)
+        except Exception as e:
+            logger.warning(f"Supervisor could not get a usable response from Qwen ({e}) - using rules")
         
-        # Placeholder logic
+        # Rule-based fallback
         if "brick" in user_prompt.lower():
             return {
                 "action": "modify_all",
@@ -0,0 +1,204 @@
+"""
+Detection Service: Cross-job dynamic micro-batching for YOLO inference
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from loguru import logger
+
+
+class _InferenceRequest:
+    """One tile waiting for a forward pass"""
+
+    __slots__ = ("tile", "future", "enqueued_at")
+
+    def __init__(self, tile: Any, future: asyncio.Future, enqueued_at: float):
+        self.tile = tile
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class LatencyTracker:
+    """Rolling window of request latencies and batch sizes"""
+
+    def __init__(self, window: int = 2048):
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.started_at = time.monotonic()
+
+    def record_batch(self, size: int, latencies_ms: List[float]):
+        self.batches += 1
+        self.requests += size
+        self.batch_sizes.append(size)
+        self.latencies_ms.extend(latencies_ms)
+
+    def snapshot(self) -> Dict:
+        latencies = np.asarray(self.latencies_ms, dtype=np.float64)
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies.size else 0.0,
+            "throughput_per_s": self.requests / elapsed
+        }
+
+
+class DetectionService:
+    """
+    Shared inference queue for every in-flight job.
+    Tiles submitted for the same model and thresholds are collected until the batch
+    is full or the oldest tile hits its latency deadline, then run as one forward pass.
+    """
+
+    def __init__(self):
+        self.max_batch_size = int(os.getenv("DETECTION_MAX_BATCH", 8))
+        self.max_wait_s = float(os.getenv("DETECTION_MAX_WAIT_MS", 15)) / 1000.0
+        self.idle_timeout_s = float(os.getenv("DETECTION_WORKER_IDLE_S", 30))
+
+        # One queue + worker per (model, thresholds); different models run side by side
+        self._queues: Dict[Tuple, asyncio.Queue] = {}
+        self._workers: Dict[Tuple, asyncio.Task] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("DETECTION_INFERENCE_THREADS", 4)),
+            thread_name_prefix="yolo-infer"
+        )
+        self.metrics = LatencyTracker()
+
+    async def infer(self, model_key: str, model, tile: Any, conf: float, iou: float):
+        """
+        Queue one tile and wait for its result.
+
+        Args:
+            model_key: Logical model name ('all', 'wall', ...)
+            model: Loaded YOLO model
+            tile: Image (HWC ndarray) or preprocessed tensor (1xCxHxW)
+            conf: Confidence threshold
+            iou: NMS IoU threshold
+
+        Returns:
+            The ultralytics Results object for this tile
+        """
+        loop = asyncio.get_running_loop()
+        key = (model_key, id(model), conf, iou)
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[key] = queue
+            self._workers[key] = asyncio.create_task(self._worker(key, model, queue))
+
+        future = loop.create_future()
+        await queue.put(_InferenceRequest(tile, future, loop.time()))
+        return await future
+
+    async def _worker(self, key: Tuple, model, queue: asyncio.Queue):
+        """Form batches for one model until the queue stays idle"""
+        loop = asyncio.get_running_loop()
+        _, _, conf, iou = key
+        batch: List[_InferenceRequest] = []
+
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout_s)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        # No await between the check and the removal below, so no request can slip in
+                        return
+                    continue
+
+                batch = [first]
+                deadline = first.enqueued_at + self.max_wait_s
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        # Deadline passed: take whatever is already queued, but don't wait
+                        if queue.empty():
+                            break
+                        batch.append(queue.get_nowait())
+                        continue
+                    try:
+                        batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._run_batch(model, batch, conf, iou)
+                batch = []
+        except Exception as e:
+            logger.error(f"Detection worker for {key[0]!r} crashed: {e}")
+        finally:
+            # However the worker ends, unregister it (unless a newer one took the key) and fail
+            # whatever it still holds, so no caller waits on a worker that is gone
+            if self._workers.get(key) is asyncio.current_task():
+                self._queues.pop(key, None)
+                self._workers.pop(key, None)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            self._fail(batch, RuntimeError(f"Detection worker for {key[0]!r} stopped"))
+
+    async def _run_batch(self, model, batch: List[_InferenceRequest], conf: float, iou: float):
+        """Run one forward pass and route each result back to its caller"""
+        loop = asyncio.get_running_loop()
+        batch = [req for req in batch if not req.future.cancelled()]
+        if not batch:
+            return
+
+        try:
+            sources = self._stack_sources([req.tile for req in batch])
+            results = await loop.run_in_executor(
+                self._executor,
+                lambda: model.predict(sources, conf=conf, iou=iou, verbose=False)
+            )
+            if len(results) != len(batch):
+                raise RuntimeError(f"Model returned {len(results)} results for {len(batch)} tiles")
+        except Exception as e:
+            logger.error(f"Batched inference failed ({len(batch)} tiles): {e}")
+            self._fail(batch, e)
+            return
+
+        now = loop.time()
+        for req, result in zip(batch, results):
+            if not req.future.done():
+                req.future.set_result(result)
+        self.metrics.record_batch(len(batch), [(now - req.enqueued_at) * 1000.0 for req in batch])
+
+    @staticmethod
+    def _fail(batch: List[_InferenceRequest], error: Exception):
+        for req in batch:
+            if not req.future.done():
+                req.future.set_exception(error)
+
+    def _stack_sources(self, tiles: List[Any]):
+        """Ultralytics takes a list of images, or one BCHW tensor for preprocessed input"""
+        if len(tiles) > 1 and all(hasattr(t, "shape") and len(t.shape) == 4 for t in tiles):
+            import torch
+            return torch.cat(tiles, dim=0)
+        if len(tiles) == 1 and hasattr(tiles[0], "shape") and len(tiles[0].shape) == 4:
+            return tiles[0]
+        return tiles
+
+    def stats(self) -> Dict:
+        """Throughput and latency percentiles across all jobs"""
+        return {**self.metrics.snapshot(), "active_workers": len(self._workers)}
+
+    async def shutdown(self):
+        """Cancel workers and release inference threads"""
+        for task in self._workers.values():
+            task.cancel()
+        self._workers.clear()
+        self._queues.clear()
+        self._executor.shutdown(wait=False)
+
+
+# Global instance: one queue per model for all jobs, so their tiles share forward passes
+detection_service = DetectionService()
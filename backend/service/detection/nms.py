@@ -0,0 +1,60 @@
+"""
+Vectorised Non-Maximum Suppression over NumPy box arrays
+"""
+
+from typing import Optional
+
+import numpy as np
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU of one xyxy box against an Nx4 array"""
+    ix1 = np.maximum(box[0], boxes[:, 0])
+    iy1 = np.maximum(box[1], boxes[:, 1])
+    ix2 = np.minimum(box[2], boxes[:, 2])
+    iy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    classes: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Greedy NMS, vectorised over all remaining boxes at each step.
+
+    Args:
+        boxes: Nx4 xyxy boxes
+        scores: N confidences
+        iou_threshold: Boxes overlapping a kept box above this are dropped
+        classes: Optional N class ids; when given, only same-class boxes suppress each other
+
+    Returns:
+        Indices of kept boxes, highest score first
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = boxes.astype(np.float32, copy=False)
+    if classes is not None:
+        # Shift each class into its own coordinate range so classes never overlap
+        offset = classes.astype(np.float32)[:, None] * (boxes.max() + 1.0)
+        boxes = boxes + offset
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        order = rest[box_iou(boxes[i], boxes[rest]) <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
@@ -0,0 +1,53 @@
+"""
+Detection Preprocessing: one letterbox/normalise pass shared by every model
+"""
+
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+
+def letterbox(image: np.ndarray, imgsz: int = 640, stride: int = 32, pad_value: int = 114):
+    """
+    Resize and pad an RGB image to a stride-aligned square tensor.
+
+    Args:
+        image: HxWx3 uint8 RGB image
+        imgsz: Target size of the longer side
+        stride: Model stride; output dims are multiples of it
+        pad_value: Grey level used for padding (ultralytics default)
+
+    Returns:
+        (tensor 1x3xHxW float32 in [0, 1], ratio, (pad_x, pad_y))
+    """
+    import torch
+
+    h, w = image.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+
+    out_size = int(np.ceil(imgsz / stride) * stride)
+    pad_x = (out_size - new_w) // 2
+    pad_y = (out_size - new_h) // 2
+
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+    canvas = np.full((out_size, out_size, 3), pad_value, dtype=np.uint8)
+    interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+        image, (new_w, new_h), interpolation=interpolation
+    )
+
+    tensor = torch.from_numpy(np.ascontiguousarray(canvas.transpose(2, 0, 1))).float().div_(255.0)
+    return tensor.unsqueeze(0), ratio, (pad_x, pad_y)
+
+
+def unletterbox_boxes(boxes: np.ndarray, ratio: float, pad: Tuple[int, int]) -> np.ndarray:
+    """Map Nx4 xyxy boxes from letterboxed coordinates back to the source image"""
+    boxes = boxes.astype(np.float32, copy=True)
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= ratio
+    return boxes
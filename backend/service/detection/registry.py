@@ -0,0 +1,156 @@
+"""
+Model Registry: lazy, non-interactive loading of YOLO weights with warm-up and hot-swap
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+SPECIALIZED_TYPES = ['wall', 'door', 'window', 'column']
+MONOLITHIC_WEIGHTS = "yolov11_floorplan.pt"
+BASE_WEIGHTS = "yolov8n.pt"
+
+
+class ModelRegistry:
+    """
+    Holds the active detection models.
+    Loading happens in a background task (never at import time, never on input()),
+    and a reload builds and warms a complete new model set before swapping it in.
+    """
+
+    def __init__(self):
+        self.weights_dir = Path(os.getenv("YOLO_WEIGHTS_DIR", "ml/weights"))
+        self.allow_base_model = os.getenv("YOLO_ALLOW_BASE_MODEL", "false").lower() == "true"
+        self.imgsz = int(os.getenv("DETECTION_IMGSZ", 640))
+
+        self.state = "idle"  # idle -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.models: Dict = {}
+        self.versions: Dict[str, str] = {}
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+
+        self._load_task: Optional[asyncio.Task] = None
+        self._swap_lock = asyncio.Lock()
+
+    def specialised_model_count(self) -> int:
+        """How many specialised weights files are on disk (1 for the monolithic model)"""
+        return max(1, sum((self.weights_dir / f"{e_type}.pt").exists() for e_type in SPECIALIZED_TYPES))
+
+    def start_background_load(self):
+        """Kick off loading without blocking the caller (e.g. app startup)"""
+        if self._load_task is None or (self._load_task.done() and self.state == "failed"):
+            self._load_task = asyncio.create_task(self.reload())
+        return self._load_task
+
+    async def get_models(self) -> Dict:
+        """Return the active model set, loading it on first use"""
+        if self.state != "ready":
+            await self.start_background_load()
+        if self.state != "ready":
+            raise RuntimeError(f"Detection models unavailable: {self.error}")
+        return self.models
+
+    async def reload(self) -> Dict:
+        """
+        Load, warm up and atomically swap in the weights currently on disk.
+        Returns status() plus "reloaded": False if loading failed, in which case any
+        previously loaded models stay active.
+        """
+        async with self._swap_lock:
+            if self.state != "ready":
+                self.state = "loading"
+            started = time.monotonic()
+            try:
+                models, versions = await asyncio.to_thread(self._load_sync)
+                await asyncio.to_thread(self._warmup_sync, models)
+            except Exception as e:
+                logger.error(f"✗ Detection model load failed: {e}")
+                self.error = str(e)
+                if not self.models:
+                    self.state = "failed"
+                return {**self.status(), "reloaded": False}
+
+            # Single reference swap: in-flight jobs keep the set they already hold
+            self.models = models
+            self.versions = versions
+            self.state = "ready"
+            self.error = None
+            self.loaded_at = time.time()
+            self.load_seconds = time.monotonic() - started
+            logger.success(f"✓ Detection models ready: {', '.join(models)} ({self.load_seconds:.1f}s)")
+            return {**self.status(), "reloaded": True}
+
+    def status(self) -> Dict:
+        """Readiness state for health checks"""
+        return {
+            "state": self.state,
+            "models": list(self.models.keys()),
+            "versions": self.versions,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "error": self.error
+        }
+
+    def _load_sync(self):
+        """Resolve which weights to use and load them (runs in a worker thread)"""
+        import torch
+        from ultralytics import YOLO
+        from ultralytics.nn.tasks import DetectionModel
+
+        torch.serialization.add_safe_globals([DetectionModel])
+        logger.info(f"YOLOv11_model_path_directory: {self.weights_dir}")
+
+        paths = {
+            e_type: self.weights_dir / f"{e_type}.pt"
+            for e_type in SPECIALIZED_TYPES
+            if (self.weights_dir / f"{e_type}.pt").exists()
+        }
+
+        if not paths:
+            model_path = self.weights_dir / MONOLITHIC_WEIGHTS
+            if model_path.is_file():
+                paths = {'all': model_path}
+            elif self.allow_base_model:
+                logger.warning(f"✗ {MONOLITHIC_WEIGHTS} not found - using base {BASE_WEIGHTS} (UNTRAINED - testing only)")
+                paths = {'all': Path(BASE_WEIGHTS)}
+            else:
+                self.weights_dir.mkdir(parents=True, exist_ok=True)
+                raise FileNotFoundError(
+                    f"No weights in {self.weights_dir}: train the model and copy best.pt to "
+                    f"{model_path}, or set YOLO_ALLOW_BASE_MODEL=true for testing"
+                )
+
+        models, versions = {}, {}
+        for key, path in paths.items():
+            logger.info(f"Loading {key} model: {path}")
+            models[key] = YOLO(str(path))
+            versions[key] = self._weights_version(path)
+
+        return models, versions
+
+    def _warmup_sync(self, models: Dict):
+        """One dummy inference per model so the first real job doesn't pay for lazy init"""
+        blank = np.full((self.imgsz, self.imgsz, 3), 255, dtype=np.uint8)
+        for key, model in models.items():
+            model.predict(blank, verbose=False)
+            logger.debug(f"Warmed up {key} model")
+
+    @staticmethod
+    def _weights_version(path: Path) -> str:
+        """Cheap identity for a weights file: name, size and mtime"""
+        if not path.exists():
+            return path.name
+        stat = path.stat()
+        digest = hashlib.sha1(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        return digest[:12]
+
+
+# Global instance: each model is loaded once per process
+model_registry = ModelRegistry()
@@ -0,0 +1,198 @@
+"""
+Detection Table: columnar, array-backed store for detected elements
+"""
+
+import os
+from typing import Dict, List
+
+import numpy as np
+
+# Index == YOLO class id of the monolithic model
+ELEMENT_TYPES = ("wall", "door", "window", "stair", "room", "fixture", "column")
+TYPE_CODES = {name: code for code, name in enumerate(ELEMENT_TYPES)}
+
+DEFAULT_WALL_THICKNESS_MM = 200.0
+EXTERIOR_WALL_THICKNESS_MM = float(os.getenv("EXTERIOR_WALL_THICKNESS_MM", 200))
+DOUBLE_DOOR_WIDTH = 1800
+
+
+class DetectionTable:
+    """
+    One NumPy array per attribute, one row per detected box.
+    Type-specific features are computed for every row at once; rows of other
+    types simply ignore them. Dicts are only built at the stage boundary.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["type"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __setitem__(self, name: str, values: np.ndarray):
+        self.columns[name] = values
+
+    @classmethod
+    def from_boxes(
+        cls,
+        boxes: np.ndarray,
+        confidence: np.ndarray,
+        type_codes: np.ndarray,
+        pixels_per_mm: float
+    ) -> "DetectionTable":
+        """
+        Build a table from raw detector output.
+
+        Args:
+            boxes: Nx4 xyxy boxes in image pixels
+            confidence: N scores
+            type_codes: N indices into ELEMENT_TYPES (rows outside the range are dropped)
+            pixels_per_mm: Scale calibration from Stage 2
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        confidence = np.asarray(confidence, dtype=np.float32).reshape(-1)
+        type_codes = np.asarray(type_codes, dtype=np.int64).reshape(-1)
+
+        valid = (type_codes >= 0) & (type_codes < len(ELEMENT_TYPES))
+        boxes, confidence, type_codes = boxes[valid], confidence[valid], type_codes[valid]
+
+        # Stable per-type ids: running index within each type, in detection order
+        order = np.argsort(type_codes, kind="stable")
+        sorted_codes = type_codes[order]
+        starts = np.searchsorted(sorted_codes, sorted_codes, side="left")
+        ids = np.empty(len(type_codes), dtype=np.int32)
+        ids[order] = np.arange(len(type_codes)) - starts
+
+        wh = boxes[:, 2:] - boxes[:, :2]
+        table = cls({
+            "type": type_codes.astype(np.int8),
+            "id": ids,
+            "confidence": confidence,
+            "bbox": boxes,
+            "center": (boxes[:, :2] + boxes[:, 2:]) / 2,
+            "width_mm": wh[:, 0] / pixels_per_mm,
+            "height_mm": wh[:, 1] / pixels_per_mm
+        })
+        table._compute_features()
+        return table
+
+    def mask(self, element_type: str) -> np.ndarray:
+        """Boolean row mask for one element type"""
+        return self.columns["type"] == TYPE_CODES[element_type]
+
+    def _compute_features(self):
+        """Type-specific features for every row in one pass"""
+        x1, y1, x2, y2 = self.columns["bbox"].T
+        width_px = x2 - x1
+        height_px = y2 - y1
+        n = len(x1)
+
+        # Walls: centerline runs along the long side of the box
+        thickness = np.full(n, DEFAULT_WALL_THICKNESS_MM, dtype=np.float32)
+        cx = (x1 + x2) / 2
+        cy = (y1 + y2) / 2
+        horizontal = (width_px >= height_px)[:, None]
+        self.columns["thickness"] = thickness
+        # True once the thickness comes from the image rather than the default
+        self.columns["measured"] = np.zeros(n, dtype=bool)
+        self.columns["exterior"] = thickness > EXTERIOR_WALL_THICKNESS_MM
+        self.columns["endpoints"] = np.stack([
+            np.where(horizontal, np.stack([x1, cy], axis=1), np.stack([cx, y1], axis=1)),
+            np.where(horizontal, np.stack([x2, cy], axis=1), np.stack([cx, y2], axis=1))
+        ], axis=1)
+        # Wall graph node at each end (-1 until the graph is built)
+        self.columns["nodes"] = np.full((n, 2), -1, dtype=np.int64)
+
+        # Doors and windows: host wall id (-1 = unresolved) and insertion point on its centerline
+        self.columns["host_wall"] = np.full(n, -1, dtype=np.int64)
+        self.columns["insertion"] = self.columns["center"].copy()
+
+        # Doors
+        self.columns["double_door"] = (np.trunc(x2) - np.trunc(x1)) > DOUBLE_DOOR_WIDTH
+
+        # Columns
+        aspect = np.divide(width_px, height_px, out=np.ones_like(width_px), where=height_px > 0)
+        self.columns["circular"] = (aspect > 0.9) & (aspect < 1.1)
+
+    def set_wall_thickness(self, rows: np.ndarray, thickness_mm: np.ndarray):
+        """Overwrite the default thickness with measured values (0 = not measured) and reclassify"""
+        rows = np.flatnonzero(rows)
+        measured = thickness_mm > 0
+        self.columns["thickness"][rows[measured]] = thickness_mm[measured]
+        self.columns["measured"][rows[measured]] = True
+        self.columns["exterior"] = self.columns["thickness"] > EXTERIOR_WALL_THICKNESS_MM
+
+    def to_elements(self) -> Dict[str, List[Dict]]:
+        """Convert to the per-type lists of dicts the later stages consume"""
+        elements = {f"{name}s": [] for name in ELEMENT_TYPES}
+        if len(self) == 0:
+            return elements
+
+        c = self.columns
+        # Bulk-convert to Python scalars once instead of per element
+        types = c["type"].tolist()
+        ids = c["id"].tolist()
+        conf = c["confidence"].tolist()
+        bbox = np.trunc(c["bbox"]).astype(np.int64).tolist()
+        center = np.trunc(c["center"]).astype(np.int64).tolist()
+        width_mm = c["width_mm"].tolist()
+        height_mm = c["height_mm"].tolist()
+        thickness = c["thickness"].tolist()
+        measured = c["measured"].tolist()
+        exterior = c["exterior"].tolist()
+        endpoints = np.trunc(c["endpoints"]).astype(np.int64).tolist()
+        nodes = c["nodes"].tolist()
+        host_wall = c["host_wall"].tolist()
+        insertion = np.trunc(c["insertion"]).astype(np.int64).tolist()
+        double_door = c["double_door"].tolist()
+        circular = c["circular"].tolist()
+
+        for i, code in enumerate(types):
+            element_type = ELEMENT_TYPES[code]
+            element = {
+                "id": ids[i],
+                "type": element_type,
+                "bbox": bbox[i],
+                "confidence": conf[i],
+                "center": center[i],
+                "dimensions": {
+                    "width_mm": width_mm[i],
+                    "height_mm": height_mm[i]
+                }
+            }
+
+            if element_type == "wall":
+                element.update({
+                    "thickness": thickness[i],
+                    "thickness_measured": measured[i],
+                    "wall_function": "exterior" if exterior[i] else "interior",
+                    "endpoints": endpoints[i],
+                    "nodes": nodes[i]
+                })
+            elif element_type == "door":
+                element.update({
+                    "door_type": "double" if double_door[i] else "single",
+                    "swing_direction": "right",
+                    "width": bbox[i][2] - bbox[i][0],
+                    "host_wall_id": host_wall[i] if host_wall[i] >= 0 else None,
+                    "insertion_point": insertion[i]
+                })
+            elif element_type == "window":
+                element.update({
+                    "window_type": "fixed",
+                    "has_sill": True,
+                    "host_wall_id": host_wall[i] if host_wall[i] >= 0 else None,
+                    "insertion_point": insertion[i]
+                })
+            elif element_type == "column":
+                element.update({
+                    "column_shape": "circular" if circular[i] else "rectangular",
+                    "material": "Concrete"
+                })
+
+            elements[f"{element_type}s"].append(element)
+
+        return elements
@@ -0,0 +1,204 @@
+"""
+Tile Detection Cache: reuse boxes for inference tiles that haven't changed between revisions
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+TileBoxes = Tuple[np.ndarray, np.ndarray, np.ndarray]  # boxes (Nx4, tile coords), scores, type codes
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: int) -> np.ndarray:
+    """
+    Fixed, origin-anchored tile grid.
+    Anchoring at (0, 0) means an unchanged region of a revised sheet lands in
+    byte-identical tiles, so its hash (and cached boxes) carry over.
+
+    Returns:
+        Tx4 array of x0, y0, x1, y1
+    """
+    if tile_size <= 0 or (height <= tile_size and width <= tile_size):
+        return np.array([[0, 0, width, height]], dtype=np.int64)
+
+    step = max(tile_size - overlap, 1)
+    xs = np.arange(0, max(width - overlap, 1), step)
+    ys = np.arange(0, max(height - overlap, 1), step)
+    x0, y0 = np.meshgrid(xs, ys)
+    x0, y0 = x0.ravel(), y0.ravel()
+    return np.stack([
+        x0, y0,
+        np.minimum(x0 + tile_size, width),
+        np.minimum(y0 + tile_size, height)
+    ], axis=1).astype(np.int64)
+
+
+class TileDetectionCache:
+    """
+    Exact-hash cache of per-tile detections.
+    Keys cover the tile pixels plus the model versions and thresholds, so new
+    weights or settings never reuse stale boxes. In-memory LRU in front of an
+    optional on-disk store that survives restarts (revisions arrive days apart);
+    the disk store is an LRU too, bounded in bytes.
+
+    Hashing and disk access block, so callers on the event loop go through
+    lookup() / store() in a worker thread; a lock keeps both LRUs consistent.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("DETECTION_CACHE_MAX_ENTRIES", 20000))
+        self.max_disk_bytes = int(float(os.getenv("DETECTION_CACHE_MAX_DISK_MB", 1024)) * 2 ** 20)
+        cache_dir = os.getenv("DETECTION_CACHE_DIR", "data/cache/detections")
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.enabled = os.getenv("ENABLE_DETECTION_CACHE", "true").lower() == "true"
+        self._memory: "OrderedDict[str, TileBoxes]" = OrderedDict()
+        # Disk entries (key -> bytes), least recently used first; scanned on first use
+        self._disk: "Optional[OrderedDict[str, int]]" = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        # Running mean cost of one tile inference, used to estimate time saved by hits
+        self.mean_tile_seconds = 0.0
+
+    def record_inference(self, seconds: float):
+        if self.mean_tile_seconds == 0.0:
+            self.mean_tile_seconds = seconds
+        else:
+            self.mean_tile_seconds = 0.9 * self.mean_tile_seconds + 0.1 * seconds
+
+    def key(self, tile: np.ndarray, signature: str) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(signature.encode())
+        h.update(str(tile.shape).encode())
+        h.update(np.ascontiguousarray(tile).data)
+        return h.hexdigest()
+
+    def lookup(self, tiles: List[np.ndarray], signature: str) -> Tuple[List[str], List[Optional[TileBoxes]]]:
+        """Keys and cached boxes (None = miss) for a batch of tiles"""
+        keys = [self.key(tile, signature) for tile in tiles]
+        return keys, [self.get(key) for key in keys]
+
+    def store(self, keys: List[str], entries: List[TileBoxes]):
+        for key, entry in zip(keys, entries):
+            self.put(key, entry)
+
+    def get(self, key: str) -> Optional[TileBoxes]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                if self._disk is not None and key in self._disk:
+                    self._disk.move_to_end(key)
+                return entry
+
+        path = self._path(key)
+        if path is not None and path.exists():
+            try:
+                with np.load(path) as data:
+                    entry = (data["boxes"], data["scores"], data["codes"])
+                # mtime carries the LRU order across restarts
+                os.utime(path)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable detection cache entry {path.name}: {e}")
+                return None
+            with self._lock:
+                disk = self._disk_index()
+                if key in disk:
+                    disk.move_to_end(key)
+                self._remember(key, entry)
+            return entry
+
+        return None
+
+    def put(self, key: str, entry: TileBoxes):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remember(key, entry)
+
+        path = self._path(key)
+        if path is not None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                boxes, scores, codes = entry
+                np.savez(path, boxes=boxes, scores=scores, codes=codes)
+                size = path.stat().st_size
+            except OSError as e:
+                logger.warning(f"Could not persist detection cache entry: {e}")
+                return
+            with self._lock:
+                self._track_disk(key, size)
+
+    def _remember(self, key: str, entry: TileBoxes):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_index(self) -> "OrderedDict[str, int]":
+        """Entries already on disk, oldest access first (caller holds the lock)"""
+        if self._disk is None:
+            files = []
+            if self.cache_dir is not None and self.cache_dir.exists():
+                for path in self.cache_dir.glob("*/*.npz"):
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, path.stem, stat.st_size))
+            files.sort()
+            self._disk = OrderedDict((key, size) for _, key, size in files)
+            self._disk_bytes = sum(size for _, _, size in files)
+        return self._disk
+
+    def _track_disk(self, key: str, size: int):
+        """Record a written entry and evict least recently used files over the byte limit"""
+        disk = self._disk_index()
+        self._disk_bytes += size - disk.pop(key, 0)
+        disk[key] = size
+        evicted = 0
+        while self._disk_bytes > self.max_disk_bytes and len(disk) > 1:
+            old_key, old_size = disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            self._path(old_key).unlink(missing_ok=True)
+            evicted += 1
+        if evicted:
+            logger.debug(f"Detection cache: evicted {evicted} tile entries from disk")
+
+    def _path(self, key: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+
+class TileCacheStats:
+    """Per-job hit/miss accounting"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.inference_seconds = 0.0
+
+    def as_dict(self, mean_tile_seconds: float = 0.0) -> dict:
+        total = self.hits + self.misses
+        per_tile = self.inference_seconds / self.misses if self.misses else mean_tile_seconds
+        return {
+            "tiles": total,
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            # Estimated from this job's per-tile inference cost (or the running mean if all hit)
+            "time_saved_s": self.hits * per_tile
+        }
+
+
+# Global instance: every job reads and fills the same cache
+tile_cache = TileDetectionCache()
@@ -6,28 +6,44 @@ import numpy as np
 from typing import Dict, List, Any
 from loguru import logger
 
+from backend.service.geometry.transforms import PageFrames, apply_affine, apply_affine_boxes
+
 class SpatialAlignmentEngine:
     """Ensures alignment between vector (PDF points) and raster (Pixels) space"""
     
     def __init__(self):
-        self.dpi = 72 # Default PDF DPI
-        self.scale_factor = 1.0
+        self.frames = PageFrames()  # Default PDF DPI, unrotated
+
+    @property
+    def dpi(self) -> float:
+        return self.frames.dpi
+
+    @property
+    def scale_factor(self) -> float:
+        return self.frames.pixels_per_point
 
     def set_dpi(self, dpi: int):
-        self.dpi = dpi
-        self.scale_factor = dpi / 72.0
+        self.frames = PageFrames(dpi / 72.0, self.frames.rotation)
+
+    def set_frames(self, frames: PageFrames):
+        """Use the page's full transform chain (DPI and rotation)"""
+        self.frames = frames
 
     def pixel_to_point(self, pixel_coords):
-        """Convert [x, y] pixels to PDF points"""
-        return [c / self.scale_factor for c in pixel_coords]
+        """Convert [x, y] pixels (or an (N, 2) array) to PDF points"""
+        return apply_affine(self.frames.px_to_pt, pixel_coords).tolist()
 
     def point_to_pixel(self, point_coords):
-        """Convert [x, y] points to pixels"""
-        return [c * self.scale_factor for c in point_coords]
+        """Convert [x, y] points (or an (N, 2) array) to pixels"""
+        return apply_affine(self.frames.pt_to_px, point_coords).tolist()
     
     def bbox_pixel_to_point(self, bbox):
         """Convert [x1, y1, x2, y2] pixels to PDF points"""
-        return [c / self.scale_factor for c in bbox]
+        return self.bboxes_pixel_to_point([bbox])[0].tolist()
+
+    def bboxes_pixel_to_point(self, bboxes) -> np.ndarray:
+        """Convert (N, 4) pixel boxes to PDF points in one operation"""
+        return apply_affine_boxes(self.frames.px_to_pt, bboxes)
 
 
 class HybridFusionPipeline:
@@ -40,8 +56,7 @@ class HybridFusionPipeline:
         """
         Main fusion entry point
         """
-        dpi = metadata.get("dpi", 72)
-        self.aligner.set_dpi(dpi)
+        self.aligner.set_frames(PageFrames.from_image_data(metadata))
         
         logger.info(f"Fusing {len(vector_data['paths'])} vectors with {len(ml_detections)} ML detections")
         
@@ -61,16 +76,18 @@ class HybridFusionPipeline:
 
     def _normalize_detections(self, detections):
         """Convert all ML pixel coordinates to PDF point coordinates"""
-        normalized = []
-        for det in detections:
-            # Assume det['bbox'] is [x1, y1, x2, y2] in pixels
-            bbox_points = self.aligner.bbox_pixel_to_point(det['bbox'])
-            normalized.append({
+        if not detections:
+            return []
+        # det['bbox'] is [x1, y1, x2, y2] in pixels; convert all of them at once
+        bboxes = self.aligner.bboxes_pixel_to_point([det['bbox'] for det in detections]).tolist()
+        return [
+            {
                 "type": det['type'], # wall, door, etc.
                 "confidence": det['confidence'],
                 "bbox": bbox_points
-            })
-        return normalized
+            }
+            for det, bbox_points in zip(detections, bboxes)
+        ]
 
     def _refine_with_vectors(self, detections, vector_data):
         """
@@ -0,0 +1,167 @@
+"""
+Host Walls: resolve the wall every door and window sits in, for all openings at once
+"""
+
+from typing import Tuple
+
+import numpy as np
+from loguru import logger
+
+
+def _expand_ranges(c0: np.ndarray, c1: np.ndarray):
+    """
+    Enumerate every cell of each inclusive (x0, y0)-(x1, y1) cell range.
+
+    Returns:
+        item index, cell x, cell y - one row per covered cell
+    """
+    nx = c1[:, 0] - c0[:, 0] + 1
+    ny = c1[:, 1] - c0[:, 1] + 1
+    counts = nx * ny
+    item = np.repeat(np.arange(len(c0)), counts)
+    local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return item, c0[item, 0] + local % nx[item], c0[item, 1] + local // nx[item]
+
+
+class SegmentGrid:
+    """
+    Uniform grid hash over line segments.
+    Each segment is registered in every cell its padded bbox touches; the
+    (cell, segment) table is sorted by cell so a query is a pair of searchsorted calls.
+    """
+
+    def __init__(self, p0: np.ndarray, p1: np.ndarray, cell_size: float, pad: float = 0.0):
+        self.cell_size = float(cell_size)
+        self.count = len(p0)
+        lo = np.floor((np.minimum(p0, p1) - pad) / self.cell_size).astype(np.int64)
+        hi = np.floor((np.maximum(p0, p1) + pad) / self.cell_size).astype(np.int64)
+        self.origin = lo.min(axis=0)
+        self.shape = hi.max(axis=0) - self.origin + 1  # cells in x, y
+
+        segment, cx, cy = _expand_ranges(lo - self.origin, hi - self.origin)
+        keys = cy * self.shape[0] + cx
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.segments = segment[order]
+
+    def candidates(self, lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segments sharing a cell with each query box.
+
+        Args:
+            lo, hi: (M, 2) query box corners
+
+        Returns:
+            Unique (query index, segment index) pairs
+        """
+        c0 = np.floor(lo / self.cell_size).astype(np.int64) - self.origin
+        c1 = np.floor(hi / self.cell_size).astype(np.int64) - self.origin
+        inside = np.all((c1 >= 0) & (c0 < self.shape), axis=1)
+        query = np.flatnonzero(inside)
+        c0 = np.clip(c0[inside], 0, self.shape - 1)
+        c1 = np.clip(c1[inside], 0, self.shape - 1)
+
+        item, cx, cy = _expand_ranges(c0, c1)
+        keys = cy * self.shape[0] + cx
+        start = np.searchsorted(self.keys, keys, side="left")
+        counts = np.searchsorted(self.keys, keys, side="right") - start
+
+        q = np.repeat(query[item], counts)
+        offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        s = self.segments[np.repeat(start, counts) + offsets]
+
+        # A long wall shares several cells with one opening
+        pairs = np.unique(q * self.count + s)
+        return pairs // self.count, pairs % self.count
+
+
+def assign_host_walls(
+    opening_bboxes: np.ndarray,
+    wall_endpoints: np.ndarray,
+    search_radius: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pick the host wall of every opening.
+
+    Candidates are walls whose centerline comes within `search_radius` of the
+    opening bbox. Each is scored by how much of the opening's extent along the
+    wall its centerline covers, how close it passes to the box, and how well
+    the wall direction matches the opening's long axis.
+
+    Args:
+        opening_bboxes: (M, 4) xyxy door/window boxes in page pixels
+        wall_endpoints: (N, 2, 2) wall centerlines in page pixels (index == wall id)
+        search_radius: Maximum box-to-centerline gap in pixels
+
+    Returns:
+        host wall index per opening (-1 = none), (M, 2) insertion points on the
+        host centerline, and the score of the chosen host
+    """
+    boxes = np.asarray(opening_bboxes, dtype=np.float64).reshape(-1, 4)
+    m = len(boxes)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    host = np.full(m, -1, dtype=np.int64)
+    insertion = centers.copy()
+    best_score = np.zeros(m)
+
+    walls = np.asarray(wall_endpoints, dtype=np.float64).reshape(-1, 2, 2)
+    if m == 0 or len(walls) == 0:
+        return host, insertion.astype(np.float32), best_score
+
+    p0, p1 = walls[:, 0], walls[:, 1]
+    seg = p1 - p0
+    length = np.maximum(np.hypot(seg[:, 0], seg[:, 1]), 1e-9)
+    direction = seg / length[:, None]
+
+    # Cells about as big as a typical wall keep both the table and the candidate lists short
+    cell = max(float(np.median(length)), 2.0 * search_radius, 1.0)
+    grid = SegmentGrid(p0, p1, cell, pad=search_radius)
+    op, wall = grid.candidates(boxes[:, :2], boxes[:, 2:])
+    if len(op) == 0:
+        return host, insertion.astype(np.float32), best_score
+
+    # Projection of the opening centre onto each candidate centerline
+    rel = centers[op] - p0[wall]
+    along = (rel * direction[wall]).sum(axis=1)
+    t = np.clip(along / length[wall], 0.0, 1.0)
+    proj = p0[wall] + seg[wall] * t[:, None]
+    dist = np.hypot(*(centers[op] - proj).T)
+
+    # Overlap: share of the opening's extent along the wall that the centerline spans
+    half_w = (boxes[op, 2] - boxes[op, 0]) / 2
+    half_h = (boxes[op, 3] - boxes[op, 1]) / 2
+    ux, uy = np.abs(direction[wall]).T
+    half_extent = np.maximum(half_w * ux + half_h * uy, 1e-9)
+    covered = np.minimum(along + half_extent, length[wall]) - np.maximum(along - half_extent, 0.0)
+    overlap = np.clip(covered / (2 * half_extent), 0.0, 1.0)
+
+    # Orientation: only elongated boxes (windows, sliding doors) have a meaningful axis
+    long_x = half_w >= half_h
+    elongation = np.maximum(half_w, half_h) / np.maximum(np.minimum(half_w, half_h), 1e-9)
+    alignment = np.where(long_x, ux, uy)
+    alignment = np.where(elongation > 1.5, alignment, 1.0)
+
+    # Gap between the centerline and the box edge (door boxes include the swing, so
+    # their centre sits well off the wall even when the wall runs through the box)
+    half_across = half_w * uy + half_h * ux
+    gap = np.maximum(dist - half_across, 0.0)
+    proximity = 1.0 - np.minimum(gap / max(search_radius, 1e-9), 1.0)
+    score = (overlap + proximity) * alignment
+    valid = (gap <= search_radius) & (score > 0)
+    op, wall, score, proj, dist = op[valid], wall[valid], score[valid], proj[valid], dist[valid]
+
+    # Best candidate per opening. Every wall through the box has full proximity, so ties
+    # (face walls, duplicates) go to the centerline passing closest to the opening centre
+    order = np.lexsort((dist, -score, op))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = op[order][1:] != op[order][:-1]
+    pick = order[first]
+
+    host[op[pick]] = wall[pick]
+    insertion[op[pick]] = proj[pick]
+    best_score[op[pick]] = score[pick]
+
+    unhosted = int((host < 0).sum())
+    if unhosted:
+        logger.warning(f"{unhosted}/{m} openings have no wall within {search_radius:.0f}px")
+    return host, insertion.astype(np.float32), best_score
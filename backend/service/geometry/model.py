@@ -0,0 +1,499 @@
+"""
+Geometry Model: array-backed Stage 5 output, one NumPy record array per element type
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from backend.service.geometry.polygons import SlabBuffers, clean_rings, extrude_rings
+from backend.service.geometry.transforms import apply_affine
+from backend.service.geometry.wall_graph import WallGraph
+
+WALL_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("start", np.float64, 3),
+    ("end", np.float64, 3),
+    ("thickness", np.float64),
+    ("height", np.float64),
+    ("structural", np.bool_),
+    ("function", "U16"),
+    ("material", "U32"),
+    ("join_type", "U8", 2),          # per end (start, end); "" = joins not solved
+    ("trim", np.float64, (2, 2))     # [end, side]: face cut back (+) / extended (-) from the node
+])
+OPENING_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("location", np.float64, 3),
+    ("width", np.float64),
+    ("height", np.float64),
+    ("type_name", "U32"),
+    ("host_wall_id", np.int64),      # -1 = unhosted
+    ("swing_direction", "U16")
+])
+COLUMN_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("location", np.float64, 3),
+    ("width", np.float64),
+    ("depth", np.float64),
+    ("height", np.float64),
+    ("shape", "U16"),
+    ("material", "U32")
+])
+ROOM_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("center", np.float64, 3),
+    ("area_sqm", np.float64),
+    ("target_height", np.float64),
+    ("name", "U64"),
+    ("number", "U16"),               # "" = none
+    ("purpose", "U32"),
+    ("flooring", "U32")              # "" = none
+])
+# Slab outlines live in one shared (P, 2) point array; each slab is a run of it
+SLAB_DTYPE = np.dtype([
+    ("id", "U32"),
+    ("start", np.int64),
+    ("count", np.int64),
+    ("thickness", np.float64),
+    ("elevation", np.float64)
+])
+
+NO_ID = -1
+
+
+def _id(value, labels: Dict[Any, int]) -> int:
+    """
+    Integer ids are kept as they are; any other id (e.g. "W12") gets a code below NO_ID,
+    the same code wherever it appears (a door's host_wall_id too). `labels` maps it back.
+    """
+    if value is None:
+        return NO_ID
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return int(value)
+    return labels.setdefault(value, NO_ID - 1 - len(labels))
+
+
+def _ids(elements: List[Dict], labels: Dict[Any, int], key: str = "id") -> List[int]:
+    return [_id(e.get(key), labels) for e in elements]
+
+
+def _sized(dtype: np.dtype, **texts: List[str]) -> np.dtype:
+    """`dtype` with the named string fields widened to their longest value, so none is truncated"""
+    fields = []
+    for name in dtype.names:
+        base, shape = dtype[name].base, dtype[name].shape
+        values = texts.get(name)
+        if values:
+            base = np.dtype(f"U{max(base.itemsize // 4, max(map(len, values)))}")
+        fields.append((name, base, shape))
+    return np.dtype(fields)
+
+
+def _text(value, default: str = "") -> str:
+    return default if value is None else str(value)
+
+
+def _optional(values: List):
+    """Record-array sentinels back to None for the dict form"""
+    return [None if v == "" else v for v in values]
+
+
+class GeometryModel:
+    """
+    Stage 5 output as record arrays in model millimetres.
+    Positions are transformed once for the whole array (page pixels -> model mm via a
+    3x3 affine); Stage 6 and the exporters read the arrays directly, and `to_dict()`
+    gives the per-element dict form for JSON and older consumers.
+    """
+
+    def __init__(
+        self,
+        walls: np.ndarray,
+        doors: np.ndarray,
+        windows: np.ndarray,
+        columns: np.ndarray,
+        rooms: np.ndarray,
+        floors: np.ndarray,
+        ceilings: np.ndarray,
+        boundary_points: np.ndarray,
+        wall_graph: Optional[WallGraph] = None,
+        wall_joins: Optional[List[Dict]] = None,
+        metadata: Optional[Dict] = None,
+        id_labels: Optional[Dict[Any, int]] = None
+    ):
+        self.walls = walls
+        self.doors = doors
+        self.windows = windows
+        self.columns = columns
+        self.rooms = rooms
+        self.floors = floors
+        self.ceilings = ceilings
+        self.boundary_points = boundary_points
+        self.wall_graph = wall_graph
+        # Joins carried over from the dict form, when there is no graph to derive them from
+        self._wall_joins = wall_joins
+        self.metadata = metadata or {}
+        # Non-integer element ids by the code that stands in for them in the id columns
+        self.id_labels = {code: label for label, code in (id_labels or {}).items()}
+
+    @classmethod
+    def from_elements(
+        cls,
+        elements: Dict,
+        px_to_model: np.ndarray,
+        defaults: Dict[str, float],
+        wall_graph: Optional[WallGraph] = None
+    ) -> "GeometryModel":
+        """
+        Build from Stage 4 element dicts.
+
+        Args:
+            elements: walls / doors / windows / columns / rooms lists, positions in page pixels
+            px_to_model: 3x3 affine from page pixels to model millimetres
+            defaults: wall_height, wall_thickness, door_height, window_height, sill_height,
+                      floor_thickness
+            wall_graph: Stage 3 wall graph (walls indexed by id), for joins
+        """
+        labels: Dict[Any, int] = {}
+        walls = cls._walls(elements.get("walls", []), px_to_model, defaults, labels)
+        doors = cls._openings(elements.get("doors", []), px_to_model, defaults, "door", labels)
+        windows = cls._openings(elements.get("windows", []), px_to_model, defaults, "window", labels)
+        columns = cls._columns(elements.get("columns", []), px_to_model, defaults, labels)
+        rooms_2d = elements.get("rooms", [])
+        rooms = cls._rooms(rooms_2d, px_to_model, defaults, labels)
+        floors, ceilings, points = cls._slabs(rooms_2d, px_to_model, defaults)
+        return cls(walls, doors, windows, columns, rooms, floors, ceilings, points,
+                   wall_graph=wall_graph, metadata=elements.get("metadata", {}), id_labels=labels)
+
+    @staticmethod
+    def _walls(walls: List[Dict], px_to_model: np.ndarray, defaults: Dict, labels: Dict) -> np.ndarray:
+        functions = [_text(w.get("wall_function"), "Interior") for w in walls]
+        materials = [_text(w.get("material"), "Concrete") for w in walls]
+        records = np.zeros(len(walls), dtype=_sized(WALL_DTYPE, function=functions, material=materials))
+        if not walls:
+            return records
+        endpoints = np.array([w["endpoints"] for w in walls], dtype=np.float64).reshape(-1, 2, 2)
+        xy = apply_affine(px_to_model, endpoints)
+        records["start"][:, :2] = xy[:, 0]
+        records["end"][:, :2] = xy[:, 1]
+        records["id"] = _ids(walls, labels)
+        records["thickness"] = [w.get("thickness", defaults["wall_thickness"]) for w in walls]
+        records["height"] = [w.get("ceiling_height", defaults["wall_height"]) for w in walls]
+        records["structural"] = [bool(w.get("structural", False)) for w in walls]
+        records["function"] = functions
+        records["material"] = materials
+        return records
+
+    @staticmethod
+    def _openings(openings: List[Dict], px_to_model: np.ndarray, defaults: Dict, kind: str, labels: Dict) -> np.ndarray:
+        door = kind == "door"
+        type_names = [_text(o.get("door_type" if door else "window_type"), "Standard") for o in openings]
+        swings = [_text(o.get("swing_direction"), "Right") for o in openings] if door else []
+        records = np.zeros(len(openings), dtype=_sized(OPENING_DTYPE, type_name=type_names, swing_direction=swings))
+        if not openings:
+            return records
+        # Insertion point lies on the host wall centerline (Stage 3), the bbox centre otherwise
+        points = np.array([o.get("insertion_point", o["center"]) for o in openings], dtype=np.float64)
+        records["location"][:, :2] = apply_affine(px_to_model, points.reshape(-1, 2))
+        records["location"][:, 2] = 0 if door else defaults["sill_height"]
+        records["id"] = _ids(openings, labels)
+        records["width"] = [o.get("width", 900 if door else 1200) for o in openings]
+        records["height"] = [o.get("height", defaults["door_height" if door else "window_height"]) for o in openings]
+        records["type_name"] = type_names
+        records["host_wall_id"] = _ids(openings, labels, key="host_wall_id")
+        if door:
+            records["swing_direction"] = swings
+        return records
+
+    @staticmethod
+    def _columns(columns: List[Dict], px_to_model: np.ndarray, defaults: Dict, labels: Dict) -> np.ndarray:
+        shapes = [_text(c.get("column_shape"), "rectangular") for c in columns]
+        materials = [_text(c.get("material"), "Concrete") for c in columns]
+        records = np.zeros(len(columns), dtype=_sized(COLUMN_DTYPE, shape=shapes, material=materials))
+        if not columns:
+            return records
+        centers = np.array([c["center"] for c in columns], dtype=np.float64).reshape(-1, 2)
+        records["location"][:, :2] = apply_affine(px_to_model, centers)
+        records["id"] = _ids(columns, labels)
+        records["width"] = [c["dimensions"]["width_mm"] for c in columns]
+        # Height in 2D is depth in 3D for rectangular columns
+        records["depth"] = [c["dimensions"]["height_mm"] for c in columns]
+        records["height"] = defaults["wall_height"]
+        records["shape"] = shapes
+        records["material"] = materials
+        return records
+
+    @staticmethod
+    def _rooms(rooms: List[Dict], px_to_model: np.ndarray, defaults: Dict, labels: Dict) -> np.ndarray:
+        texts = {
+            "name": [_text(r.get("name"), "Unnamed Room") for r in rooms],
+            "number": [_text(r.get("number")) for r in rooms],
+            "purpose": [_text(r.get("purpose"), "General") for r in rooms],
+            "flooring": [_text(r.get("flooring")) for r in rooms]
+        }
+        records = np.zeros(len(rooms), dtype=_sized(ROOM_DTYPE, **texts))
+        if not rooms:
+            return records
+        centers = np.array([r["center"] for r in rooms], dtype=np.float64).reshape(-1, 2)
+        records["center"][:, :2] = apply_affine(px_to_model, centers)
+        records["id"] = _ids(rooms, labels)
+        records["area_sqm"] = [r.get("area_sqm", 0) for r in rooms]
+        records["target_height"] = [r.get("ceiling_height", defaults["wall_height"]) for r in rooms]
+        for name, values in texts.items():
+            records[name] = values
+        return records
+
+    @staticmethod
+    def _slabs(rooms: List[Dict], px_to_model: np.ndarray, defaults: Dict):
+        """
+        Floor and ceiling slab per room outline; both point into the same boundary array.
+        Outlines are simplified, untangled and wound counter-clockwise; rooms whose outline
+        has no area left get no slabs.
+        """
+        outlined = [(i, r) for i, r in enumerate(rooms) if "boundary" in r]
+        if not outlined:
+            return np.zeros(0, dtype=SLAB_DTYPE), np.zeros(0, dtype=SLAB_DTYPE), np.empty((0, 2), dtype=np.float64)
+
+        outlines = [np.asarray(r["boundary"], dtype=np.float64).reshape(-1, 2) for _, r in outlined]
+        counts = np.array([len(o) for o in outlines], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        points, starts, counts, keep = clean_rings(
+            apply_affine(px_to_model, np.concatenate(outlines)), starts, counts,
+            defaults.get("slab_simplify_mm", 0.0)
+        )
+        if not keep.all():
+            logger.warning(f"Dropped {int((~keep).sum())} degenerate room outlines")
+        outlined = [entry for entry, kept in zip(outlined, keep.tolist()) if kept]
+        floors = np.zeros(len(outlined), dtype=SLAB_DTYPE)
+        ceilings = np.zeros(len(outlined), dtype=SLAB_DTYPE)
+
+        for slabs, kind in ((floors, "floor"), (ceilings, "ceiling")):
+            slabs["id"] = [f"{kind}_{i}" for i, _ in outlined]
+            slabs["start"] = starts
+            slabs["count"] = counts
+        floors["thickness"] = defaults["floor_thickness"]
+        floors["elevation"] = 0
+        ceilings["thickness"] = 20
+        ceilings["elevation"] = [r.get("ceiling_height", defaults["wall_height"]) for _, r in outlined]
+        return floors, ceilings, points
+
+    def wall_joins(self, index: int) -> Optional[Dict]:
+        """Joins at both ends of the wall in row `index`; None if the model carries no joins"""
+        if self.wall_graph is not None:
+            wall_id = int(self.walls["id"][index])
+            joins = self.wall_graph.joins_for_wall(wall_id if wall_id >= 0 else index)
+        elif self._wall_joins is not None:
+            joins = self._wall_joins[index]
+        else:
+            return None
+
+        wall = self.walls[index]
+        if not wall["join_type"][0]:
+            return joins
+        # Solved cleanup (wall_joins.solve_wall_joins): how each end is cut, per face
+        return {
+            end: {**joins.get(end, {}), "type": str(wall["join_type"][e]), "trim": wall["trim"][e].tolist()}
+            for e, end in enumerate(("start", "end"))
+        }
+
+    def slab_outline(self, slabs: np.ndarray, index: int) -> np.ndarray:
+        start, count = int(slabs["start"][index]), int(slabs["count"][index])
+        return self.boundary_points[start:start + count]
+
+    def slab_buffers(self, slabs: np.ndarray, upward: bool = False) -> SlabBuffers:
+        """
+        Triangulated, extruded slabs as one vertex / index buffer. Floors hang below their
+        elevation; ceilings (`upward`) sit on it. Outlines from the dict form are cleaned first.
+        """
+        points, starts, counts, keep = clean_rings(self.boundary_points, slabs["start"], slabs["count"])
+        kept = slabs[keep]
+        elevation, thickness = kept["elevation"], kept["thickness"]
+        bottom = elevation if upward else elevation - thickness
+        return extrude_rings(points, starts, counts, bottom, bottom + thickness, slab=np.flatnonzero(keep))
+
+    def counts(self) -> Dict[str, int]:
+        return {name: len(getattr(self, name)) for name in
+                ("walls", "doors", "windows", "columns", "rooms", "floors", "ceilings")}
+
+    def to_dict(self) -> Dict:
+        """Per-element dict form (what Stage 5 used to return)"""
+        return {
+            "walls": self._wall_dicts(),
+            "doors": self._opening_dicts(self.doors, door=True),
+            "windows": self._opening_dicts(self.windows, door=False),
+            "rooms": self._room_dicts(),
+            "columns": self._column_dicts(),
+            "floors": self._slab_dicts(self.floors),
+            "ceilings": self._slab_dicts(self.ceilings),
+            "metadata": self.metadata
+        }
+
+    def _id_values(self, ids: np.ndarray) -> List:
+        """An id column back to element ids: None for NO_ID, the original for a coded non-integer id"""
+        return [None if v == NO_ID else self.id_labels.get(v, v) for v in ids.tolist()]
+
+    @staticmethod
+    def _points(xyz: np.ndarray) -> List[Dict]:
+        return [{"x": x, "y": y, "z": z} for x, y, z in xyz.tolist()]
+
+    def _wall_dicts(self) -> List[Dict]:
+        w = self.walls
+        starts, ends = self._points(w["start"]), self._points(w["end"])
+        columns = zip(self._id_values(w["id"]), starts, ends, w["thickness"].tolist(), w["height"].tolist(),
+                      w["material"].tolist(), w["structural"].tolist(), w["function"].tolist())
+        walls = []
+        for i, (wall_id, start, end, thickness, height, material, structural, function) in enumerate(columns):
+            wall = {
+                "id": wall_id,
+                "start_point": start,
+                "end_point": end,
+                "thickness": thickness,
+                "height": height,
+                "material": material,
+                "is_structural": structural,
+                "function": function
+            }
+            joins = self.wall_joins(i)
+            if joins is not None:
+                wall["joins"] = joins
+            walls.append(wall)
+        return walls
+
+    def _opening_dicts(self, o: np.ndarray, door: bool) -> List[Dict]:
+        columns = zip(self._id_values(o["id"]), self._points(o["location"]), o["width"].tolist(),
+                      o["height"].tolist(), o["type_name"].tolist(), self._id_values(o["host_wall_id"]),
+                      o["swing_direction"].tolist())
+        openings = []
+        for opening_id, location, width, height, type_name, host, swing in columns:
+            opening = {
+                "id": opening_id,
+                "location": location,
+                "width": width,
+                "height": height,
+                "type_name": type_name,
+                "host_wall_id": host
+            }
+            if door:
+                opening["swing_direction"] = swing
+            openings.append(opening)
+        return openings
+
+    def _column_dicts(self) -> List[Dict]:
+        c = self.columns
+        columns = zip(self._id_values(c["id"]), self._points(c["location"]), c["width"].tolist(),
+                      c["depth"].tolist(), c["height"].tolist(), c["shape"].tolist(), c["material"].tolist())
+        return [
+            {"id": column_id, "location": location, "width": width, "depth": depth,
+             "height": height, "shape": shape, "material": material}
+            for column_id, location, width, depth, height, shape, material in columns
+        ]
+
+    def _room_dicts(self) -> List[Dict]:
+        r = self.rooms
+        columns = zip(self._id_values(r["id"]), r["name"].tolist(), _optional(r["number"].tolist()),
+                      r["purpose"].tolist(), _optional(r["flooring"].tolist()), self._points(r["center"]),
+                      r["area_sqm"].tolist(), r["target_height"].tolist())
+        return [
+            {"id": room_id, "name": name, "number": number, "purpose": purpose, "flooring": flooring,
+             "center_point": center, "area_sqm": area, "target_height": height}
+            for room_id, name, number, purpose, flooring, center, area, height in columns
+        ]
+
+    def _slab_dicts(self, slabs: np.ndarray) -> List[Dict]:
+        points = self.boundary_points.tolist()
+        columns = zip(slabs["id"].tolist(), slabs["start"].tolist(), slabs["count"].tolist(),
+                      slabs["thickness"].tolist(), slabs["elevation"].tolist())
+        return [
+            {"id": slab_id, "boundary_points": [{"x": x, "y": y} for x, y in points[start:start + count]],
+             "thickness": thickness, "elevation": elevation}
+            for slab_id, start, count, thickness, elevation in columns
+        ]
+
+    @classmethod
+    def from_dict(cls, geometry: Dict) -> "GeometryModel":
+        """Back from the dict form (positions already in model mm)"""
+        def xyz(points: List[Dict]) -> np.ndarray:
+            return np.array([[p["x"], p["y"], p.get("z", 0)] for p in points], dtype=np.float64).reshape(-1, 3)
+
+        labels: Dict[Any, int] = {}
+        walls_2d = geometry.get("walls", [])
+        functions = [_text(w.get("function"), "Interior") for w in walls_2d]
+        materials = [_text(w.get("material"), "Concrete") for w in walls_2d]
+        walls = np.zeros(len(walls_2d), dtype=_sized(WALL_DTYPE, function=functions, material=materials))
+        if walls_2d:
+            walls["id"] = _ids(walls_2d, labels)
+            walls["start"] = xyz([w["start_point"] for w in walls_2d])
+            walls["end"] = xyz([w["end_point"] for w in walls_2d])
+            walls["thickness"] = [w["thickness"] for w in walls_2d]
+            walls["height"] = [w["height"] for w in walls_2d]
+            walls["structural"] = [bool(w.get("is_structural", False)) for w in walls_2d]
+            walls["function"] = functions
+            walls["material"] = materials
+        joins = [w.get("joins", {}) for w in walls_2d] if any("joins" in w for w in walls_2d) else None
+        if joins is not None and all(j.get(end, {}).get("type") for j in joins for end in ("start", "end")):
+            walls["join_type"] = [[j["start"]["type"], j["end"]["type"]] for j in joins]
+            walls["trim"] = [[j["start"].get("trim", [0, 0]), j["end"].get("trim", [0, 0])] for j in joins]
+
+        def openings(items: List[Dict]) -> np.ndarray:
+            type_names = [_text(o.get("type_name"), "Standard") for o in items]
+            swings = [_text(o.get("swing_direction")) for o in items]
+            records = np.zeros(len(items), dtype=_sized(OPENING_DTYPE, type_name=type_names, swing_direction=swings))
+            if items:
+                records["id"] = _ids(items, labels)
+                records["location"] = xyz([o["location"] for o in items])
+                records["width"] = [o.get("width", 900) for o in items]
+                records["height"] = [o.get("height", 2100) for o in items]
+                records["type_name"] = type_names
+                records["host_wall_id"] = _ids(items, labels, key="host_wall_id")
+                records["swing_direction"] = swings
+            return records
+
+        columns_2d = geometry.get("columns", [])
+        shapes = [_text(c.get("shape"), "rectangular") for c in columns_2d]
+        column_materials = [_text(c.get("material"), "Concrete") for c in columns_2d]
+        columns = np.zeros(len(columns_2d), dtype=_sized(COLUMN_DTYPE, shape=shapes, material=column_materials))
+        if columns_2d:
+            columns["id"] = _ids(columns_2d, labels)
+            columns["location"] = xyz([c["location"] for c in columns_2d])
+            columns["width"] = [c.get("width", 300) for c in columns_2d]
+            columns["depth"] = [c.get("depth", 300) for c in columns_2d]
+            columns["height"] = [c.get("height", 2800) for c in columns_2d]
+            columns["shape"] = shapes
+            columns["material"] = column_materials
+
+        rooms_2d = geometry.get("rooms", [])
+        room_texts = {
+            "name": [_text(r.get("name"), "Unnamed Room") for r in rooms_2d],
+            "number": [_text(r.get("number")) for r in rooms_2d],
+            "purpose": [_text(r.get("purpose"), "General") for r in rooms_2d],
+            "flooring": [_text(r.get("flooring")) for r in rooms_2d]
+        }
+        rooms = np.zeros(len(rooms_2d), dtype=_sized(ROOM_DTYPE, **room_texts))
+        if rooms_2d:
+            rooms["id"] = _ids(rooms_2d, labels)
+            rooms["center"] = xyz([r["center_point"] for r in rooms_2d])
+            rooms["area_sqm"] = [r.get("area_sqm", 0) for r in rooms_2d]
+            rooms["target_height"] = [r.get("target_height", 2800) for r in rooms_2d]
+            for name, values in room_texts.items():
+                rooms[name] = values
+
+        outlines: List[np.ndarray] = []
+
+        def slabs(items: List[Dict]) -> np.ndarray:
+            records = np.zeros(len(items), dtype=_sized(SLAB_DTYPE, id=[_text(slab.get("id")) for slab in items]))
+            offset = sum(len(o) for o in outlines)
+            for i, slab in enumerate(items):
+                outline = np.array([[p["x"], p["y"]] for p in slab["boundary_points"]], dtype=np.float64).reshape(-1, 2)
+                records[i] = (slab.get("id", ""), offset, len(outline), slab.get("thickness", 0), slab.get("elevation", 0))
+                outlines.append(outline)
+                offset += len(outline)
+            return records
+
+        floors = slabs(geometry.get("floors", []))
+        ceilings = slabs(geometry.get("ceilings", []))
+        points = np.concatenate(outlines) if outlines else np.empty((0, 2), dtype=np.float64)
+        return cls(walls, openings(geometry.get("doors", [])), openings(geometry.get("windows", [])), columns,
+                   rooms, floors, ceilings, points, wall_joins=joins, metadata=geometry.get("metadata", {}),
+                   id_labels=labels)
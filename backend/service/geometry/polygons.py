@@ -0,0 +1,348 @@
+"""
+Polygons: clean, triangulate and extrude slab outlines into batched vertex / index buffers
+"""
+
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+# Lengths in model mm: anything shorter is a duplicate point, any smaller cross product is collinear
+_EPS = 1e-6
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def signed_area(points: np.ndarray) -> float:
+    """Shoelace area, positive for counter-clockwise rings"""
+    return 0.5 * float(_cross(points, np.roll(points, -1, axis=0)).sum())
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker on a closed ring (OpenCV's approxPolyDP, as room segmentation uses).
+    Runs relative to the first vertex so float32 keeps sub-micron precision, and returns
+    the surviving input vertices unchanged.
+    """
+    if tolerance <= 0 or len(points) <= 4:
+        return points
+    relative = (points - points[0]).astype(np.float32)
+    kept = cv2.approxPolyDP(relative.reshape(-1, 1, 2), tolerance, True).reshape(-1, 2)
+    if len(kept) < 3:
+        return points
+    keep = (relative[:, None, :] == kept[None, :, :]).all(axis=2).any(axis=1)
+    return points[keep]
+
+
+def _untangle(points: np.ndarray, max_rounds: int = 64) -> np.ndarray:
+    """
+    Remove self-intersections by 2-opt: while two edges (i, i+1) and (j, j+1) cross,
+    reverse the run i+1..j. Every swap shortens the ring, so it ends with a simple polygon
+    on the same vertices; all edge pairs are tested at once per round.
+    """
+    n = len(points)
+    if n < 4:
+        return points
+    i, j = np.triu_indices(n, k=2)
+    pairs = ~((i == 0) & (j == n - 1))
+    i, j = i[pairs], j[pairs]
+    for _ in range(max_rounds):
+        crossing = np.flatnonzero(_edges_cross(points[i], points[(i + 1) % n], points[j], points[(j + 1) % n]))
+        if len(crossing) == 0:
+            return points
+        k = crossing[0]
+        points = points.copy()
+        points[i[k] + 1:j[k] + 1] = points[i[k] + 1:j[k] + 1][::-1]
+    logger.debug(f"Polygon of {n} vertices still self-intersecting after {max_rounds} rounds")
+    return points
+
+
+def _edges_cross(a0: np.ndarray, a1: np.ndarray, b0: np.ndarray, b1: np.ndarray) -> np.ndarray:
+    """Whether segments a and b properly cross (touching and collinear overlap don't count)"""
+    d1 = _cross(a1 - a0, b0 - a0)
+    d2 = _cross(a1 - a0, b1 - a0)
+    d3 = _cross(b1 - b0, a0 - b0)
+    d4 = _cross(b1 - b0, a1 - b0)
+    return (d1 * d2 < -_EPS) & (d3 * d4 < -_EPS)
+
+
+def _ring_index(counts: np.ndarray):
+    """Ring, start-of-ring and position within the ring of every packed vertex"""
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    ring = np.repeat(np.arange(len(counts)), counts)
+    return ring, starts, np.arange(int(counts.sum())) - starts[ring]
+
+
+def _drop_degenerate(points: np.ndarray, counts: np.ndarray):
+    """Remove repeated, then collinear vertices (a closing copy of the first point included) of every ring"""
+    while len(points):
+        ring, starts, local = _ring_index(counts)
+        prev = starts[ring] + (local - 1) % counts[ring]
+        nxt = starts[ring] + (local + 1) % counts[ring]
+        drop = np.hypot(*(points - points[prev]).T) <= _EPS
+        if not drop.any():
+            turn = _cross(points - points[prev], points[nxt] - points)
+            drop = np.abs(turn) <= _EPS * np.hypot(*(points[nxt] - points[prev]).T)
+            # Never strip a ring below a triangle here; area decides whether it survives
+            drop &= counts[ring] > 3
+        if not drop.any():
+            break
+        points, counts = points[~drop], np.bincount(ring[~drop], minlength=len(counts))
+    return points, counts
+
+
+def _self_intersecting(points: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Rings with at least one pair of crossing edges, all edge pairs of all rings tested at once"""
+    ring, starts, local = _ring_index(counts)
+    n = counts[ring]
+    # For each edge i, pair it with edges i+2 .. n-1 of the same ring (minus the closing neighbour)
+    partners = np.maximum(n - local - 2 - (local == 0), 0)
+    first = np.repeat(np.arange(len(points)), partners)
+    step = np.arange(int(partners.sum())) - np.repeat(np.cumsum(partners) - partners, partners)
+    second = first + 2 + step
+    nxt = lambda k: starts[ring[k]] + (local[k] + 1) % counts[ring[k]]  # noqa: E731
+    crossing = _edges_cross(points[first], points[nxt(first)], points[second], points[nxt(second)])
+    bad = np.zeros(len(counts), dtype=bool)
+    bad[ring[first[crossing]]] = True
+    return bad
+
+
+def clean_rings(
+    points: np.ndarray,
+    starts: np.ndarray,
+    counts: np.ndarray,
+    tolerance: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Slab-ready outlines from rings packed in one (P, 2) array: simplified, without repeated
+    or collinear vertices and self-intersections, counter-clockwise. Rings with no area
+    left are dropped. The checks run over all rings at once; only rings that need it are
+    simplified or untangled one by one.
+
+    Returns:
+        points, starts, counts of the cleaned rings, and which input rings survived
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    counts = np.asarray(counts, dtype=np.int64)
+    # Repack in case the rings share or skip points
+    points = np.concatenate([points[s:s + c] for s, c in zip(np.asarray(starts).tolist(), counts.tolist())]
+                            or [np.empty((0, 2))])
+    points, counts = _drop_degenerate(points, counts)
+
+    ring, starts, local = _ring_index(counts)
+    fix = _self_intersecting(points, counts)
+    if tolerance > 0:
+        # Only rings with a vertex within tolerance of its neighbours' chord have anything to simplify
+        prev = starts[ring] + (local - 1) % counts[ring]
+        nxt = starts[ring] + (local + 1) % counts[ring]
+        chord = points[nxt] - points[prev]
+        deviation = np.abs(_cross(chord, points - points[prev])) / np.maximum(np.hypot(*chord.T), _EPS)
+        fix[ring[deviation < tolerance]] |= counts[ring[deviation < tolerance]] > 4
+    if fix.any():
+        rings = [points[s:s + c] for s, c in zip(starts.tolist(), counts.tolist())]
+        for r in np.flatnonzero(fix).tolist():
+            rings[r] = _untangle(simplify(rings[r], tolerance))
+        counts = np.array([len(r) for r in rings], dtype=np.int64)
+        points, counts = _drop_degenerate(np.concatenate(rings), counts)
+        ring, starts, _ = _ring_index(counts)
+
+    # Winding: shoelace per ring, clockwise rings reversed in place
+    nxt = starts[ring] + (np.arange(len(points)) - starts[ring] + 1) % counts[ring]
+    area = 0.5 * np.bincount(ring, weights=_cross(points, points[nxt]), minlength=len(counts))
+    local = np.arange(len(points)) - starts[ring]
+    flipped = area[ring] < 0
+    order = np.where(flipped, starts[ring] + counts[ring] - 1 - local, np.arange(len(points)))
+    points = points[order]
+
+    keep = (counts >= 3) & (np.abs(area) > _EPS)
+    points = points[keep[ring]]
+    counts = counts[keep]
+    return points, _ring_index(counts)[1], counts, keep
+
+
+def clean_ring(points, tolerance: float = 0.0) -> np.ndarray:
+    """clean_rings for a single outline; empty if nothing with area is left"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    cleaned, _, _, _ = clean_rings(points, np.zeros(1, dtype=np.int64), np.array([len(points)]), tolerance)
+    return cleaned
+
+
+def _in_triangle(a: np.ndarray, b: np.ndarray, c: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """Whether each point q lies in (or on) the matching counter-clockwise triangle abc"""
+    return ((_cross(b - a, q - a) >= -_EPS)
+            & (_cross(c - b, q - b) >= -_EPS)
+            & (_cross(a - c, q - c) >= -_EPS))
+
+
+def ear_clip(points: np.ndarray, counts: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Triangulate simple counter-clockwise rings (packed, `counts` vertices each; one ring
+    if omitted) by ear clipping, all rings in lockstep. Each round tests every convex
+    vertex against the reflex vertices of its own ring at once and clips all ears that
+    aren't neighbours, so an n-gon takes far fewer than n rounds.
+
+    Returns:
+        (sum(counts) - 2 * rings, 3) global vertex indices
+    """
+    counts = np.array([len(points)]) if counts is None else np.asarray(counts, dtype=np.int64)
+    alive = np.arange(int(counts.sum()))
+    ring = np.repeat(np.arange(len(counts)), counts)
+    remaining = counts.copy()
+    triangles: List[np.ndarray] = []
+    while (remaining > 3).any():
+        starts = np.concatenate([[0], np.cumsum(remaining)[:-1]])
+        local = np.arange(len(alive)) - starts[ring]
+        prev = starts[ring] + (local - 1) % remaining[ring]
+        nxt = starts[ring] + (local + 1) % remaining[ring]
+        p = points[alive]
+        turn = _cross(p - p[prev], p[nxt] - p)
+        open_ring = remaining[ring] > 3
+        convex = np.flatnonzero((turn > _EPS) & open_ring)
+        reflex = np.flatnonzero((turn <= _EPS) & open_ring)
+
+        # Every (convex, reflex) pair within the same ring; a triangle's own corners don't count
+        ear = np.zeros(len(alive), dtype=bool)
+        ear[convex] = True
+        per_ring = np.bincount(ring[reflex], minlength=len(counts))
+        reflex_start = np.concatenate([[0], np.cumsum(per_ring)[:-1]])
+        pairs = per_ring[ring[convex]]
+        cand = np.repeat(convex, pairs)
+        step = np.arange(int(pairs.sum())) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+        other = reflex[reflex_start[ring[cand]] + step]
+        blocked = (_in_triangle(p[prev[cand]], p[cand], p[nxt[cand]], p[other])
+                   & (other != prev[cand]) & (other != nxt[cand]))
+        ear[cand[blocked]] = False
+
+        # Numerically degenerate rings with no ear: clip their most convex vertex
+        stuck = np.flatnonzero(open_ring & ~np.isin(ring, ring[ear]))
+        if len(stuck):
+            best = np.lexsort((-turn[stuck], ring[stuck]))
+            first = np.concatenate([[True], ring[stuck][best][1:] != ring[stuck][best][:-1]])
+            ear[stuck[best][first]] = True
+
+        # First ear of every run: no two chosen ears share an edge. A ring that is all ears
+        # has no run start, so take its first vertex
+        chosen = ear & ~ear[prev]
+        full = open_ring & (np.bincount(ring[ear], minlength=len(counts)) == remaining)[ring] & (local == 0)
+        chosen |= full
+        # Keep at least a triangle of every ring
+        rank = np.cumsum(chosen) - np.concatenate([[0], np.cumsum(chosen)])[starts[ring]] - 1
+        chosen &= rank < remaining[ring] - 3
+
+        clip = np.flatnonzero(chosen)
+        triangles.append(np.stack([alive[prev[clip]], alive[clip], alive[nxt[clip]]], axis=1))
+        alive, ring = alive[~chosen], ring[~chosen]
+        remaining = np.bincount(ring, minlength=len(counts))
+    triangles.append(alive.reshape(-1, 3))
+    return np.concatenate(triangles)
+
+
+def triangulate_rings(points: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Triangles over rings packed in one array (clean, counter-clockwise), as global indices.
+    Convex rings - most rooms - are fanned in one vectorised step; only the rest are ear-clipped.
+    """
+    if len(counts) == 0:
+        return np.empty((0, 3), dtype=np.int64)
+    ring = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(len(points)) - starts[ring]
+    prev = starts[ring] + (local - 1) % counts[ring]
+    nxt = starts[ring] + (local + 1) % counts[ring]
+    turn = _cross(points - points[prev], points[nxt] - points)
+    convex = np.ones(len(counts), dtype=bool)
+    convex[ring[turn < -_EPS]] = False
+
+    # Fans (s, s+k, s+k+1) for every convex ring at once
+    fan_rings = np.flatnonzero(convex)
+    fan_counts = counts[fan_rings] - 2
+    fan_ring = np.repeat(fan_rings, fan_counts)
+    k = np.arange(int(fan_counts.sum())) - np.repeat(np.cumsum(fan_counts) - fan_counts, fan_counts) + 1
+    base = starts[fan_ring]
+    parts = [np.stack([base, base + k, base + k + 1], axis=1)]
+
+    # Concave rings are ear-clipped together
+    concave = ~convex
+    if concave.any():
+        members = np.flatnonzero(concave[ring])
+        parts.append(members[ear_clip(points[members], counts[concave])])
+    return np.concatenate(parts).astype(np.int64)
+
+
+class SlabBuffers:
+    """Extruded slabs as one vertex / index buffer, each slab a contiguous run of both"""
+
+    def __init__(self, vertices: np.ndarray, faces: np.ndarray, vertex_start: np.ndarray,
+                 face_start: np.ndarray, face_count: np.ndarray, slab: np.ndarray):
+        self.vertices = vertices          # (V, 3)
+        self.faces = faces                # (F, 3) indices into vertices, outward facing
+        self.vertex_start = vertex_start  # (S,) first vertex of each slab
+        self.face_start = face_start      # (S,)
+        self.face_count = face_count      # (S,)
+        self.slab = slab                  # (S,) row of each slab in the input slab array
+
+    def __len__(self) -> int:
+        return len(self.slab)
+
+    def slab_mesh(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Vertices and faces (local indices) of one slab"""
+        faces = self.faces[self.face_start[i]:self.face_start[i] + self.face_count[i]]
+        first = self.vertex_start[i]
+        last = self.vertex_start[i + 1] if i + 1 < len(self) else len(self.vertices)
+        return self.vertices[first:last], faces - first
+
+
+def extrude_rings(
+    points: np.ndarray,
+    starts: np.ndarray,
+    counts: np.ndarray,
+    bottom: np.ndarray,
+    top: np.ndarray,
+    slab: Optional[np.ndarray] = None
+) -> SlabBuffers:
+    """
+    Prisms over clean counter-clockwise rings, all built with array operations.
+    Slab i keeps its top ring at vertices 2*start..2*start+count and its bottom ring right after.
+
+    Args:
+        points, starts, counts: Rings packed in one (P, 2) array
+        bottom, top: (S,) z range of every slab
+        slab: (S,) id carried through to the buffers (defaults to 0..S-1)
+    """
+    n = len(counts)
+    slab = np.arange(n) if slab is None else slab
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return SlabBuffers(np.empty((0, 3)), np.empty((0, 3), dtype=np.int64), empty, empty, empty, slab)
+
+    ring = np.repeat(np.arange(n), counts)
+    local = np.arange(len(points)) - starts[ring]
+    top_v = 2 * starts[ring] + local
+    bottom_v = top_v + counts[ring]
+
+    vertices = np.empty((2 * len(points), 3))
+    vertices[top_v, :2] = points
+    vertices[top_v, 2] = top[ring]
+    vertices[bottom_v, :2] = points
+    vertices[bottom_v, 2] = bottom[ring]
+
+    # Caps: top as triangulated (counter-clockwise, facing up), bottom reversed
+    tris = triangulate_rings(points, starts, counts)
+    tri_ring = ring[tris[:, 0]]
+    caps_top = top_v[tris]
+    caps_bottom = bottom_v[tris][:, ::-1]
+
+    # Sides: two outward triangles per outline edge
+    nxt = starts[ring] + (local + 1) % counts[ring]
+    t0, t1, b0, b1 = top_v, top_v[nxt], bottom_v, bottom_v[nxt]
+    sides = np.concatenate([np.stack([b0, b1, t1], axis=1), np.stack([b0, t1, t0], axis=1)])
+    side_ring = np.concatenate([ring, ring])
+
+    faces = np.concatenate([caps_top, caps_bottom, sides])
+    face_ring = np.concatenate([tri_ring, tri_ring, side_ring])
+    order = np.argsort(face_ring, kind="stable")
+    face_count = np.bincount(face_ring, minlength=n).astype(np.int64)
+    face_start = np.concatenate([[0], np.cumsum(face_count)[:-1]]).astype(np.int64)
+    return SlabBuffers(vertices, faces[order], 2 * starts, face_start, face_count, slab)
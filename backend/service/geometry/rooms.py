@@ -0,0 +1,152 @@
+"""
+Room Segmentation: rooms are the enclosed free space between rasterised walls
+"""
+
+import os
+import time
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+def opening_closures(
+    opening_bboxes: np.ndarray,
+    host: np.ndarray,
+    insertion: np.ndarray,
+    wall_endpoints: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Segments that close each hosted opening along its host wall, so a door
+    doesn't merge the two rooms it connects.
+
+    Returns:
+        (K, 2, 2) closure segments in page pixels, and the K host wall indices
+    """
+    hosted = host >= 0
+    boxes = np.asarray(opening_bboxes, dtype=np.float64)[hosted]
+    walls = np.asarray(wall_endpoints, dtype=np.float64)[host[hosted]]
+    centers = np.asarray(insertion, dtype=np.float64)[hosted]
+
+    seg = walls[:, 1] - walls[:, 0]
+    direction = seg / np.maximum(np.hypot(seg[:, 0], seg[:, 1]), 1e-9)[:, None]
+    # Opening extent measured along the wall direction
+    half = (np.abs(direction[:, 0]) * (boxes[:, 2] - boxes[:, 0])
+            + np.abs(direction[:, 1]) * (boxes[:, 3] - boxes[:, 1])) / 2
+    offset = direction * half[:, None]
+    return np.stack([centers - offset, centers + offset], axis=1), host[hosted]
+
+
+class RoomSegmenter:
+    """Occupancy grid -> connected components -> simplified polygons"""
+
+    def __init__(self):
+        self.cell_mm = float(os.getenv("ROOM_GRID_MM", 50))
+        self.max_side = int(os.getenv("ROOM_GRID_MAX_SIDE", 4096))
+        self.min_area_sqm = float(os.getenv("ROOM_MIN_AREA_SQM", 1.5))
+        self.simplify_mm = float(os.getenv("ROOM_SIMPLIFY_MM", 100))
+
+    def segment(
+        self,
+        segments: np.ndarray,
+        thickness_px: np.ndarray,
+        page_shape: Tuple[int, int],
+        pixels_per_mm: float
+    ) -> List[Dict]:
+        """
+        Extract rooms from wall (and closure) centerlines.
+
+        Args:
+            segments: (N, 2, 2) centerlines in page pixels
+            thickness_px: N stroke widths in page pixels
+            page_shape: (height, width) of the page image
+            pixels_per_mm: Scale calibration from Stage 2
+
+        Returns:
+            Room dicts with page-pixel boundary, interior center point and area
+        """
+        if len(segments) == 0:
+            return []
+
+        started = time.monotonic()
+        h, w = page_shape
+        cell = max(self.cell_mm * pixels_per_mm, max(h, w) / self.max_side, 1.0)
+        gh, gw = int(np.ceil(h / cell)), int(np.ceil(w / cell))
+
+        occupied = self._rasterise(segments / cell, thickness_px / cell, (gh, gw))
+        free = (occupied == 0).astype(np.uint8)
+
+        # 4-connectivity: free space must not leak diagonally between wall pixels
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(free, connectivity=4)
+        if count <= 1:
+            return []
+
+        cell_mm = cell / pixels_per_mm
+        area_sqm = stats[:, cv2.CC_STAT_AREA] * (cell_mm ** 2) / 1e6
+        x0, y0 = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        x1, y1 = x0 + stats[:, cv2.CC_STAT_WIDTH], y0 + stats[:, cv2.CC_STAT_HEIGHT]
+        # Free space touching the sheet edge is outside the building
+        exterior = (x0 == 0) | (y0 == 0) | (x1 == gw) | (y1 == gh)
+        keep = np.flatnonzero(~exterior & (area_sqm >= self.min_area_sqm))
+        keep = keep[keep > 0]
+        if len(keep) == 0:
+            return []
+
+        depth = cv2.distanceTransform(free, cv2.DIST_L2, 3)
+        epsilon = max(self.simplify_mm / cell_mm, 1.0)
+        rooms = []
+        for label in keep.tolist():
+            shape = self._vectorise(labels, depth, label, (x0[label], y0[label], x1[label], y1[label]), epsilon)
+            if shape is None:
+                continue
+            boundary, center = shape
+            boundary = np.trunc(boundary * cell).astype(np.int64)
+            rooms.append({
+                "id": len(rooms),
+                "boundary": boundary.tolist(),
+                "center": np.trunc(center * cell).astype(np.int64).tolist(),
+                "bbox": [int(boundary[:, 0].min()), int(boundary[:, 1].min()),
+                         int(boundary[:, 0].max()), int(boundary[:, 1].max())],
+                "area_sqm": float(area_sqm[label])
+            })
+
+        logger.info(f"Room segmentation: {len(rooms)} rooms on a {gw}x{gh} grid "
+                   f"({cell_mm:.0f} mm cells, {(time.monotonic() - started) * 1000:.0f} ms)")
+        return rooms
+
+    def _rasterise(self, segments: np.ndarray, widths: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+        """Draw all segments, one polylines call per distinct stroke width"""
+        grid = np.zeros(shape, dtype=np.uint8)
+        # Strokes at least 1 cell wide (+1 so thin walls still seal at grid resolution)
+        widths = np.maximum(np.rint(widths).astype(np.int64), 1) + 1
+        lines = np.rint(segments).astype(np.int32)
+        order = np.argsort(widths, kind="stable")
+        values, starts = np.unique(widths[order], return_index=True)
+        for width, group in zip(values.tolist(), np.split(order, starts[1:])):
+            cv2.polylines(grid, list(lines[group]), False, 1, thickness=width)
+        return grid
+
+    def _vectorise(self, labels: np.ndarray, depth: np.ndarray, label: int, bbox, epsilon: float):
+        """Simplified outer contour and label point of one component, in grid coordinates"""
+        x0, y0, x1, y1 = bbox
+        inside = labels[y0:y1, x0:x1] == label
+        # Pad by one cell so the contour can't run along the crop edge
+        contours, _ = cv2.findContours(np.pad(inside.astype(np.uint8), 1), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        contour = max(contours, key=cv2.contourArea)
+        poly = cv2.approxPolyDP(contour, epsilon, True).reshape(-1, 2).astype(np.float64)
+        if len(poly) < 3:
+            return None
+
+        # Label point: the deepest interior cell, always inside even for L-shaped rooms
+        cy, cx = np.unravel_index(np.argmax(np.where(inside, depth[y0:y1, x0:x1], -1.0)), inside.shape)
+
+        # Contours trace cell centres; shift to cell edges and back to uncropped coordinates
+        origin = np.array([x0, y0], dtype=np.float64)
+        return poly - 1 + 0.5 + origin, np.array([cx, cy]) + 0.5 + origin
+
+
+# Global instance
+room_segmenter = RoomSegmenter()
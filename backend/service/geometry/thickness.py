@@ -0,0 +1,88 @@
+"""
+Wall Thickness: one distance transform per page, sampled along every wall centerline at once
+"""
+
+from typing import Dict
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+def distance_map(image: np.ndarray) -> np.ndarray:
+    """
+    Distance from every ink pixel to the nearest background pixel.
+    On a stroke of width t the value peaks at ~t/2 along its medial axis.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    # Otsu picks the ink/paper split per sheet (scans and vector renders differ a lot)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return cv2.distanceTransform(ink, cv2.DIST_L2, 5)
+
+
+def get_distance_map(image_data: Dict) -> np.ndarray:
+    """Compute the page distance map once and share it"""
+    dist = image_data.get("distance_map")
+    if dist is None:
+        dist = distance_map(image_data["image"])
+        image_data["distance_map"] = dist
+    return dist
+
+
+def sample_wall_thickness(
+    dist: np.ndarray,
+    bboxes: np.ndarray,
+    stations: int = 16,
+    across: int = 9,
+    end_margin: float = 0.1
+) -> np.ndarray:
+    """
+    Stroke thickness in pixels for every wall bbox, by vectorised indexing.
+
+    Each wall is sampled at `stations` points along its long axis (skipping the
+    ends, where junctions inflate the distance) and `across` points over its
+    short axis. The max across the wall finds the medial axis at each station;
+    the median along it ignores doors, text and gaps.
+
+    Args:
+        dist: Page distance map
+        bboxes: Nx4 xyxy wall boxes in page pixels
+
+    Returns:
+        N thicknesses in pixels (0 where no ink was found)
+    """
+    if len(bboxes) == 0:
+        return np.empty(0, dtype=np.float32)
+
+    h, w = dist.shape
+    x1, y1, x2, y2 = np.asarray(bboxes, dtype=np.float32).T
+    horizontal = (x2 - x1) >= (y2 - y1)
+
+    t_along = np.linspace(end_margin, 1 - end_margin, stations, dtype=np.float32)
+    t_across = np.linspace(0, 1, across, dtype=np.float32)
+
+    # Long/short axis extents per wall: (N,)
+    a0 = np.where(horizontal, x1, y1)
+    a1 = np.where(horizontal, x2, y2)
+    b0 = np.where(horizontal, y1, x1)
+    b1 = np.where(horizontal, y2, x2)
+
+    # (N, stations, across) sample grid
+    along = a0[:, None, None] + (a1 - a0)[:, None, None] * t_along[None, :, None]
+    cross = b0[:, None, None] + (b1 - b0)[:, None, None] * t_across[None, None, :]
+    along, cross = np.broadcast_arrays(along, cross)
+
+    hz = horizontal[:, None, None]
+    xs = np.where(hz, along, cross)
+    ys = np.where(hz, cross, along)
+    xs = np.clip(np.rint(xs).astype(np.int64), 0, w - 1)
+    ys = np.clip(np.rint(ys).astype(np.int64), 0, h - 1)
+
+    half = dist[ys, xs].max(axis=2)
+    # Distances run to the nearest background pixel centre, so 2*d over-counts by one pixel
+    thickness = np.maximum(2.0 * np.median(half, axis=1) - 1.0, 0.0)
+
+    missing = int((thickness == 0).sum())
+    if missing:
+        logger.debug(f"No ink under {missing}/{len(thickness)} wall centerlines")
+    return thickness.astype(np.float32)
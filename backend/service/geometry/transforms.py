@@ -0,0 +1,133 @@
+"""
+Coordinate Transforms: 3x3 homogeneous affines between the frames a sheet passes through
+
+    tile pixels -> page pixels -> PDF points -> model millimetres
+
+Every stage takes its conversions from PageFrames, and applies them to whole
+coordinate arrays at once.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+POINTS_PER_INCH = 72.0
+MM_PER_INCH = 25.4
+
+
+def identity() -> np.ndarray:
+    return np.eye(3)
+
+
+def scale_matrix(sx: float, sy: Optional[float] = None) -> np.ndarray:
+    """3x3 homogeneous 2D scaling"""
+    return np.diag([sx, sx if sy is None else sy, 1.0])
+
+
+def translation_matrix(dx: float, dy: float) -> np.ndarray:
+    """3x3 homogeneous 2D translation"""
+    matrix = np.eye(3)
+    matrix[:2, 2] = dx, dy
+    return matrix
+
+
+def fitz_matrix(values: Sequence[float]) -> np.ndarray:
+    """3x3 form of a PyMuPDF Matrix (a, b, c, d, e, f), which maps x' = ax + cy + e, y' = bx + dy + f"""
+    a, b, c, d, e, f = (float(v) for v in values)
+    return np.array([[a, c, e], [b, d, f], [0.0, 0.0, 1.0]])
+
+
+def apply_affine(matrix: np.ndarray, points) -> np.ndarray:
+    """Apply a 3x3 homogeneous 2D affine transform to (..., 2) points in one operation"""
+    points = np.asarray(points, dtype=np.float64)
+    return points @ matrix[:2, :2].T + matrix[:2, 2]
+
+
+def apply_affine_boxes(matrix: np.ndarray, boxes) -> np.ndarray:
+    """
+    Map (N, 4) x1, y1, x2, y2 boxes through an affine. Under rotation the corners
+    swap roles, so the result is the axis-aligned bounds of all four mapped corners.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    mapped = apply_affine(matrix, corners)
+    return np.concatenate([mapped.min(axis=1), mapped.max(axis=1)], axis=1)
+
+
+def offset_boxes(boxes: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Tile-to-page for a batch of boxes from different tiles: each tile's affine is
+    a pure translation, so it reduces to adding the (N, 2) tile origins to both corners.
+    """
+    return boxes + np.tile(offsets, 2).astype(boxes.dtype, copy=False)
+
+
+def px_to_model(pixels_per_mm: float, page_to_model: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Page pixels to model millimetres.
+
+    Args:
+        pixels_per_mm: Page pixels per real-world millimetre (Stage 2)
+        page_to_model: Optional affine from page millimetres to model coordinates
+                       (origin, orientation); identity if omitted
+    """
+    px_to_mm = scale_matrix(1.0 / pixels_per_mm)
+    return px_to_mm if page_to_model is None else page_to_model @ px_to_mm
+
+
+class PageFrames:
+    """
+    Coordinate frames of one rendered page.
+
+    "pt" is the unrotated page in PDF points with a top-left origin - what PyMuPDF reports
+    for text spans and drawings, already relative to the cropbox, so no user-space step is
+    needed. "px" is the rendered raster, which shows the page rotated by /Rotate.
+    """
+
+    def __init__(self, pixels_per_point: float = 1.0, rotation: Optional[np.ndarray] = None):
+        self.pixels_per_point = float(pixels_per_point)
+        self.rotation = identity() if rotation is None else np.asarray(rotation, dtype=np.float64)
+
+    @classmethod
+    def from_page(cls, page, pixels_per_point: float) -> "PageFrames":
+        """Frames of a PyMuPDF page rendered at pixels_per_point (dpi / 72, times any resize)"""
+        return cls(pixels_per_point, rotation=fitz_matrix(page.rotation_matrix))
+
+    @classmethod
+    def from_image_data(cls, data: Dict, default_dpi: float = POINTS_PER_INCH) -> "PageFrames":
+        """
+        Frames from a stage's image data or metadata dict: "pixels_per_point" (or "dpi"),
+        plus "rotation_matrix" as written by to_dict().
+        """
+        pixels_per_point = data.get("pixels_per_point")
+        if not pixels_per_point:
+            pixels_per_point = (data.get("dpi") or default_dpi) / POINTS_PER_INCH
+        rotation = data.get("rotation_matrix")
+        return cls(pixels_per_point, rotation=None if rotation is None else fitz_matrix(rotation))
+
+    def to_dict(self) -> Dict:
+        """Plain values for image data / metadata dicts; from_image_data() reads them back"""
+        def six(m):
+            return [float(m[0, 0]), float(m[1, 0]), float(m[0, 1]), float(m[1, 1]), float(m[0, 2]), float(m[1, 2])]
+        return {
+            "pixels_per_point": self.pixels_per_point,
+            "dpi": self.dpi,
+            "rotation_matrix": six(self.rotation)
+        }
+
+    @property
+    def dpi(self) -> float:
+        """Effective raster resolution (after any resize)"""
+        return self.pixels_per_point * POINTS_PER_INCH
+
+    @property
+    def pixels_per_paper_mm(self) -> float:
+        return self.dpi / MM_PER_INCH
+
+    @property
+    def pt_to_px(self) -> np.ndarray:
+        return scale_matrix(self.pixels_per_point) @ self.rotation
+
+    @property
+    def px_to_pt(self) -> np.ndarray:
+        return np.linalg.inv(self.pt_to_px)
@@ -0,0 +1,272 @@
+"""
+Wall Graph: snap wall endpoints into shared nodes and expose connectivity as CSR arrays
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+from scipy.spatial import cKDTree
+
+# Node classification by degree (and angle for degree 2)
+JUNCTION_TYPES = ("isolated", "end", "L", "inline", "T", "X")
+JUNCTION_CODES = {name: code for code, name in enumerate(JUNCTION_TYPES)}
+
+# Two edges meeting within this angle of a straight line are an inline joint, not a corner
+INLINE_COS = np.cos(np.deg2rad(160))
+
+
+class WallGraph:
+    """
+    Undirected graph of wall centerlines.
+    Walls are indexed in detection order (index == wall id from the detection table).
+    A wall split by T-junctions on its span contributes several edges; `edge_wall`
+    maps every CSR entry back to the wall it came from.
+    """
+
+    def __init__(
+        self,
+        nodes: np.ndarray,
+        wall_nodes: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        edge_wall: np.ndarray,
+        junction: np.ndarray
+    ):
+        self.nodes = nodes              # (V, 2) node positions, page pixels
+        self.wall_nodes = wall_nodes    # (N, 2) start/end node of every wall
+        self.indptr = indptr            # (V + 1,) CSR row pointers
+        self.indices = indices          # (2E,) neighbour node per CSR entry
+        self.edge_wall = edge_wall      # (2E,) wall per CSR entry
+        self.junction = junction        # (V,) index into JUNCTION_TYPES
+
+    @property
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def snapped_endpoints(self) -> np.ndarray:
+        """(N, 2, 2) wall endpoints moved onto their shared nodes"""
+        return self.nodes[self.wall_nodes]
+
+    def walls_at(self, node: int) -> np.ndarray:
+        """Distinct walls touching a node (including walls passing through a T)"""
+        return np.unique(self.edge_wall[self.indptr[node]:self.indptr[node + 1]])
+
+    def joins_for_wall(self, wall: int) -> Dict:
+        """Junction type and the other walls at each end of one wall"""
+        joins = {}
+        for end, node in zip(("start", "end"), self.wall_nodes[wall].tolist()):
+            others = self.walls_at(node)
+            joins[end] = {
+                "node": node,
+                "junction": JUNCTION_TYPES[self.junction[node]],
+                "walls": others[others != wall].tolist()
+            }
+        return joins
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly form carried between stages"""
+        return {
+            "nodes": self.nodes.tolist(),
+            "wall_nodes": self.wall_nodes.tolist(),
+            "indptr": self.indptr.tolist(),
+            "indices": self.indices.tolist(),
+            "edge_wall": self.edge_wall.tolist(),
+            "junction": [JUNCTION_TYPES[c] for c in self.junction.tolist()]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WallGraph":
+        return cls(
+            np.asarray(data["nodes"], dtype=np.float32).reshape(-1, 2),
+            np.asarray(data["wall_nodes"], dtype=np.int64).reshape(-1, 2),
+            np.asarray(data["indptr"], dtype=np.int64),
+            np.asarray(data["indices"], dtype=np.int64),
+            np.asarray(data["edge_wall"], dtype=np.int64),
+            np.array([JUNCTION_CODES[name] for name in data["junction"]], dtype=np.int8)
+        )
+
+
+def build_wall_graph(endpoints: np.ndarray, snap_tolerance: float) -> WallGraph:
+    """
+    Build the wall graph in near-linear time.
+
+    1. Endpoints closer than `snap_tolerance` are paired with a KD-tree and merged
+       into nodes by union-find.
+    2. Nodes lying on the span of another wall (T-junctions) are found against
+       a KD-tree of points sampled along every centerline, then snapped onto it.
+    3. Walls are split at their T-nodes and the edges packed into CSR arrays.
+
+    Args:
+        endpoints: (N, 2, 2) wall centerline endpoints in page pixels
+        snap_tolerance: Merge/attach distance in pixels
+
+    Returns:
+        WallGraph over N walls
+    """
+    endpoints = np.asarray(endpoints, dtype=np.float64).reshape(-1, 2, 2)
+    n = len(endpoints)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return WallGraph(np.empty((0, 2), np.float32), np.empty((0, 2), np.int64),
+                         np.zeros(1, np.int64), empty, empty, np.empty(0, np.int8))
+
+    # 1. Endpoint snapping: endpoint k belongs to wall k // 2
+    points = endpoints.reshape(-1, 2)
+    pairs = cKDTree(points).query_pairs(snap_tolerance, output_type="ndarray")
+    # A wall shorter than the tolerance must not collapse onto itself
+    pairs = pairs[pairs[:, 0] // 2 != pairs[:, 1] // 2]
+    roots = _union_find(len(points), pairs)
+
+    _, point_node = np.unique(roots, return_inverse=True)
+    point_node = point_node.reshape(-1)
+    node_count = int(point_node.max()) + 1
+    members = np.bincount(point_node, minlength=node_count)
+    nodes = np.stack([
+        np.bincount(point_node, weights=points[:, 0], minlength=node_count),
+        np.bincount(point_node, weights=points[:, 1], minlength=node_count)
+    ], axis=1) / members[:, None]
+    wall_nodes = point_node.reshape(n, 2)
+
+    # 2. T-junctions: node -> host wall whose span it touches
+    t_node, t_wall, t_pos, t_proj = _find_t_junctions(nodes, wall_nodes, endpoints, snap_tolerance)
+    nodes[t_node] = t_proj
+
+    # 3. Split walls at their T-nodes and order each wall's nodes along its length
+    wall_ids = np.concatenate([np.arange(n), np.arange(n), t_wall])
+    along = np.concatenate([np.zeros(n), np.ones(n), t_pos])
+    chain = np.concatenate([wall_nodes[:, 0], wall_nodes[:, 1], t_node])
+    order = np.lexsort((along, wall_ids))
+    wall_ids, chain = wall_ids[order], chain[order]
+
+    consecutive = wall_ids[1:] == wall_ids[:-1]
+    src, dst, edge_wall = chain[:-1][consecutive], chain[1:][consecutive], wall_ids[1:][consecutive]
+    proper = src != dst
+    src, dst, edge_wall = src[proper], dst[proper], edge_wall[proper]
+
+    indptr, indices, csr_wall = _to_csr(node_count, src, dst, edge_wall)
+    junction = _classify_junctions(nodes, indptr, indices)
+
+    logger.info(f"Wall graph: {n} walls -> {node_count} nodes, {len(src)} edges "
+               f"({len(t_node)} T-junctions, {int((junction == JUNCTION_CODES['L']).sum())} corners)")
+    return WallGraph(nodes.astype(np.float32), wall_nodes.astype(np.int64),
+                     indptr, indices, csr_wall, junction)
+
+
+def _union_find(count: int, pairs: np.ndarray) -> np.ndarray:
+    """
+    Vectorised union-find: hook larger roots under smaller ones, then compress
+    paths by pointer jumping. Repeats until every pair shares a root, which takes
+    a handful of rounds even for long snapping chains.
+    """
+    parent = np.arange(count)
+    if len(pairs) == 0:
+        return parent
+
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        ra, rb = parent[a], parent[b]
+        split = ra != rb
+        if not split.any():
+            return parent
+        lo = np.minimum(ra[split], rb[split])
+        hi = np.maximum(ra[split], rb[split])
+        np.minimum.at(parent, hi, lo)
+        # Pointer jumping until every element points straight at its root
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def _find_t_junctions(nodes: np.ndarray, wall_nodes: np.ndarray, endpoints: np.ndarray, tolerance: float):
+    """
+    Nodes within `tolerance` of another wall's span (away from its ends).
+    Candidate (node, wall) pairs come from a KD-tree of points sampled every
+    `tolerance` along each centerline; an exact point-to-segment test decides.
+
+    Returns:
+        node ids, host wall ids, position along the host (0..1) and projected point
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if tolerance <= 0:
+        return empty, empty, np.empty(0), np.empty((0, 2))
+
+    p0, p1 = endpoints[:, 0], endpoints[:, 1]
+    seg = p1 - p0
+    length = np.hypot(seg[:, 0], seg[:, 1])
+
+    samples_per_wall = np.maximum(np.ceil(length / tolerance).astype(np.int64), 1) + 1
+    sample_wall = np.repeat(np.arange(len(endpoints)), samples_per_wall)
+    starts = np.cumsum(samples_per_wall) - samples_per_wall
+    step = np.arange(len(sample_wall)) - np.repeat(starts, samples_per_wall)
+    t = step / np.repeat(samples_per_wall - 1, samples_per_wall)
+    samples = p0[sample_wall] + seg[sample_wall] * t[:, None]
+
+    # Every segment point is within tolerance/2 of a sample
+    near = cKDTree(nodes).sparse_distance_matrix(
+        cKDTree(samples), 1.5 * tolerance, output_type="ndarray"
+    )
+    if len(near) == 0:
+        return empty, empty, np.empty(0), np.empty((0, 2))
+
+    cand = np.unique(np.stack([near["i"], sample_wall[near["j"]]], axis=1), axis=0)
+    node, wall = cand[:, 0], cand[:, 1]
+    # A wall's own end nodes are not T-junctions on it
+    own = (wall_nodes[wall, 0] == node) | (wall_nodes[wall, 1] == node)
+    node, wall = node[~own], wall[~own]
+
+    rel = nodes[node] - p0[wall]
+    sq_len = np.maximum(length[wall] ** 2, 1e-9)
+    pos = (rel * seg[wall]).sum(axis=1) / sq_len
+    proj = p0[wall] + seg[wall] * pos[:, None]
+    dist = np.hypot(*(nodes[node] - proj).T)
+    # Within the span: nodes near the ends are corners, already handled by snapping
+    margin = tolerance / np.maximum(length[wall], 1e-9)
+    hit = (dist <= tolerance) & (pos > margin) & (pos < 1 - margin)
+    node, wall, pos, proj, dist = node[hit], wall[hit], pos[hit], proj[hit], dist[hit]
+
+    # Closest host per node (two parallel faces can both be in range)
+    order = np.lexsort((dist, node))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = node[order][1:] != node[order][:-1]
+    pick = order[first]
+    return node[pick], wall[pick], pos[pick], proj[pick]
+
+
+def _to_csr(node_count: int, src: np.ndarray, dst: np.ndarray, edge_wall: np.ndarray):
+    """Symmetric adjacency in CSR form, sorted by source node"""
+    rows = np.concatenate([src, dst])
+    cols = np.concatenate([dst, src])
+    walls = np.concatenate([edge_wall, edge_wall])
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+    return indptr, cols[order].astype(np.int64), walls[order].astype(np.int64)
+
+
+def _classify_junctions(nodes: np.ndarray, indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Junction code per node from its degree, and the turn angle for degree 2"""
+    degree = np.diff(indptr)
+    junction = np.select(
+        [degree == 0, degree == 1, degree == 2, degree == 3],
+        [JUNCTION_CODES["isolated"], JUNCTION_CODES["end"], JUNCTION_CODES["L"], JUNCTION_CODES["T"]],
+        JUNCTION_CODES["X"]
+    ).astype(np.int8)
+
+    two = np.flatnonzero(degree == 2)
+    if len(two):
+        a = nodes[indices[indptr[two]]] - nodes[two]
+        b = nodes[indices[indptr[two] + 1]] - nodes[two]
+        norms = np.maximum(np.hypot(*a.T) * np.hypot(*b.T), 1e-9)
+        cos = (a * b).sum(axis=1) / norms
+        junction[two[cos <= INLINE_COS]] = JUNCTION_CODES["inline"]
+
+    return junction
+
+
+def wall_graph_from(elements: Dict) -> Optional[WallGraph]:
+    """The graph Stage 3 attached to its output, if any"""
+    data = elements.get("wall_graph")
+    return WallGraph.from_dict(data) if data else None
@@ -0,0 +1,213 @@
+"""
+Wall Joins: miter / butt / abut cleanup at every wall junction, solved for all wall ends at once
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+from loguru import logger
+
+from backend.service.geometry.wall_graph import INLINE_COS, WallGraph
+
+# How a wall end is finished:
+#   free  - nothing attached, square end at the node
+#   miter - corner (L) with exactly one other wall, cut along the bisector of the faces
+#   butt  - square end at the node, flush against a collinear wall (inline, or the
+#           through-wall of a junction made only of wall ends)
+#   abut  - stem of a T / X, trimmed back to the face of the wall it runs into
+JOIN_TYPES = ("free", "miter", "butt", "abut")
+_FREE, _MITER, _BUTT, _ABUT = range(len(JOIN_TYPES))
+
+_EPS = 1e-9
+
+
+def _rot90(v: np.ndarray) -> np.ndarray:
+    """Left normal of (..., 2) directions"""
+    return np.stack([-v[..., 1], v[..., 0]], axis=-1)
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def solve_wall_joins(walls: np.ndarray, graph: Optional[WallGraph], miter_limit: float = 4.0) -> Dict[str, int]:
+    """
+    Fill `join_type` and `trim` of Stage 5 wall records in place.
+
+    Every wall end becomes one row of a batch. The graph says which ends share a node
+    and which wall passes straight through it (T-junction hosts); each end then has a
+    partner line - the adjoining face of the other wall - and one vectorised 2x2 solve
+    gives where both of its faces meet that line.
+
+    trim[row, end, side] is the distance from the node to where face `side` ends, measured
+    into the wall (negative extends past the node). end 0 = start, 1 = end; side 0 = left
+    of start->end, 1 = right.
+
+    Args:
+        walls: WALL_DTYPE records, positions in model mm, endpoints snapped to graph nodes
+        graph: Stage 3 wall graph (walls indexed by id)
+        miter_limit: Miters reaching further than this many wall thicknesses (very
+                     acute corners) fall back to butt ends
+
+    Returns:
+        Count of wall ends per join type
+    """
+    n = len(walls)
+    walls["join_type"] = JOIN_TYPES[_FREE]
+    walls["trim"] = 0.0
+    if n == 0 or graph is None or len(graph.wall_nodes) == 0:
+        return {name: 2 * n if name == "free" else 0 for name in JOIN_TYPES}
+
+    # Graph wall of every row, and back
+    graph_wall = np.where(walls["id"] >= 0, walls["id"], np.arange(n))
+    valid = graph_wall < len(graph.wall_nodes)
+    row_of = np.full(len(graph.wall_nodes), -1, dtype=np.int64)
+    row_of[graph_wall[valid]] = np.flatnonzero(valid)
+
+    # --- One row per wall end: e = 2 * row + end, direction pointing into the wall
+    start, end = walls["start"][:, :2], walls["end"][:, :2]
+    delta = end - start
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    d = delta / np.maximum(length, _EPS)[:, None]
+    u = np.stack([d, -d], axis=1).reshape(-1, 2)
+    t = np.repeat(walls["thickness"], 2)
+    node = np.full(2 * n, -1, dtype=np.int64)
+    node[np.repeat(valid, 2)] = graph.wall_nodes[graph_wall[valid]].reshape(-1)
+
+    # --- Walls passing through a node (split at a T) host the ends that stop there
+    entry_node = np.repeat(np.arange(len(graph.indptr) - 1), graph.degree)
+    through = (graph.wall_nodes[graph.edge_wall, 0] != entry_node) & (graph.wall_nodes[graph.edge_wall, 1] != entry_node)
+    host_node, first = np.unique(entry_node[through], return_index=True)
+    host_of_node = np.full(len(graph.indptr) - 1, -1, dtype=np.int64)
+    host_of_node[host_node] = row_of[graph.edge_wall[through][first]]
+
+    kind = np.full(2 * n, _FREE, dtype=np.int64)
+    partner_dir = np.zeros((2 * n, 2))      # direction of the line this end is cut against
+    partner_off = np.zeros((2 * n, 2, 2))   # offset of that line from the node, per face of this end
+
+    ends = np.flatnonzero(node >= 0)
+    host = host_of_node[node[ends]]
+
+    # T hosts: both faces of the stem stop at the host face on the stem's side
+    stems = ends[host >= 0]
+    host_row = host[host >= 0]
+    _abut(stems, 2 * host_row, u, t, kind, partner_dir, partner_off)
+
+    # Nodes made only of wall ends, grouped by node
+    free_ends = ends[host < 0]
+    order = free_ends[np.argsort(node[free_ends], kind="stable")]
+    _, group_start, group_size = np.unique(node[order], return_index=True, return_counts=True)
+
+    # Two ends: a corner (miter) unless they continue in a straight line (butt)
+    pairs = group_start[group_size == 2]
+    a, b = order[pairs], order[pairs + 1]
+    inline = (u[a] * u[b]).sum(axis=1) <= INLINE_COS
+    kind[a[inline]] = kind[b[inline]] = _BUTT
+    _miter(a[~inline], b[~inline], u, t, kind, partner_dir, partner_off)
+    _miter(b[~inline], a[~inline], u, t, kind, partner_dir, partner_off)
+
+    # Three or more ends: the most opposed pair continues through (or, with no collinear
+    # pair, the thickest end stands in for it); the rest abut it
+    crowded = group_size >= 3
+    if crowded.any():
+        _solve_crowded(order, group_start[crowded], group_size[crowded], u, t, kind, partner_dir, partner_off)
+
+    trims = _cut(u, t, kind, partner_dir, partner_off)
+    too_long = np.abs(trims).max(axis=1) > miter_limit * np.maximum(t, _EPS)
+    fallback = too_long & ((kind == _MITER) | (kind == _ABUT))
+    kind[fallback] = _BUTT
+    trims[fallback | (kind == _FREE) | (kind == _BUTT)] = 0.0
+
+    # Back to the wall frame: at the end cap the end's left face is the wall's right face
+    trims = trims.reshape(n, 2, 2)
+    trims[:, 1] = trims[:, 1, ::-1]
+    walls["trim"] = trims
+    walls["join_type"] = np.array(JOIN_TYPES)[kind.reshape(n, 2)]
+
+    counts = {name: int((kind == code).sum()) for code, name in enumerate(JOIN_TYPES)}
+    logger.info(f"Wall joins: {counts['miter']} miter, {counts['abut']} abut, {counts['butt']} butt, "
+               f"{counts['free']} free ends ({int(fallback.sum())} miters over the limit squared off)")
+    return counts
+
+
+def _miter(ends: np.ndarray, others: np.ndarray, u, t, kind, partner_dir, partner_off):
+    """Face +s of each end meets face -s of the other wall"""
+    kind[ends] = _MITER
+    partner_dir[ends] = u[others]
+    normal = _rot90(u[others]) * (t[others] / 2)[:, None]
+    partner_off[ends, 0] = -normal
+    partner_off[ends, 1] = normal
+
+
+def _abut(ends: np.ndarray, hosts: np.ndarray, u, t, kind, partner_dir, partner_off):
+    """Both faces of each end stop at the host face on the end's side"""
+    kind[ends] = _ABUT
+    partner_dir[ends] = u[hosts]
+    normal = _rot90(u[hosts])
+    side = np.where((u[ends] * normal).sum(axis=1) < 0, -1.0, 1.0)
+    face = normal * (side * t[hosts] / 2)[:, None]
+    partner_off[ends, 0] = face
+    partner_off[ends, 1] = face
+
+
+def _solve_crowded(order, group_start, group_size, u, t, kind, partner_dir, partner_off):
+    """Junctions of three or more wall ends, on a padded (node, slot) table"""
+    width = int(group_size.max())
+    slot = np.arange(width)
+    present = slot[None, :] < group_size[:, None]
+    table = order[group_start[:, None] + np.minimum(slot[None, :], group_size[:, None] - 1)]
+
+    cos = np.einsum("gik,gjk->gij", u[table], u[table])
+    cos[~(present[:, :, None] & present[:, None, :])] = np.inf
+    cos[:, slot, slot] = np.inf
+    flat = cos.reshape(len(table), -1).argmin(axis=1)
+    i, j = np.divmod(flat, width)
+    rows = np.arange(len(table))
+    collinear = cos[rows, i, j] <= INLINE_COS
+
+    # No collinear pair: the thickest end is the through-wall
+    thickness = np.where(present, t[table], -np.inf)
+    thickest = thickness.argmax(axis=1)
+    i = np.where(collinear, i, thickest)
+    j = np.where(collinear, j, thickest)
+
+    through = table[rows, i]
+    kind[through] = _BUTT
+    kind[table[rows, j]] = _BUTT
+    stems = present & (slot[None, :] != i[:, None]) & (slot[None, :] != j[:, None])
+    _abut(table[stems], np.broadcast_to(through[:, None], table.shape)[stems], u, t, kind, partner_dir, partner_off)
+
+
+def _cut(u, t, kind, partner_dir, partner_off) -> np.ndarray:
+    """
+    Where the left (+) and right (-) faces of every end meet their partner line.
+    Face: node + s*(t/2)*n + k*u, partner: node + off + q*v; solving k*u - q*v = off - s*(t/2)*n
+    for k by cross products gives the trim.
+    """
+    normal = _rot90(u) * (t / 2)[:, None]
+    denom = _cross(u, partner_dir)
+    solvable = np.abs(denom) > _EPS
+    trims = np.zeros((len(u), 2))
+    for side, sign in enumerate((1.0, -1.0)):
+        rhs = partner_off[:, side] - sign * normal
+        trims[:, side] = np.where(solvable, _cross(rhs, partner_dir) / np.where(solvable, denom, 1.0), 0.0)
+    trims[~solvable & (kind == _ABUT)] = 0.0
+    return trims
+
+
+def wall_footprints(walls: np.ndarray) -> np.ndarray:
+    """
+    (N, 4, 2) wall outlines after joins, counter-clockwise from the start-right corner:
+    start-right, end-right, end-left, start-left
+    """
+    start, end = walls["start"][:, :2], walls["end"][:, :2]
+    delta = end - start
+    d = delta / np.maximum(np.hypot(delta[:, 0], delta[:, 1]), _EPS)[:, None]
+    half = _rot90(d) * (walls["thickness"] / 2)[:, None]
+    trim = walls["trim"]
+    return np.stack([
+        start + d * trim[:, 0, 1, None] - half,
+        end - d * trim[:, 1, 1, None] - half,
+        end - d * trim[:, 1, 0, None] + half,
+        start + d * trim[:, 0, 0, None] + half
+    ], axis=1)
@@ -0,0 +1,177 @@
+"""
+Wall Mesh: walls extruded from their joined footprints with door / window openings cut out,
+built directly as prisms - no mesh booleans
+"""
+
+from typing import Tuple
+
+import numpy as np
+from loguru import logger
+
+from backend.service.geometry.model import NO_ID
+
+_EPS = 1e-6
+
+# Triangles of a prism over footprint corners 0-3 (start-right, end-right, end-left,
+# start-left, as wall_footprints orders them) with the same corners lifted as 4-7,
+# grouped by side: bottom, top, right face, far end, left face, near end
+_PRISM_SIDES = np.array([
+    [[0, 2, 1], [0, 3, 2]],
+    [[4, 5, 6], [4, 6, 7]],
+    [[0, 1, 5], [0, 5, 4]],
+    [[1, 2, 6], [1, 6, 5]],
+    [[2, 3, 7], [2, 7, 6]],
+    [[3, 0, 4], [3, 4, 7]]
+], dtype=np.int64)
+_BOTTOM, _TOP, _RIGHT, _FAR, _LEFT, _NEAR = range(6)
+
+
+def _opening_spans(walls: np.ndarray, openings: np.ndarray):
+    """
+    Row of the host wall of every opening and its [a, b] span along the wall centreline,
+    clipped to where both faces of the wall exist. Unhosted openings get row -1.
+    """
+    host = np.full(len(openings), -1, dtype=np.int64)
+    ids = walls["id"]
+    hosted = (openings["host_wall_id"] != NO_ID) & (len(walls) > 0)
+    if hosted.any():
+        order = np.argsort(ids, kind="stable")
+        found = np.searchsorted(ids[order], openings["host_wall_id"][hosted])
+        found = np.minimum(found, len(order) - 1)
+        match = ids[order][found] == openings["host_wall_id"][hosted]
+        host[np.flatnonzero(hosted)[match]] = order[found[match]]
+
+    rows = np.maximum(host, 0)
+    start, end = walls["start"][rows, :2], walls["end"][rows, :2]
+    delta = end - start
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    along = ((openings["location"][:, :2] - start) * delta).sum(axis=1) / np.maximum(length, _EPS)
+    trim = walls["trim"][rows]
+    lo = trim[:, 0].max(axis=1)
+    hi = length - trim[:, 1].max(axis=1)
+    a = np.clip(along - openings["width"] / 2, lo, hi)
+    b = np.clip(along + openings["width"] / 2, lo, hi)
+    return host, a, b
+
+
+def wall_mesh(walls: np.ndarray, openings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Every wall as one vertex / index buffer, with rectangular holes for its openings.
+
+    Each wall footprint (after joins) is cut across at the sides of its openings into
+    slices. Piers between openings are full-height prisms; an opening slice is a prism
+    below the sill, one above the head, and between them only the jambs. Walls are
+    batched by opening count, so each group is a handful of (walls, openings) array
+    operations. Openings that overlap along a wall are clipped to end where the next
+    begins.
+
+    Args:
+        walls: WALL_DTYPE records with solved joins (wall_joins.solve_wall_joins)
+        openings: OPENING_DTYPE records (doors and windows together); location z is the
+                  sill, height runs up from it
+
+    Returns:
+        (V, 3) vertices and (F, 3) triangles
+    """
+    if len(walls) == 0:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    host, a, b = _opening_spans(walls, openings)
+    cut = (host >= 0) & (b - a > _EPS)
+    if (~cut).any():
+        logger.debug(f"Wall mesh: {int((~cut).sum())} openings without a host wall span left uncut")
+    host, a, b, cut_openings = host[cut], a[cut], b[cut], openings[cut]
+    sill = np.clip(cut_openings["location"][:, 2], 0.0, walls["height"][host])
+    head = np.clip(sill + cut_openings["height"], sill, walls["height"][host])
+
+    # Openings grouped by host wall, in order along it
+    order = np.lexsort((a, host))
+    host, a, b, sill, head = host[order], a[order], b[order], sill[order], head[order]
+    per_wall = np.bincount(host, minlength=len(walls))
+    first = np.concatenate([[0], np.cumsum(per_wall)[:-1]])
+
+    # Only the fields the mesh needs, so groups don't copy whole records
+    fields = [np.ascontiguousarray(walls[name]) for name in ("start", "end", "thickness", "height", "trim")]
+    vertices, faces, offset = [], [], 0
+    for k in np.unique(per_wall):
+        rows = np.flatnonzero(per_wall == k)
+        index = first[rows, None] + np.arange(k)[None, :]
+        v, f = _walls_with_openings(*(field[rows] for field in fields),
+                                    a[index], b[index], sill[index], head[index])
+        vertices.append(v)
+        faces.append(f + offset)
+        offset += len(v)
+
+    logger.info(f"Wall mesh: {len(walls)} walls, {int(cut.sum())} openings cut")
+    return np.concatenate(vertices), np.concatenate(faces)
+
+
+def _walls_with_openings(start: np.ndarray, end: np.ndarray, thickness: np.ndarray, height: np.ndarray,
+                         trim: np.ndarray, a: np.ndarray, b: np.ndarray,
+                         sill: np.ndarray, head: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Walls that all have k openings: (n, k) spans sorted along each wall"""
+    n, k = a.shape
+    # Overlapping openings: each starts no earlier than the previous ones end
+    if k > 1:
+        a = np.concatenate([a[:, :1], np.maximum(a[:, 1:], np.maximum.accumulate(b, axis=1)[:, :-1])], axis=1)
+        b = np.maximum(a, b)
+
+    start, end = start[:, :2], end[:, :2]
+    delta = end - start
+    length = np.hypot(delta[:, 0], delta[:, 1])
+    d = delta / np.maximum(length, _EPS)[:, None]
+    half = np.stack([-d[:, 1], d[:, 0]], axis=1) * (thickness / 2)[:, None]
+
+    # Cuts along the wall per face (side 0 = left, 1 = right): the trimmed ends, and the
+    # opening sides in between, the same on both faces
+    spans = np.stack([a, b], axis=2).reshape(n, 2 * k)
+    cuts = np.concatenate([trim[:, None, 0], np.repeat(spans[:, :, None], 2, axis=2),
+                           length[:, None, None] - trim[:, None, 1]], axis=1)
+    left = start[:, None] + d[:, None] * cuts[:, :, 0, None] + half[:, None]
+    right = start[:, None] + d[:, None] * cuts[:, :, 1, None] - half[:, None]
+    # (n, 2k + 1, 4, 2) slice footprints
+    footprint = np.stack([right[:, :-1], right[:, 1:], left[:, 1:], left[:, :-1]], axis=2)
+    width = np.maximum(cuts[:, 1:, 0] - cuts[:, :-1, 0], cuts[:, 1:, 1] - cuts[:, :-1, 1])
+
+    # Prisms: k + 1 piers, then below-sill, jamb void and above-head per opening
+    zero = np.zeros((n, k))
+    full = np.broadcast_to(height[:, None], (n, k))
+    piers, gaps = slice(0, None, 2), slice(1, None, 2)
+    prism_footprint = np.concatenate([footprint[:, piers]] + [footprint[:, gaps]] * 3, axis=1)
+    prism_width = np.concatenate([width[:, piers]] + [width[:, gaps]] * 3, axis=1)
+    bottom = np.concatenate([np.zeros((n, k + 1)), zero, sill, head], axis=1)
+    top = np.concatenate([np.repeat(height[:, None], k + 1, axis=1), sill, head, full], axis=1)
+
+    # Piers close the wall ends; a void shows a jamb where a pier stands beside it, and
+    # where none does (opening flush with an end or with the next opening) the parts
+    # below and above close their own ends instead
+    solid = width[:, piers] > _EPS
+    below, voids, above = (slice(k + 1 + i * k, k + 1 + (i + 1) * k) for i in range(3))
+    sides = np.zeros((n, 4 * k + 1, 6), dtype=bool)
+    sides[:, :, [_BOTTOM, _TOP, _RIGHT, _LEFT]] = True
+    sides[:, 0, _NEAR] = True
+    sides[:, k, _FAR] = True
+    for part in (below, above):
+        sides[:, part, _NEAR] = ~solid[:, :-1]
+        sides[:, part, _FAR] = ~solid[:, 1:]
+    sides[:, voids] = False
+    sides[:, voids, _NEAR] = solid[:, :-1]
+    sides[:, voids, _FAR] = solid[:, 1:]
+    flip = np.zeros((n, 4 * k + 1), dtype=bool)
+    flip[:, voids] = True
+
+    keep = (top - bottom > _EPS) & (prism_width > _EPS)
+    prism_footprint, bottom, top, sides, flip = (
+        prism_footprint[keep], bottom[keep], top[keep], sides[keep], flip[keep])
+
+    m = len(prism_footprint)
+    xy = np.concatenate([prism_footprint, prism_footprint], axis=1)
+    z = np.concatenate([np.repeat(bottom[:, None], 4, axis=1), np.repeat(top[:, None], 4, axis=1)], axis=1)
+    vertices = np.concatenate([xy, z[..., None]], axis=2).reshape(-1, 3)
+
+    # Selected sides of every prism, wound inward for the voids
+    prism, side = np.nonzero(sides)
+    triangles = _PRISM_SIDES[side]
+    reverse = flip[prism]
+    triangles[reverse] = triangles[reverse, :, ::-1]
+    faces = (triangles + 8 * prism[:, None, None]).reshape(-1, 3)
+    return vertices, faces
@@ -0,0 +1,253 @@
+"""
+Layout Masking: find the drawable part of a sheet before detection, OCR and LLM analysis
+"""
+
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+BBox = Tuple[int, int, int, int]
+
+
+class LayoutMask:
+    """
+    Block-resolution masks of a sheet.
+    `drawable` is the drawing itself (no frame, title block or isolated notes);
+    `nonblank` is anything with ink, title block included (scale notes live there).
+    """
+
+    def __init__(self, drawable: np.ndarray, nonblank: np.ndarray, cell_size: float, shape: Tuple[int, int], seconds: float):
+        self.drawable = drawable
+        self.nonblank = nonblank
+        self.cell_size = cell_size  # full-resolution pixels per mask cell
+        self.shape = shape
+        self.seconds = seconds
+
+    @classmethod
+    def full(cls, shape: Tuple[int, int]) -> "LayoutMask":
+        """Mask that keeps everything (masking disabled or inconclusive)"""
+        ones = np.ones((1, 1), dtype=bool)
+        return cls(ones, ones, float(max(shape)), shape, 0.0)
+
+    @property
+    def drawable_fraction(self) -> float:
+        return float(self.drawable.mean()) if self.drawable.size else 1.0
+
+    def tile_fractions(self, tiles: np.ndarray) -> np.ndarray:
+        """Drawable fraction of each x0, y0, x1, y1 region, via an integral image"""
+        grid = self.drawable.astype(np.int64)
+        integral = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int64)
+        integral[1:, 1:] = grid.cumsum(0).cumsum(1)
+
+        cells = np.asarray(tiles, dtype=np.float64) / self.cell_size
+        cx0 = np.clip(np.floor(cells[:, 0]).astype(np.int64), 0, grid.shape[1])
+        cy0 = np.clip(np.floor(cells[:, 1]).astype(np.int64), 0, grid.shape[0])
+        cx1 = np.clip(np.ceil(cells[:, 2]).astype(np.int64), 0, grid.shape[1])
+        cy1 = np.clip(np.ceil(cells[:, 3]).astype(np.int64), 0, grid.shape[0])
+
+        sums = integral[cy1, cx1] - integral[cy0, cx1] - integral[cy1, cx0] + integral[cy0, cx0]
+        areas = np.maximum((cx1 - cx0) * (cy1 - cy0), 1)
+        return sums / areas
+
+    def bbox(self, which: str = "drawable") -> Optional[BBox]:
+        """Full-resolution bounding box of the drawable (or non-blank) cells"""
+        grid = self.drawable if which == "drawable" else self.nonblank
+        rows = np.flatnonzero(grid.any(axis=1))
+        cols = np.flatnonzero(grid.any(axis=0))
+        if rows.size == 0:
+            return None
+        h, w = self.shape
+        return (
+            int(cols[0] * self.cell_size), int(rows[0] * self.cell_size),
+            min(w, int(np.ceil((cols[-1] + 1) * self.cell_size))),
+            min(h, int(np.ceil((rows[-1] + 1) * self.cell_size)))
+        )
+
+
+class LayoutMasker:
+    """Ink density (integral image) + connected components + frame/title-block heuristics"""
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_LAYOUT_MASK", "true").lower() == "true"
+        self.max_side = int(os.getenv("LAYOUT_MASK_MAX_SIDE", 1024))
+        self.block = int(os.getenv("LAYOUT_MASK_BLOCK", 8))
+        self.ink_threshold = 240     # grey level below which a (downsampled) pixel counts as ink
+        self.min_density = 0.01      # ink fraction for a block to be non-blank
+        self.min_component = 0.02    # drawing components smaller than this share of the largest are notes
+        self.frame_band = 0.08       # frame lines are searched within this share of each edge
+        self.title_zone = 0.35       # title blocks sit in the right/bottom share of the sheet
+        self.rule_length = 0.9       # a title strip's rule runs unbroken over this share of the sheet height
+        self.glyph_height = 0.03     # text components are at most this share of the sheet height
+
+    def compute(self, image: np.ndarray) -> LayoutMask:
+        h, w = image.shape[:2]
+        if not self.enabled:
+            return LayoutMask.full((h, w))
+
+        started = time.monotonic()
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        scale = min(1.0, self.max_side / max(h, w))
+        if scale < 1.0:
+            # INTER_AREA averages, so thin lines survive as grey instead of vanishing
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        ink = (gray < self.ink_threshold).astype(np.uint8)
+
+        keep = np.zeros_like(ink, dtype=bool)
+        top, bottom, left, right = self._frame(ink)
+        keep[top:bottom, left:right] = True
+        title = self._title_block(ink[top:bottom, left:right])
+        if title is not None:
+            x0, y0, x1, y1 = title
+            keep[top + y0:top + y1, left + x0:left + x1] = False
+
+        nonblank = self._block_density(ink) >= self.min_density
+        occupied = self._block_density(ink * keep) >= self.min_density
+        drawable = self._drawing_components(occupied)
+
+        seconds = time.monotonic() - started
+        if not drawable.any():
+            logger.warning("Layout mask found no drawable region - processing the whole sheet")
+            return LayoutMask.full((h, w))
+
+        mask = LayoutMask(drawable, nonblank, self.block / scale, (h, w), seconds)
+        logger.info(f"Layout mask: {mask.drawable_fraction:.0%} of sheet drawable "
+                   f"(title block {'found' if title else 'not found'}, {seconds * 1000:.0f} ms)")
+        return mask
+
+    def _frame(self, ink: np.ndarray) -> Tuple[int, int, int, int]:
+        """Crop inside sheet border lines: near-solid rows/cols close to each edge"""
+        sh, sw = ink.shape
+        row_frac = ink.mean(axis=1)
+        col_frac = ink.mean(axis=0)
+        band_h = max(1, int(sh * self.frame_band))
+        band_w = max(1, int(sw * self.frame_band))
+
+        def inner_edge(frac, band, from_end):
+            idx = np.flatnonzero(frac[-band:] > 0.5) if from_end else np.flatnonzero(frac[:band] > 0.5)
+            if idx.size == 0:
+                return None
+            return len(frac) - band + idx.min() if from_end else idx.max() + 1
+
+        top = inner_edge(row_frac, band_h, False) or 0
+        bottom = inner_edge(row_frac, band_h, True) or sh
+        left = inner_edge(col_frac, band_w, False) or 0
+        right = inner_edge(col_frac, band_w, True) or sw
+        return top, bottom, left, right
+
+    def _title_block(self, ink: np.ndarray) -> Optional[BBox]:
+        """
+        Right-hand title strip, or a boxed title block in the bottom-right corner.
+        Either must hold text cells: a dense wall or hatching at the edge of the plan
+        also makes inky columns, but not rows of small separate glyphs.
+        """
+        sh, sw = ink.shape
+        if sh < 4 or sw < 4:
+            return None
+
+        # Vertical strip: an unbroken rule over nearly the full height in the right zone
+        zone_x = int(sw * (1 - self.title_zone))
+        rules = np.flatnonzero(_longest_runs(ink[:, zone_x:]) >= self.rule_length * sh)
+        if rules.size:
+            # Adjacent columns are one (thick) rule
+            breaks = np.flatnonzero(np.diff(rules) > 1)
+            for first, last in zip(rules[np.r_[0, breaks + 1]], rules[np.r_[breaks, rules.size - 1]]):
+                x0, x1 = zone_x + int(first), zone_x + int(last) + 1
+                if self._text_cells(ink[:, x1:]):
+                    return (x0, 0, sw, sh)
+
+        # Corner box: rows whose trailing ink run reaches the right edge, closed by a vertical rule
+        zone_y = int(sh * (1 - self.title_zone))
+        rows = ink[zone_y:, ::-1] == 0
+        trailing = np.where(rows.any(axis=1), rows.argmax(axis=1), sw)
+        candidates = np.flatnonzero(trailing >= 0.15 * sw)
+        if candidates.size == 0:
+            return None
+
+        y0 = zone_y + int(candidates.min())
+        x0 = sw - int(trailing[candidates.min()])
+        if ink[y0:, x0:x0 + 2].mean() > 0.5 and self._text_cells(ink[y0:, x0 + 2:], sh):
+            return (x0, y0, sw, sh)
+        return None
+
+    def _text_cells(self, region: np.ndarray, sheet_height: Optional[int] = None) -> bool:
+        """Whether a region reads as title-block cells: many small glyphs spread down it"""
+        rh, rw = region.shape
+        if rh < 4 or rw < 4:
+            return False
+        count, _, stats, _ = cv2.connectedComponentsWithStats(region.astype(np.uint8), connectivity=8)
+        if count <= 1:
+            return False
+        top, width, height, area = (stats[1:, k] for k in
+                                    (cv2.CC_STAT_TOP, cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT, cv2.CC_STAT_AREA))
+        # Glyphs: short components narrower than a cell (rules and hatch strokes are long)
+        glyph = (height >= 2) & (height <= self.glyph_height * (sheet_height or rh)) & (width <= rw / 2)
+        bands = np.unique(top[glyph] * 8 // rh).size
+        return glyph.sum() >= 8 and bands >= 3 and area[glyph].sum() >= 0.25 * area.sum()
+
+    def _block_density(self, ink: np.ndarray) -> np.ndarray:
+        """Ink fraction per block from one integral image"""
+        sh, sw = ink.shape
+        b = self.block
+        ys = np.minimum(np.arange(0, sh + b, b), sh)
+        xs = np.minimum(np.arange(0, sw + b, b), sw)
+        ys, xs = np.unique(ys), np.unique(xs)
+
+        integral = cv2.integral(ink)
+        sums = (integral[ys[1:, None], xs[None, 1:]] - integral[ys[:-1, None], xs[None, 1:]]
+                - integral[ys[1:, None], xs[None, :-1]] + integral[ys[:-1, None], xs[None, :-1]])
+        areas = (ys[1:] - ys[:-1])[:, None] * (xs[1:] - xs[:-1])[None, :]
+        return sums / np.maximum(areas, 1)
+
+    def _drawing_components(self, occupied: np.ndarray) -> np.ndarray:
+        """Keep the large connected drawing regions and fill their enclosed whitespace"""
+        closed = cv2.morphologyEx(occupied.astype(np.uint8), cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(closed, connectivity=8)
+        if count <= 1:
+            return np.zeros_like(occupied, dtype=bool)
+
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        kept = np.flatnonzero(areas >= self.min_component * areas.max()) + 1
+        drawing = np.isin(labels, kept).astype(np.uint8)
+
+        # Room interiors are blank but belong to the drawing: fill holes by flooding from outside
+        padded = np.pad(drawing, 1)
+        flood = padded.copy()
+        ff_mask = np.zeros((padded.shape[0] + 2, padded.shape[1] + 2), np.uint8)
+        cv2.floodFill(flood, ff_mask, (0, 0), 1)
+        holes = flood[1:-1, 1:-1] == 0
+        return drawing.astype(bool) | holes
+
+
+def _longest_runs(ink: np.ndarray) -> np.ndarray:
+    """Longest unbroken vertical run of ink in each column"""
+    filled = ink.astype(bool)
+    count = np.cumsum(filled, axis=0)
+    last_gap = np.maximum.accumulate(np.where(filled, 0, count), axis=0)
+    return (count - last_gap).max(axis=0)
+
+
+# Global instance
+layout_masker = LayoutMasker()
+
+
+def get_layout_mask(image_data: Dict) -> LayoutMask:
+    """Compute the mask once per page and share it between stages"""
+    mask = image_data.get("layout_mask")
+    if mask is None:
+        mask = layout_masker.compute(image_data["image"])
+        image_data["layout_mask"] = mask
+    return mask
+
+
+def crop_to_region(image_data: Dict, which: str = "drawable") -> np.ndarray:
+    """Crop the page image to the drawable (or non-blank) bounding box"""
+    image = image_data["image"]
+    bbox = get_layout_mask(image_data).bbox(which)
+    if bbox is None:
+        return image
+    x0, y0, x1, y1 = bbox
+    return image[y0:y1, x0:x1]
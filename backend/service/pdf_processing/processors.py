@@ -9,6 +9,27 @@ import gc
 from typing import Dict, List, Any
 from loguru import logger
 
+from backend.service.geometry.transforms import PageFrames
+
+
+def extract_text_spans(page) -> List[Dict[str, Any]]:
+    """Text spans of a page with their bbox in PDF points"""
+    spans = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] == 0:  # Text block
+            for line in block["lines"]:
+                for span in line["spans"]:
+                    if not span["text"].strip():
+                        continue
+                    spans.append({
+                        "text": span["text"],
+                        "bbox": span["bbox"],
+                        "size": span["size"],
+                        "font": span["font"]
+                    })
+    return spans
+
+
 class VectorProcessor:
     """Track A: Extract precise vector geometry"""
     
@@ -42,17 +63,7 @@ class VectorProcessor:
                 vector_data["paths"].append(simplified)
                 
             # Extract text for semantic context
-            text_blocks = page.get_text("dict")["blocks"]
-            for block in text_blocks:
-                if block["type"] == 0:  # Text block
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            vector_data["text"].append({
-                                "text": span["text"],
-                                "bbox": span["bbox"],
-                                "size": span["size"],
-                                "font": span["font"]
-                            })
+            vector_data["text"] = extract_text_spans(page)
             
             logger.info(f"Extracted {len(vector_data['paths'])} paths, {len(vector_data['text'])} text blocks")
             return vector_data
@@ -114,7 +125,7 @@ class StreamingProcessor:
                 "image": img_array.copy(),  # Copy to detach from pixmap
                 "width": pix.width,
                 "height": pix.height,
-                "dpi": dpi
+                **PageFrames.from_page(page, dpi / 72.0).to_dict()
             }
             
             # Clean up pixmap
@@ -11,6 +11,8 @@ from typing import Dict, Optional
 from loguru import logger
 from async_timeout import timeout
 
+from backend.service.geometry.transforms import PageFrames
+
 class SecurityError(Exception):
     pass
 
@@ -67,16 +69,20 @@ class SecurePDFRenderer:
         if safe_dpi is None:
             # Even minimum DPI would exceed limits - MUST tile
             logger.warning("🔴 Page too large even at 72 DPI - mandatory tiling required")
-            return {"method": "mandatory_tiling", "page": page, "dpi": 72}
+            return self._context("mandatory_tiling", page, 72)
         
         # LAYER 5: Pre-render memory check
         estimated_memory_mb = self._estimate_memory(page, safe_dpi)
         if estimated_memory_mb > self.MAX_MEMORY_MB:
             logger.warning(f"⚠️ Estimated {estimated_memory_mb:.1f}MB > {self.MAX_MEMORY_MB}MB - forcing tiles")
-            return {"method": "mandatory_tiling", "page": page, "dpi": safe_dpi}
+            return self._context("mandatory_tiling", page, safe_dpi)
         
         # Safe to direct render
-        return {"method": "direct", "page": page, "dpi": safe_dpi}
+        return self._context("direct", page, safe_dpi)
+
+    def _context(self, method: str, page, dpi: int) -> Dict:
+        """Render strategy plus the page's coordinate frames at the DPI actually chosen"""
+        return {**PageFrames.from_page(page, dpi / 72.0).to_dict(), "method": method, "page": page, "dpi": dpi}
 
     def _calculate_forced_dpi(self, page) -> Optional[int]:
         """Calculate DPI that MUST fit within limits"""
@@ -0,0 +1,169 @@
+"""
+Semantic Analysis Cache: reuse Stage 4 LLM answers for sheets that have been analysed before
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+# Element positions are compared on this pixel grid, so re-detections that
+# shift a box by a few pixels still hit
+SUMMARY_GRID_PX = 8
+
+
+def detection_summary(detected_elements: Dict, scale_info: Dict) -> Dict:
+    """What the analysis depends on besides the image: counts, ids and quantised positions"""
+    summary = {"scale": scale_info.get("scale_string")}
+    for kind in ("walls", "doors", "windows", "rooms"):
+        elements = detected_elements.get(kind, [])
+        positions = [e.get("bbox") or e.get("center") or [] for e in elements]
+        summary[kind] = {
+            "ids": [e.get("id", i) for i, e in enumerate(elements)],
+            "positions": [np.round(np.asarray(p, dtype=np.float64) / SUMMARY_GRID_PX).astype(int).tolist() for p in positions]
+        }
+    # Rooms already named from the text layer change what the model is asked
+    summary["resolved_rooms"] = [r.get("id") for r in detected_elements.get("rooms", []) if r.get("resolved")]
+    # So do elements the semantic cascade resolved from geometry
+    summary["resolved_elements"] = {
+        kind: [e.get("id", i) for i, e in enumerate(detected_elements.get(kind, [])) if e.get("resolved")]
+        for kind in ("walls", "doors", "windows")
+    }
+    return summary
+
+
+class SemanticAnalysisCache:
+    """
+    SQLite store of parsed Stage 4 analyses.
+    Keys cover the prepared images, the detection summary, the prompt version and the
+    model id; entries expire after a TTL and the least recently used go first once the
+    store is over its size limit.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_SEMANTIC_CACHE", "true").lower() == "true"
+        self.path = Path(os.getenv("SEMANTIC_CACHE_PATH", "data/cache/semantic_analysis.sqlite3"))
+        self.ttl_s = float(os.getenv("SEMANTIC_CACHE_TTL_HOURS", 24 * 30)) * 3600
+        self.max_bytes = int(float(os.getenv("SEMANTIC_CACHE_MAX_MB", 256)) * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def key(self, images: List, summary: Dict, prompt_version: str, model_id: str) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{model_id}\n{prompt_version}\n".encode())
+        h.update(json.dumps(summary, sort_keys=True).encode())
+        for image in images:
+            pixels = np.asarray(image)
+            h.update(str(pixels.shape).encode())
+            # Drop the low 4 bits: re-rendered or recompressed copies of a sheet hash alike
+            h.update(np.ascontiguousarray(pixels >> 4).data)
+        return h.hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        try:
+            value = await asyncio.to_thread(self._get_sync, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Semantic cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    async def put(self, key: str, model_id: str, analysis: Dict):
+        if not self.enabled:
+            return
+        try:
+            await asyncio.to_thread(self._put_sync, key, model_id, analysis)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist semantic cache entry: {e}")
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        entries, size = 0, 0
+        if self.enabled:
+            try:
+                with self._lock:
+                    entries, size = self._connection().execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analyses"
+                    ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Semantic cache stats failed: {e}")
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "size_bytes": size
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "key TEXT PRIMARY KEY, model TEXT, created REAL, accessed REAL, size INTEGER, value TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS analyses_accessed ON analyses (accessed)")
+        return self._conn
+
+    def _get_sync(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value FROM analyses WHERE key = ? AND created > ?", (key, now - self.ttl_s)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE analyses SET accessed = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0])
+
+    def _put_sync(self, key: str, model_id: str, analysis: Dict):
+        now = time.time()
+        value = json.dumps(analysis)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, model, created, accessed, size, value) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_id, now, now, len(value), value)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Expired entries first, then least recently used until under the size limit"""
+        conn.execute("DELETE FROM analyses WHERE created <= ?", (now - self.ttl_s,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analyses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM analyses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug(f"Semantic cache: evicted {evicted} least recently used entries")
+
+
+# Global instance: one SQLite connection per process
+semantic_cache = SemanticAnalysisCache()
@@ -0,0 +1,161 @@
+"""
+Element Stream: apply Stage 4 answers element by element while the LLM is still generating
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from backend.api.websocket import manager as ws_manager
+from backend.service.semantic.room_naming import merge_element_analysis, merge_room_analysis
+
+STREAMED_KINDS = ("walls", "doors", "windows", "rooms")
+
+ElementCallback = Callable[[str, Dict], Awaitable]
+
+
+class ValidatedElementParser:
+    """
+    Incremental scanner over streamed JSON text. Tracks only nesting, strings and keys,
+    and returns each `validated_elements.<kind>[i]` object as soon as its closing brace
+    arrives; the rest of the document is skipped over without being parsed.
+    """
+
+    def __init__(self):
+        self.stack: List[Tuple[str, Optional[str]]] = []  # (opening bracket, key it sits under)
+        self.in_string = False
+        self.escape = False
+        self.string: List[str] = []
+        self.last_string: Optional[str] = None
+        self.key: Optional[str] = None
+        self.capture: Optional[List[str]] = None
+        self.capture_kind: Optional[str] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Dict]]:
+        completed = []
+        for ch in text:
+            if self.capture is not None:
+                self.capture.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self.last_string = "".join(self.string)
+                else:
+                    self.string.append(ch)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string = []
+            elif ch == ":":
+                self.key = self.last_string
+            elif ch == ",":
+                self.key = None
+            elif ch in "{[":
+                in_object = bool(self.stack) and self.stack[-1][0] == "{"
+                self.stack.append((ch, self.key if in_object else None))
+                self.key = None
+                kind = self._item_kind()
+                if ch == "{" and self.capture is None and kind is not None:
+                    self.capture, self.capture_kind = ["{"], kind
+            elif ch in "}]" and self.stack:
+                if self.capture is not None and len(self.stack) == 4:
+                    entry = self._parse("".join(self.capture))
+                    if entry is not None:
+                        completed.append((self.capture_kind, entry))
+                    self.capture, self.capture_kind = None, None
+                self.stack.pop()
+        return completed
+
+    def _item_kind(self) -> Optional[str]:
+        """Kind of list the object just opened is an item of, if it is {validated_elements: {kind: [item]}}"""
+        if len(self.stack) != 4:
+            return None
+        _, container, (bracket, kind), _ = self.stack
+        if container[1] != "validated_elements" or bracket != "[" or kind not in STREAMED_KINDS:
+            return None
+        return kind
+
+    @staticmethod
+    def _parse(text: str) -> Optional[Dict]:
+        try:
+            entry = json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.debug(f"Skipping malformed streamed entry {text[:80]!r}: {e}")
+            return None
+        return entry if isinstance(entry, dict) else None
+
+
+class ElementStream:
+    """
+    Feeds LLM text through the parser and merges every completed entry into the detected
+    elements right away (same id rules as the final merge), then hands the enriched element
+    to an optional async callback, e.g. the job's progress channel.
+    """
+
+    def __init__(self, detected_elements: Dict, on_element: Optional[ElementCallback] = None):
+        self.on_element = on_element
+        self.parser = ValidatedElementParser()
+        self._index = {
+            kind: {e.get("id", i): e for i, e in enumerate(detected_elements.get(kind, []))}
+            for kind in STREAMED_KINDS
+        }
+        self._applied = set()
+        self._tasks: List[asyncio.Future] = []
+        self.started = time.monotonic()
+        self.first_element_s: Optional[float] = None
+
+    def feed(self, text: str):
+        for kind, entry in self.parser.feed(text):
+            self._apply(kind, entry, streamed=True)
+
+    def replay(self, analysis: Dict):
+        """Apply whatever the stream didn't deliver: a cached answer, or entries the parser missed"""
+        validated = analysis.get("validated_elements", {})
+        for kind in STREAMED_KINDS:
+            for entry in validated.get(kind, []):
+                if isinstance(entry, dict):
+                    self._apply(kind, entry, streamed=False)
+
+    async def finish(self) -> int:
+        """Wait for callbacks still running (failures are logged, not raised); returns elements applied"""
+        results = await asyncio.gather(*self._tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Streamed element callback failed: {result}")
+        if self.first_element_s is not None:
+            logger.info(f"Streamed {len(self._applied)} enriched elements, first after {self.first_element_s:.1f}s")
+        return len(self._applied)
+
+    def _apply(self, kind: str, entry: Dict, streamed: bool):
+        element = self._index[kind].get(entry.get("id"))
+        if element is None or element.get("resolved") or (kind, entry.get("id")) in self._applied:
+            return
+        if kind == "rooms":
+            merge_room_analysis([element], [entry])
+        else:
+            merge_element_analysis([element], [entry])
+        self._applied.add((kind, entry.get("id")))
+        if streamed and self.first_element_s is None:
+            self.first_element_s = time.monotonic() - self.started
+        if self.on_element is not None:
+            self._tasks.append(asyncio.ensure_future(self.on_element(kind, element)))
+
+
+def websocket_progress(job_id: str) -> ElementCallback:
+    """Callback that pushes each enriched element to the job's WebSocket clients"""
+    async def send(kind: str, element: Dict):
+        await ws_manager.send_progress(job_id, {
+            "stage": "semantic_analysis",
+            "element_type": kind,
+            "element": element
+        })
+    return send
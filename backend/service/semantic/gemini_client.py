@@ -0,0 +1,196 @@
+"""
+Gemini Client: non-blocking Gemini calls with a process-wide concurrency limit,
+per-call deadlines and jittered retries on rate limits and server errors
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+import numpy as np
+from google import genai
+from google.genai import errors, types
+from loguru import logger
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiTimeout(Exception):
+    """The call timed out on every attempt, or ran out of deadline waiting, calling or backing off"""
+
+
+class GeminiLimiter:
+    """In-flight cap and latency metrics for every Gemini call in the process"""
+
+    def __init__(self, window: int = 2048):
+        self.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+
+        self.latencies_ms = deque(maxlen=window)
+        self.queue_ms = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.timeouts = 0
+
+    async def acquire(self, timeout: float):
+        """Wait for a free slot, but no longer than the caller's remaining deadline"""
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(timeout, 0))
+        finally:
+            self.waiting -= 1
+        self.queue_ms.append((time.monotonic() - started) * 1000)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def record(self, latency_s: float, ok: bool):
+        self.calls += 1
+        self.latencies_ms.append(latency_s * 1000)
+        if not ok:
+            self.failures += 1
+
+    def stats(self) -> Dict:
+        latencies = np.asarray(self.latencies_ms, dtype=np.float64)
+        queued = np.asarray(self.queue_ms, dtype=np.float64)
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+            "p95_ms": float(np.percentile(latencies, 95)) if latencies.size else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies.size else 0.0,
+            "p95_queue_ms": float(np.percentile(queued, 95)) if queued.size else 0.0
+        }
+
+
+# Global instance: the concurrency cap only holds if every call goes through it
+gemini_limiter = GeminiLimiter()
+
+
+class GeminiClient:
+    """
+    Async wrapper around google-genai (`client.aio`), so a Gemini round trip never blocks the
+    event loop. GEMINI_BASE_URL points it at another endpoint, e.g. a local fake server.
+    """
+
+    def __init__(self, api_key: str, model_id: str):
+        self.model_id = model_id
+        # Whole call, including queueing for a slot and every retry
+        self.deadline_s = float(os.getenv("GEMINI_DEADLINE_S", 180))
+        self.attempt_timeout_s = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT_S", 90))
+        self.max_attempts = int(os.getenv("GEMINI_MAX_ATTEMPTS", 4))
+        self.backoff_base_s = float(os.getenv("GEMINI_BACKOFF_BASE_S", 1.0))
+        self.backoff_max_s = float(os.getenv("GEMINI_BACKOFF_MAX_S", 20))
+
+        base_url = os.getenv("GEMINI_BASE_URL")
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        if base_url:
+            logger.info(f"Gemini endpoint: {base_url}")
+
+    async def generate_content(self, contents: Any, config: Optional[types.GenerateContentConfig] = None):
+        """
+        generate_content with the process-wide concurrency cap, a deadline and retries.
+
+        Raises:
+            GeminiTimeout: if the last attempt timed out
+            errors.APIError: for non-retryable API errors, or the last retryable one
+        """
+        return await self._with_retries(
+            lambda: self.client.aio.models.generate_content(model=self.model_id, contents=contents, config=config)
+        )
+
+    async def generate_content_stream(
+        self,
+        contents: Any,
+        config: Optional[types.GenerateContentConfig] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, Any]:
+        """
+        Streamed generate_content: `on_text` gets each piece of text as it arrives.
+        Retried like generate_content, but only until the first piece has been handed on.
+
+        Returns:
+            (full text, usage metadata of the last chunk)
+        """
+        emitted = []
+
+        async def consume():
+            parts, usage = [], None
+            async for chunk in await self.client.aio.models.generate_content_stream(
+                model=self.model_id, contents=contents, config=config
+            ):
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    emitted.append(True)
+                    if on_text is not None:
+                        on_text(text)
+            return "".join(parts), usage
+
+        return await self._with_retries(consume, retry_allowed=lambda: not emitted)
+
+    async def _with_retries(self, request: Callable[[], Awaitable], retry_allowed: Callable[[], bool] = lambda: True):
+        started = time.monotonic()
+        deadline = started + self.deadline_s
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self._attempt(request, deadline)
+                gemini_limiter.record(time.monotonic() - started, ok=True)
+                return response
+            except Exception as e:
+                retryable = self._retryable(e) and retry_allowed()
+                delay = self._backoff(attempt)
+                if not retryable or attempt >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    gemini_limiter.record(time.monotonic() - started, ok=False)
+                    if isinstance(e, asyncio.TimeoutError):
+                        gemini_limiter.timeouts += 1
+                        raise GeminiTimeout(f"Gemini call timed out after {attempt} attempt(s)") from e
+                    raise
+                gemini_limiter.retries += 1
+                logger.warning(f"Gemini attempt {attempt} failed ({self._describe(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, request: Callable[[], Awaitable], deadline: float):
+        await gemini_limiter.acquire(deadline - time.monotonic())
+        try:
+            timeout = min(self.attempt_timeout_s, deadline - time.monotonic())
+            return await asyncio.wait_for(request(), timeout=max(timeout, 0))
+        finally:
+            gemini_limiter.release()
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform over [0, base * 2^(attempt-1)], capped"""
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, errors.APIError):
+            return error.code in RETRYABLE_STATUS
+        return isinstance(error, (asyncio.TimeoutError, httpx.TransportError, ConnectionError))
+
+    @staticmethod
+    def _describe(error: Exception) -> str:
+        if isinstance(error, errors.APIError):
+            return f"HTTP {error.code}"
+        if isinstance(error, asyncio.TimeoutError):
+            return "attempt timed out"
+        return type(error).__name__
@@ -0,0 +1,160 @@
+"""
+Image Preparation: fit page images to a vision-token budget before they reach Qwen or Gemini
+"""
+
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+from PIL import Image
+
+from backend.service.geometry.transforms import apply_affine, scale_matrix, translation_matrix
+from backend.service.pdf_processing.layout import get_layout_mask
+
+# Qwen2.5-VL: 14px ViT patches merged 2x2, so one token per 28x28 block
+QWEN_PATCH = 28
+# Gemini: images up to 384px on both sides cost one tile, larger ones are cut into 768px tiles
+GEMINI_SMALL_SIDE = 384
+GEMINI_TILE = 768
+GEMINI_TOKENS_PER_TILE = 258
+
+
+class PreparedImage:
+    """A resized (and possibly cropped) view of the page plus the mapping back to it"""
+
+    def __init__(self, image: Image.Image, origin: Tuple[int, int], scale: float, tokens: int):
+        self.image = image
+        self.origin = origin    # page-pixel position of the view's top-left corner
+        self.scale = scale      # view pixels per page pixel
+        self.tokens = tokens    # estimated vision tokens
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+
+    @property
+    def page_to_view(self) -> np.ndarray:
+        """3x3 affine from page pixels to this view's pixels"""
+        return scale_matrix(self.scale) @ translation_matrix(-self.origin[0], -self.origin[1])
+
+    def page_to_image(self, points) -> np.ndarray:
+        """Map page-pixel points into this view's pixel coordinates"""
+        return apply_affine(self.page_to_view, points)
+
+
+class ImagePreparer:
+    """Crop to the drawable region and downsample to each model's pixel budget"""
+
+    def __init__(self):
+        self.qwen_max_pixels = int(os.getenv("QWEN_MAX_PIXELS", 1280 * QWEN_PATCH * QWEN_PATCH))
+        self.qwen_min_pixels = int(os.getenv("QWEN_MIN_PIXELS", 256 * QWEN_PATCH * QWEN_PATCH))
+        self.gemini_max_pixels = int(os.getenv("GEMINI_MAX_PIXELS", 3 * GEMINI_TILE * 3 * GEMINI_TILE))
+        # drawable | nonblank | none
+        self.region = os.getenv("STAGE4_IMAGE_REGION", "drawable")
+        # Close-ups of rooms the overview is too coarse for
+        self.detail_crops = int(os.getenv("STAGE4_DETAIL_CROPS", 4))
+        self.detail_max_pixels = int(os.getenv("STAGE4_DETAIL_MAX_PIXELS", 512 * QWEN_PATCH * QWEN_PATCH))
+
+    def max_pixels(self, model: str) -> int:
+        return self.qwen_max_pixels if model == "qwen" else self.gemini_max_pixels
+
+    def target_size(self, width: int, height: int, model: str, max_pixels: Optional[int] = None) -> Tuple[int, int]:
+        """Output size within the pixel budget (Qwen sizes snap to 28px patches)"""
+        max_pixels = max_pixels or self.max_pixels(model)
+        if model == "qwen":
+            return self._qwen_smart_resize(width, height, max_pixels)
+
+        scale = min(1.0, math.sqrt(max_pixels / max(width * height, 1)))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+
+    def _qwen_smart_resize(self, width: int, height: int, max_pixels: int) -> Tuple[int, int]:
+        """Same rounding as the Qwen2.5-VL processor, so it won't resize again"""
+        p = QWEN_PATCH
+        h_bar = max(p, round(height / p) * p)
+        w_bar = max(p, round(width / p) * p)
+        if h_bar * w_bar > max_pixels:
+            beta = math.sqrt(height * width / max_pixels)
+            h_bar = max(p, math.floor(height / beta / p) * p)
+            w_bar = max(p, math.floor(width / beta / p) * p)
+        elif h_bar * w_bar < self.qwen_min_pixels:
+            beta = math.sqrt(self.qwen_min_pixels / (height * width))
+            h_bar = math.ceil(height * beta / p) * p
+            w_bar = math.ceil(width * beta / p) * p
+        return w_bar, h_bar
+
+    def estimate_tokens(self, width: int, height: int, model: str) -> int:
+        if model == "qwen":
+            return (width // QWEN_PATCH) * (height // QWEN_PATCH)
+        if width <= GEMINI_SMALL_SIDE and height <= GEMINI_SMALL_SIDE:
+            return GEMINI_TOKENS_PER_TILE
+        return math.ceil(width / GEMINI_TILE) * math.ceil(height / GEMINI_TILE) * GEMINI_TOKENS_PER_TILE
+
+    def prepare(self, image_data: Dict, model: str) -> PreparedImage:
+        """Overview of the (drawable part of the) page within the model's budget"""
+        image = image_data["image"]
+        bbox = None
+        if self.region in ("drawable", "nonblank"):
+            bbox = get_layout_mask(image_data).bbox(self.region)
+        if bbox is None:
+            bbox = (0, 0, image.shape[1], image.shape[0])
+        return self._view(image, bbox, model, self.max_pixels(model))
+
+    def prepare_details(self, image_data: Dict, bboxes: Sequence[Sequence[int]], model: str) -> List[PreparedImage]:
+        """High-resolution crops of specific page regions (e.g. rooms the overview can't resolve)"""
+        views = self.prepare_crops(image_data, list(bboxes)[:self.detail_crops], model, self.detail_max_pixels)
+        return [v for v in views if v is not None]
+
+    def prepare_crops(self, image_data: Dict, bboxes: Sequence[Sequence[int]], model: str,
+                      max_pixels: int) -> List[Optional[PreparedImage]]:
+        """One view per region with a 10% context margin (None where the region is degenerate)"""
+        image = image_data["image"]
+        h, w = image.shape[:2]
+        views = []
+        for x0, y0, x1, y1 in bboxes:
+            mx, my = (x1 - x0) * 0.1, (y1 - y0) * 0.1
+            box = (max(0, int(x0 - mx)), max(0, int(y0 - my)), min(w, int(x1 + mx)), min(h, int(y1 + my)))
+            if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+                views.append(None)
+                continue
+            views.append(self._view(image, box, model, max_pixels))
+        return views
+
+    def prepare_room_details(self, image_data: Dict, rooms: List[Dict], model: str) -> Tuple[List[PreparedImage], List[int]]:
+        """Close-ups of the largest rooms still unnamed after the text-layer join"""
+        pending = sorted(
+            (r for r in rooms if not r.get("resolved") and r.get("bbox")),
+            key=lambda r: r.get("area_sqm", 0), reverse=True
+        )[:self.detail_crops]
+        views, ids = [], []
+        for room in pending:
+            view = self.prepare_details(image_data, [room["bbox"]], model)
+            if view:
+                views += view
+                ids.append(room["id"])
+        return views, ids
+
+    def _view(self, image: np.ndarray, bbox, model: str, max_pixels: int) -> PreparedImage:
+        x0, y0, x1, y1 = bbox
+        crop = image[y0:y1, x0:x1]
+        width, height = self.target_size(x1 - x0, y1 - y0, model, max_pixels)
+        if (width, height) != (x1 - x0, y1 - y0):
+            # Resize the array before PIL sees it: INTER_AREA keeps thin lines legible
+            crop = cv2.resize(crop, (width, height), interpolation=cv2.INTER_AREA)
+        scale = width / max(x1 - x0, 1)
+        return PreparedImage(Image.fromarray(crop), (x0, y0), scale, self.estimate_tokens(width, height, model))
+
+
+def log_vision_call(model: str, images: List[PreparedImage], prompt_tokens: Optional[int], prefill_s: Optional[float], total_s: float):
+    """One line per LLM call: image sizes, token counts and timing"""
+    sizes = ", ".join(f"{v.size[0]}x{v.size[1]}" for v in images)
+    image_tokens = sum(v.tokens for v in images)
+    prefill = f", prefill {prefill_s:.1f}s" if prefill_s is not None else ""
+    logger.info(f"{model}: {len(images)} image(s) [{sizes}] ~{image_tokens} vision tokens, "
+               f"{prompt_tokens if prompt_tokens is not None else '?'} prompt tokens{prefill}, {total_s:.1f}s total")
+
+
+# Global instance
+image_preparer = ImagePreparer()
@@ -0,0 +1,424 @@
+"""
+JSON Constraint: schema-driven constrained decoding for local LLM output
+
+A small JSON Schema subset (object / array / string / integer / number / boolean / enum,
+with maxItems and maxLength) is checked character by character, so every generated
+token keeps the text a prefix of some valid document and generation ends the moment
+the root object closes.
+"""
+
+import json
+import math
+from typing import Dict, List, Optional, Sequence
+
+WHITESPACE = " \t\n\r"
+# At most one whitespace character between tokens: compact output, no indentation runs
+MAX_WHITESPACE_RUN = 1
+MAX_NUMBER_DIGITS = 12
+# Compact JSON with short keys and split digits averages ~2.7 characters per Qwen token
+CHARS_PER_TOKEN = 2.5
+
+
+def _enum_literals(schema: Dict) -> Optional[List[str]]:
+    if "enum" in schema:
+        return [json.dumps(v) for v in schema["enum"]]
+    if schema.get("type") == "boolean":
+        return ["true", "false"]
+    return None
+
+
+def min_value_chars(schema: Dict) -> int:
+    """Length of the shortest valid value for the schema (0 for an empty enum, which has none)"""
+    literals = _enum_literals(schema)
+    if literals is not None:
+        return min((len(v) for v in literals), default=0)
+    kind = schema.get("type")
+    if kind in ("object", "array", "string"):
+        return 2
+    return 1
+
+
+def max_value_chars(schema: Dict) -> int:
+    """Upper bound on the compact length of a valid value (one space after separators)"""
+    literals = _enum_literals(schema)
+    if literals is not None:
+        return max((len(v) for v in literals), default=0)
+    kind = schema.get("type")
+    if kind == "object":
+        return 2 + sum(len(name) + 6 + max_value_chars(sub) for name, sub in schema.get("properties", {}).items())
+    if kind == "array":
+        return 2 + schema.get("maxItems", 0) * (max_value_chars(schema.get("items", {})) + 2)
+    if kind == "string":
+        return schema.get("maxLength", 64) + 2
+    if kind == "integer" and "maximum" in schema:
+        return len(str(int(schema["maximum"])))
+    return MAX_NUMBER_DIGITS + 2
+
+
+def schema_token_budget(schema: Dict, cap: int) -> int:
+    """max_new_tokens sized to the largest document the schema allows, never above `cap`"""
+    return min(cap, math.ceil(max_value_chars(schema) / CHARS_PER_TOKEN) + 16)
+
+
+class JsonSchemaPrefix:
+    """
+    Incremental validator: is the text fed so far a prefix of a JSON document valid for the schema?
+
+    The state is a stack of frames [kind, schema, state, buf, extra]; `copy()` is cheap so
+    candidate tokens can be tried against a scratch copy and discarded.
+    """
+
+    def __init__(self, schema: Dict):
+        self.stack = [["doc", schema, "value", "", None]]
+        self.whitespace = 0
+
+    def copy(self) -> "JsonSchemaPrefix":
+        clone = JsonSchemaPrefix.__new__(JsonSchemaPrefix)
+        clone.stack = [frame.copy() for frame in self.stack]
+        clone.whitespace = self.whitespace
+        return clone
+
+    @property
+    def complete(self) -> bool:
+        return self.stack[0][2] == "done"
+
+    def feed(self, text: str) -> bool:
+        """Advance over `text`; False (with the state left undefined) if it breaks the schema"""
+        for ch in text:
+            if not self._feed_char(ch):
+                return False
+        return True
+
+    def remaining_chars(self) -> int:
+        """Fewest characters that still close the document from here"""
+        total = 0
+        top = len(self.stack) - 1
+        for depth, (kind, schema, state, buf, extra) in enumerate(self.stack):
+            # A value slot whose value hasn't started yet
+            awaiting = state == "value" and depth == top
+            if kind == "doc":
+                total += min_value_chars(schema) if awaiting else 0
+            elif kind == "object":
+                props = schema.get("properties", {})
+                if awaiting:
+                    total += min_value_chars(props[buf]) + 1
+                elif state in ("start", "after", "value"):
+                    total += 1
+                elif state == "colon":
+                    total += 2 + min_value_chars(props[buf])
+                elif state in ("key", "next"):
+                    prefix = buf if state == "key" else ""
+                    opened = 0 if state == "key" else 1
+                    total += opened + min(
+                        len(name) - len(prefix) + 2 + min_value_chars(sub)
+                        for name, sub in props.items() if name not in extra and name.startswith(prefix)
+                    ) + 1
+            elif kind == "array":
+                if state in ("start", "after", "value"):
+                    total += 1
+                else:
+                    total += min_value_chars(schema.get("items", {})) + 1
+            elif kind == "string":
+                total += 2 if state == "escape" else 1
+            elif kind == "enum":
+                total += min(len(v) - len(buf) for v in extra if v.startswith(buf))
+            elif kind == "number":
+                total += self._number_completion(buf, schema)
+        return total
+
+    def _feed_char(self, ch: str) -> bool:
+        while True:
+            frame = self.stack[-1]
+            kind, schema, state = frame[0], frame[1], frame[2]
+
+            if kind in ("string", "enum", "number"):
+                handled = self._feed_scalar(frame, ch)
+                if handled is not None:
+                    return handled
+                # A number (or an enum literal like 12 vs 120) ended on a delimiter:
+                # close it and let the parent frame take the character
+                continue
+
+            if ch in WHITESPACE:
+                if state == "done" or kind == "object" and state == "key":
+                    return False
+                self.whitespace += 1
+                return self.whitespace <= MAX_WHITESPACE_RUN
+            self.whitespace = 0
+
+            if kind == "doc":
+                return state == "value" and self._start_value(schema, ch)
+            if kind == "object":
+                return self._feed_object(frame, ch)
+            if kind == "array":
+                return self._feed_array(frame, ch)
+            return False
+
+    def _feed_object(self, frame: list, ch: str) -> bool:
+        _, schema, state, buf, seen = frame
+        props = schema.get("properties", {})
+        if state == "key":
+            if ch == '"':
+                if buf not in props or buf in seen:
+                    return False
+                frame[2], frame[4] = "colon", seen + (buf,)
+                return True
+            key = buf + ch
+            if not any(name.startswith(key) for name in props if name not in seen):
+                return False
+            frame[3] = key
+            return True
+        if state in ("start", "next") and ch == '"':
+            frame[2], frame[3] = "key", ""
+            return True
+        if state == "colon":
+            if ch != ":":
+                return False
+            frame[2] = "value"
+            return True
+        if state == "value":
+            return self._start_value(props[buf], ch)
+        if state == "after" and ch == ",":
+            if all(name in seen for name in props):
+                return False
+            frame[2] = "next"
+            return True
+        if state in ("start", "after") and ch == "}":
+            self._close_value()
+            return True
+        return False
+
+    def _feed_array(self, frame: list, ch: str) -> bool:
+        _, schema, state, _, count = frame
+        if state in ("start", "after") and ch == "]":
+            self._close_value()
+            return True
+        if state == "after":
+            if ch != "," or count >= schema.get("maxItems", math.inf):
+                return False
+            frame[2] = "next"
+            return True
+        # start / next: a new item
+        if count >= schema.get("maxItems", math.inf):
+            return False
+        frame[2], frame[4] = "value", count + 1
+        return self._start_value(schema.get("items", {}), ch)
+
+    def _feed_scalar(self, frame: list, ch: str) -> Optional[bool]:
+        """True / False for an accepted / rejected character, None if the scalar ended before it"""
+        kind, schema, state, buf, extra = frame
+        if kind == "string":
+            if state == "escape":
+                if ch not in '"\\/bfnrt':
+                    return False
+                frame[2], frame[4] = "chars", extra + 1
+                return extra + 1 <= schema.get("maxLength", math.inf)
+            if ch == '"':
+                self._close_value()
+                return True
+            if ch == "\\":
+                frame[2] = "escape"
+                return True
+            if ord(ch) < 0x20 or extra + 1 > schema.get("maxLength", math.inf):
+                return False
+            frame[4] = extra + 1
+            return True
+
+        if kind == "enum":
+            text = buf + ch
+            if any(v.startswith(text) for v in extra):
+                frame[3] = text
+                # A literal no other value extends is finished right away ("...", true, false)
+                if text in extra and not any(v != text and v.startswith(text) for v in extra):
+                    self._close_value()
+                return True
+            if buf in extra:
+                self._close_value()
+                return None
+            return False
+
+        # number
+        text = buf + ch
+        if self._number_prefix(text, schema.get("type") == "integer") and self._number_completion(text, schema) is not None:
+            frame[3] = text
+            return True
+        if not self._number_done(buf) or not self._in_range(buf, schema):
+            return False
+        self._close_value()
+        return None
+
+    def _start_value(self, schema: Dict, ch: str) -> bool:
+        literals = _enum_literals(schema)
+        if literals is not None:
+            self.stack.append(["enum", schema, "chars", "", tuple(literals)])
+            return self._feed_scalar(self.stack[-1], ch) is True
+        kind = schema.get("type")
+        if kind == "object" and ch == "{":
+            self.stack.append(["object", schema, "start", "", ()])
+            return True
+        if kind == "array" and ch == "[":
+            self.stack.append(["array", schema, "start", "", 0])
+            return True
+        if kind == "string" and ch == '"':
+            self.stack.append(["string", schema, "chars", "", 0])
+            return True
+        if kind in ("integer", "number") and self._number_prefix(ch, kind == "integer") \
+                and self._number_completion(ch, schema) is not None:
+            self.stack.append(["number", schema, "chars", ch, None])
+            return True
+        return False
+
+    def _close_value(self):
+        """Pop the finished value and move its parent past it"""
+        self.stack.pop()
+        parent = self.stack[-1]
+        parent[2] = "done" if parent[0] == "doc" else "after"
+
+    @staticmethod
+    def _number_prefix(text: str, integer: bool) -> bool:
+        body = text[1:] if text.startswith("-") else text
+        whole, dot, fraction = body.partition(".")
+        if (dot and integer) or not whole.isdigit() and (whole or dot):
+            return False
+        if len(whole) > 1 and whole[0] == "0" or len(whole) + len(fraction) > MAX_NUMBER_DIGITS:
+            return False
+        return not fraction or fraction.isdigit()
+
+    @staticmethod
+    def _number_completion(text: str, schema: Dict) -> Optional[int]:
+        """
+        Fewest characters that turn the number prefix `text` into a value within the schema's
+        minimum / maximum, or None if no continuation can (e.g. "13" under 100..119).
+        Appending k digits to a whole part w spans [w * 10^k, (w + 1) * 10^k - 1].
+        """
+        lo, hi = schema.get("minimum", -math.inf), schema.get("maximum", math.inf)
+        integer = schema.get("type") == "integer"
+        negative = text.startswith("-")
+        whole, dot, fraction = (text[1:] if negative else text).partition(".")
+
+        def reaches(a: float, b: float, open_end: bool = False) -> bool:
+            """Does the magnitude interval [a, b] (or [a, b) with open_end), signed as the prefix, meet [lo, hi]?"""
+            if negative:
+                return (-b < hi if open_end else -b <= hi) and -a >= lo
+            return a <= hi and (b > lo if open_end else b >= lo)
+
+        if dot:
+            # Fraction digits refine within [x, x + 10^-len]
+            x = float(whole + "." + (fraction or "0"))
+            if fraction and reaches(x, x):
+                return 0
+            if len(whole) + len(fraction) < MAX_NUMBER_DIGITS and reaches(x, x + 10.0 ** -len(fraction), open_end=True):
+                return 1
+            return None
+        if whole == "0":
+            if reaches(0, 0):
+                return 0
+            return 2 if not integer and reaches(0, 1, open_end=True) else None
+        if not whole:
+            # A bare "-": one digit or more
+            for n in range(1, MAX_NUMBER_DIGITS + 1):
+                if reaches(0 if n == 1 else 10 ** (n - 1), 10 ** n - 1):
+                    return n
+            return None
+
+        w = int(whole)
+        if reaches(w, w):
+            return 0
+        if not integer and reaches(w, w + 1, open_end=True):
+            return 2
+        for k in range(1, MAX_NUMBER_DIGITS - len(whole) + 1):
+            if reaches(w * 10 ** k, (w + 1) * 10 ** k - (1 if integer else 0), open_end=not integer):
+                return k
+        return None
+
+    @staticmethod
+    def _number_done(text: str) -> bool:
+        body = text[1:] if text.startswith("-") else text
+        whole, dot, fraction = body.partition(".")
+        return whole.isdigit() and (not dot or fraction.isdigit())
+
+    @staticmethod
+    def _in_range(text: str, schema: Dict) -> bool:
+        value = float(text)
+        return schema.get("minimum", -math.inf) <= value <= schema.get("maximum", math.inf)
+
+
+class JsonSchemaLogitsProcessor:
+    """
+    Greedy constrained decoding: each step keeps only the best-scoring token that leaves
+    the output a valid prefix that can still be closed within the token budget, and forces
+    EOS once the document is complete.
+
+    Assumes batch size 1 (the Qwen service generates one request at a time).
+    """
+
+    def __init__(
+        self,
+        schema: Dict,
+        token_texts: Sequence[str],
+        eos_token_ids: Sequence[int],
+        prompt_length: int,
+        max_new_tokens: int,
+        top_k: int = 64
+    ):
+        self.state = JsonSchemaPrefix(schema)
+        self.token_texts = token_texts
+        self.eos_token_ids = list(eos_token_ids)
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+        self.top_k = top_k
+        self._pending: Optional[JsonSchemaPrefix] = None
+        self.consumed = 0
+        self.rejected = 0
+
+    @property
+    def finished(self) -> bool:
+        """The token just appended closed the document"""
+        state = self._pending or self.state
+        return state.complete
+
+    def __call__(self, input_ids, scores):
+        # The only token we left unmasked last step is the one that was appended
+        if input_ids.shape[1] - self.prompt_length > self.consumed and self._pending is not None:
+            self.state, self._pending = self._pending, None
+            self.consumed += 1
+
+        masked = scores.new_full(scores.shape, float("-inf"))
+        if self.state.complete:
+            masked[0, self.eos_token_ids] = 0.0
+            return masked
+
+        # Worst case the document closes one character per token, plus one step for EOS:
+        # a token is only allowed if what it leaves open can still be closed in time
+        max_open = self.max_new_tokens - self.consumed - 2
+
+        token, state = self._best_token(scores[0], max_open)
+        if token is None:
+            masked[0, self.eos_token_ids] = 0.0
+            return masked
+        self._pending = state
+        masked[0, token] = scores[0, token]
+        return masked
+
+    def _best_token(self, scores, max_open: int):
+        k = min(self.top_k, scores.shape[-1])
+        order = scores.topk(k).indices.tolist()
+        found = self._first_valid(order, max_open)
+        if found[0] is None:
+            # The model wants something off-schema (prose, a code fence): widen to the full vocabulary
+            found = self._first_valid(scores.argsort(descending=True).tolist()[k:], max_open)
+        return found
+
+    def _first_valid(self, token_ids: List[int], max_open: int):
+        for token in token_ids:
+            text = self.token_texts[token] if token < len(self.token_texts) else ""
+            if not text:
+                continue
+            candidate = self.state.copy()
+            if not candidate.feed(text):
+                self.rejected += 1
+                continue
+            if candidate.remaining_chars() > max_open:
+                continue
+            return token, candidate
+        return None, None
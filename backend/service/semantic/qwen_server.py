@@ -0,0 +1,72 @@
+"""
+Qwen Sidecar: serves the shared Qwen model to every API worker on the node
+
+Run with a single worker so the weights are loaded exactly once:
+    uvicorn backend.service.semantic.qwen_server:app --host 127.0.0.1 --port 8100 --workers 1
+and point the API at it with QWEN_SERVICE_URL=http://127.0.0.1:8100
+"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from pydantic import BaseModel
+
+from backend.service.semantic.qwen_service import qwen_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load at startup so the first request doesn't pay for it
+    await qwen_service.ensure_loaded()
+    yield
+    qwen_service.shutdown()
+
+
+app = FastAPI(title="Qwen Model Service", lifespan=lifespan)
+
+
+class GenerateRequest(BaseModel):
+    messages: List[Dict]
+    max_new_tokens: int = 4096
+    json_schema: Optional[Dict] = None
+
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    try:
+        return await qwen_service.generate(request.messages, request.max_new_tokens, request.json_schema)
+    except Exception as e:
+        logger.error(f"Qwen generate failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/generate_stream")
+async def generate_stream(request: GenerateRequest):
+    """NDJSON: one {"text": ...} line per decoded piece as it is generated, then {"result": ...}"""
+    chunks: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(qwen_service.generate(
+        request.messages, request.max_new_tokens, request.json_schema, on_text=chunks.put_nowait
+    ))
+    # Queued after every chunk the generation scheduled, so it marks the end of the text
+    task.add_done_callback(lambda _: chunks.put_nowait(None))
+
+    async def lines():
+        while (chunk := await chunks.get()) is not None:
+            yield json.dumps({"text": chunk}) + "\n"
+        try:
+            yield json.dumps({"result": task.result()}) + "\n"
+        except Exception as e:
+            logger.error(f"Qwen generate failed: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/health")
+async def health():
+    return qwen_service.status()
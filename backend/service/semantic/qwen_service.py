@@ -0,0 +1,477 @@
+"""
+Qwen Model Service: one copy of Qwen2.5-VL per node, shared by every caller through a small client
+"""
+
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from backend.service.semantic.json_constraint import JsonSchemaLogitsProcessor
+
+
+class QwenModelService:
+    """
+    Holds the Qwen weights once per process.
+    Loading is lazy (first call) and generate calls run one at a time on a
+    dedicated thread: a second concurrent generate would double activation
+    memory and fight the first for cores without finishing any sooner.
+
+    A leading system message is treated as a static prefix: its KV cache is
+    computed once and reused, so each call only prefills the images and the
+    variable text after it.
+    """
+
+    def __init__(self):
+        self.model_path = os.getenv("Qwen_MODEL_PATH", "Qwen/Qwen2.5-VL-3B-Instruct")
+        self.device = "cpu"
+
+        self.state = "idle"  # idle -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.model = None
+        self.processor = None
+        self.token_texts: Optional[List[str]] = None
+        self.calls = 0
+
+        self.prefix_cache_enabled = os.getenv("QWEN_PREFIX_CACHE", "true").lower() == "true"
+        self.prefix_cache_entries = int(os.getenv("QWEN_PREFIX_CACHE_ENTRIES", 4))
+        # system-message JSON -> (prefix length, DynamicCache), least recently used first
+        self._prefix_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.waiting = 0
+
+        self._load_lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="qwen")
+
+    async def ensure_loaded(self):
+        async with self._load_lock:
+            if self.state == "ready":
+                return
+            self.state = "loading"
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._executor, self._load_sync)
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logger.error(f"Failed to load Qwen2.5-VL: {e}")
+                raise
+            self.state = "ready"
+            self.error = None
+
+    def _load_sync(self):
+        import torch
+        from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+
+        logger.info(f"Loading Qwen2.5-VL from {self.model_path} on {self.device}...")
+        started = time.monotonic()
+        self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            self.model_path,
+            torch_dtype=torch.float32,
+            device_map="auto",
+            low_cpu_mem_usage=True
+        )
+        self.processor = AutoProcessor.from_pretrained(self.model_path)
+        logger.success(f"✓ Qwen2.5-VL loaded once for this node ({time.monotonic() - started:.1f}s)")
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_new_tokens: int = 4096,
+        json_schema: Optional[Dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        """
+        Run one chat completion.
+
+        Args:
+            messages: Chat messages (PIL images or data URIs)
+            max_new_tokens: Generation cap
+            json_schema: If given, decoding is constrained to JSON valid for this schema
+                         and stops as soon as the root object closes
+            on_text: If given, called on the event loop with each new piece of text as it is generated
+
+        Returns:
+            Dict with the generated text, prompt token count and prefill/total seconds
+        """
+        await self.ensure_loaded()
+        self.waiting += 1
+        try:
+            loop = asyncio.get_running_loop()
+            callback = None
+            if on_text is not None:
+                def callback(chunk: str):
+                    loop.call_soon_threadsafe(on_text, chunk)
+            return await loop.run_in_executor(
+                self._executor, self._generate_sync, messages, max_new_tokens, json_schema, callback
+            )
+        finally:
+            self.waiting -= 1
+
+    def _generate_sync(
+        self,
+        messages: List[Dict],
+        max_new_tokens: int,
+        json_schema: Optional[Dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        from transformers import LogitsProcessorList, StoppingCriteriaList
+        from qwen_vl_utils import process_vision_info
+
+        text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        image_inputs, video_inputs = process_vision_info(messages)
+        inputs = self.processor(
+            text=[text],
+            images=image_inputs,
+            videos=video_inputs,
+            padding=True,
+            return_tensors="pt",
+        ).to(self.device)
+
+        timer = _PrefillTimer()
+        prefix = self._prefix_for(messages, inputs["input_ids"]) if self.prefix_cache_enabled else None
+        processors = [timer]
+        options = {}
+        constraint = None
+        if json_schema is not None:
+            eos = self.model.generation_config.eos_token_id
+            constraint = JsonSchemaLogitsProcessor(
+                json_schema,
+                self._token_texts(),
+                eos if isinstance(eos, list) else [eos],
+                prompt_length=int(inputs["input_ids"].shape[1]),
+                max_new_tokens=max_new_tokens
+            )
+            processors.append(constraint)
+            # The constraint picks the token itself; sampling would only add noise
+            options = {"do_sample": False, "stopping_criteria": StoppingCriteriaList([_JsonClosed(constraint)])}
+        if on_text is not None:
+            options["streamer"] = _TextCallback(self.processor.tokenizer, on_text)
+
+        processors = LogitsProcessorList(processors)
+        generated_ids = None
+        cached_tokens = 0
+        if prefix is not None:
+            generated_ids = self._generate_from_prefix(inputs, prefix, max_new_tokens, processors, options)
+            cached_tokens = prefix[0] if generated_ids is not None else 0
+        if generated_ids is None:
+            generated_ids = self.model.generate(
+                **inputs, max_new_tokens=max_new_tokens, logits_processor=processors, **options
+            )
+        generated_ids = generated_ids.cpu()
+        trimmed = [out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)]
+        output_text = self.processor.batch_decode(
+            trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+        )[0]
+
+        self.calls += 1
+        return {
+            "text": output_text,
+            "prompt_tokens": int(inputs["input_ids"].shape[1]),
+            "generated_tokens": int(trimmed[0].shape[0]),
+            "prefill_s": timer.prefill_seconds,
+            "total_s": time.monotonic() - timer.started,
+            "cached_prefix_tokens": cached_tokens,
+            "json_complete": constraint.finished if constraint is not None else None
+        }
+
+    def _prefix_for(self, messages: List[Dict], input_ids) -> Optional[tuple]:
+        """(length, KV cache) of the leading system message, computed on first use"""
+        if not messages or messages[0].get("role") != "system":
+            return None
+        import torch
+        from transformers import DynamicCache
+
+        key = json.dumps(messages[0]["content"], sort_keys=True)
+        entry = self._prefix_cache.get(key)
+        if entry is None:
+            text = self.processor.apply_chat_template([messages[0]], tokenize=False, add_generation_prompt=False)
+            prefix_ids = self.processor.tokenizer(text, return_tensors="pt").input_ids.to(self.device)
+            cache = DynamicCache()
+            started = time.monotonic()
+            with torch.no_grad():
+                self.model(input_ids=prefix_ids, past_key_values=cache, use_cache=True)
+            entry = (int(prefix_ids.shape[1]), cache, prefix_ids[0])
+            self._prefix_cache[key] = entry
+            logger.info(f"Qwen prefix cache: {entry[0]} tokens prefilled in {time.monotonic() - started:.1f}s")
+            while len(self._prefix_cache) > self.prefix_cache_entries:
+                self._prefix_cache.popitem(last=False)
+        else:
+            self._prefix_cache.move_to_end(key)
+
+        length, cache, prefix_ids = entry
+        # Only reusable if the full prompt tokenises to the same leading ids
+        if input_ids.shape[1] <= length + 1 or not torch.equal(input_ids[0, :length], prefix_ids):
+            return None
+        return length, cache
+
+    def _generate_from_prefix(self, inputs, prefix: tuple, max_new_tokens: int, processors, options: Dict):
+        """
+        Prefill only the tokens after the cached prefix, then let generate continue from there.
+        Qwen2.5-VL's multimodal rope positions are taken from the full prompt, since the tail
+        alone would number the image patches from zero.
+        Returns None (caller falls back to a plain generate) if this transformers version disagrees.
+        """
+        import torch
+
+        length, cache = prefix
+        input_ids, attention_mask = inputs["input_ids"], inputs["attention_mask"]
+        n = input_ids.shape[1]
+        try:
+            owner = self.model if hasattr(self.model, "get_rope_index") else self.model.model
+            position_ids, rope_deltas = owner.get_rope_index(
+                input_ids=input_ids, image_grid_thw=inputs.get("image_grid_thw"), attention_mask=attention_mask
+            )
+            for module in (self.model, getattr(self.model, "model", None)):
+                if module is not None and hasattr(module, "rope_deltas"):
+                    module.rope_deltas = rope_deltas
+
+            # Everything but the last prompt token: generate feeds that one and samples from its logits
+            tail = slice(length, n - 1)
+            with torch.no_grad():
+                self.model(
+                    input_ids=input_ids[:, tail],
+                    attention_mask=attention_mask[:, :n - 1],
+                    position_ids=position_ids[:, :, tail],
+                    pixel_values=inputs.get("pixel_values"),
+                    image_grid_thw=inputs.get("image_grid_thw"),
+                    past_key_values=cache,
+                    cache_position=torch.arange(length, n - 1, device=input_ids.device),
+                    use_cache=True
+                )
+            return self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=cache,
+                max_new_tokens=max_new_tokens,
+                logits_processor=processors,
+                **options
+            )
+        except Exception as e:
+            logger.warning(f"Qwen prefix cache disabled: {e}")
+            self.prefix_cache_enabled = False
+            self._prefix_cache.clear()
+            return None
+        finally:
+            # Drop this call's tokens so the cache holds only the prefix again
+            if self.prefix_cache_enabled:
+                cache.crop(length)
+
+    def _token_texts(self) -> List[str]:
+        """Decoded text of every token id, built once; special and partial-UTF-8 tokens map to ''"""
+        if self.token_texts is None:
+            tokenizer = self.processor.tokenizer
+            special = set(tokenizer.all_special_ids) | set(getattr(tokenizer, "added_tokens_decoder", {}))
+            texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+            self.token_texts = ["" if i in special or "\ufffd" in text else text for i, text in enumerate(texts)]
+        return self.token_texts
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "model": self.model_path,
+            "calls": self.calls,
+            "waiting": self.waiting,
+            "error": self.error
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _PrefillTimer:
+    """Logits processor that records when the first logits arrive, i.e. when prefill has finished"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        return scores
+
+    @property
+    def prefill_seconds(self) -> Optional[float]:
+        return self.first_token_at - self.started if self.first_token_at else None
+
+
+class _TextCallback:
+    """
+    Generation streamer: decodes each new token and hands its text to a callback.
+    Qwen's byte-level BPE decodes piecewise, so only tokens not yet sent are decoded.
+    """
+
+    def __init__(self, tokenizer, callback: Callable[[str], None]):
+        self.tokenizer = tokenizer
+        self.callback = callback
+        self.pending: List[int] = []
+        self.prompt_seen = False
+
+    def put(self, value):
+        # generate() passes the prompt first
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        self.pending.extend(value.reshape(-1).tolist())
+        self._flush(final=False)
+
+    def end(self):
+        self._flush(final=True)
+
+    def _flush(self, final: bool):
+        text = self.tokenizer.decode(self.pending, skip_special_tokens=True, clean_up_tokenization_spaces=False)
+        # A trailing replacement character is a multi-byte character split across tokens
+        if text.endswith("\ufffd") and not final:
+            return
+        self.pending = []
+        if text:
+            self.callback(text)
+
+
+class _JsonClosed:
+    """Stopping criterion: end generation on the token that closes the JSON document (no EOS step)"""
+
+    def __init__(self, constraint: JsonSchemaLogitsProcessor):
+        self.constraint = constraint
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.constraint.finished, dtype=torch.bool, device=input_ids.device)
+
+
+# Global instance: the only Qwen weights in this process
+qwen_service = QwenModelService()
+
+
+class QwenClient(ABC):
+    """What the analyzer and the supervisor call; hides where the model lives"""
+
+    @abstractmethod
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_new_tokens: int = 4096,
+        json_schema: Optional[Dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        """Generated text plus token counts and timings (see QwenModelService._generate_sync)"""
+
+    @abstractmethod
+    async def model_id(self) -> str:
+        """The model that actually answers, as the service reports it (part of cache keys)"""
+
+
+class LocalQwenClient(QwenClient):
+    """Calls the in-process service"""
+
+    def __init__(self, service: QwenModelService = qwen_service):
+        self.service = service
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_new_tokens: int = 4096,
+        json_schema: Optional[Dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        return await self.service.generate(messages, max_new_tokens, json_schema, on_text)
+
+    async def model_id(self) -> str:
+        return self.service.model_path
+
+
+class RemoteQwenClient(QwenClient):
+    """Calls a sidecar model server, so API workers hold no weights at all"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.timeout = float(os.getenv("QWEN_SERVICE_TIMEOUT", 600))
+        # Reported by the sidecar's /health; the weights can't change without restarting it
+        self._model_id: Optional[str] = None
+
+    async def generate(
+        self,
+        messages: List[Dict],
+        max_new_tokens: int = 4096,
+        json_schema: Optional[Dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Dict:
+        body = {
+            "messages": encode_messages(messages),
+            "max_new_tokens": max_new_tokens,
+            "json_schema": json_schema
+        }
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            if on_text is not None:
+                return await self._generate_stream(client, body, on_text)
+            response = await client.post(f"{self.url}/generate", json=body)
+        if response.status_code != 200:
+            raise Exception(f"Qwen service error: {response.text}")
+        return response.json()
+
+    async def model_id(self) -> str:
+        if self._model_id is None:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                response = await client.get(f"{self.url}/health")
+            if response.status_code != 200:
+                raise Exception(f"Qwen service error: {response.text}")
+            self._model_id = response.json()["model"]
+        return self._model_id
+
+    async def _generate_stream(self, client: httpx.AsyncClient, body: Dict, on_text: Callable[[str], None]) -> Dict:
+        """NDJSON from /generate_stream: {"text": ...} lines as tokens arrive, then {"result": ...}"""
+        async with client.stream("POST", f"{self.url}/generate_stream", json=body) as response:
+            if response.status_code != 200:
+                raise Exception(f"Qwen service error: {(await response.aread()).decode(errors='replace')}")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if "text" in item:
+                    on_text(item["text"])
+                elif "error" in item:
+                    raise Exception(f"Qwen service error: {item['error']}")
+                else:
+                    return item["result"]
+        raise Exception("Qwen service error: stream ended without a result")
+
+
+def encode_messages(messages: List[Dict]) -> List[Dict]:
+    """Replace PIL images with base64 data URIs (qwen_vl_utils reads those directly)"""
+    encoded = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                image = part.get("image")
+                if part.get("type") == "image" and image is not None and not isinstance(image, str):
+                    buffer = io.BytesIO()
+                    image.save(buffer, format="PNG")
+                    part = {**part, "image": "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()}
+                parts.append(part)
+            message = {**message, "content": parts}
+        encoded.append(message)
+    return encoded
+
+
+_client: Optional[QwenClient] = None
+
+
+def get_qwen_client() -> QwenClient:
+    """Sidecar client if QWEN_SERVICE_URL is set, otherwise the in-process service"""
+    global _client
+    if _client is None:
+        url = os.getenv("QWEN_SERVICE_URL")
+        _client = RemoteQwenClient(url) if url else LocalQwenClient()
+        logger.info(f"Qwen client: {'sidecar at ' + url if url else 'in-process model'}")
+    return _client
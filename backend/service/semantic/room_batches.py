@@ -0,0 +1,144 @@
+"""
+Room Batches: per-room crops packed into multi-image LLM requests sized to a token budget
+"""
+
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from backend.service.semantic.analysis_cache import semantic_cache
+from backend.service.semantic.image_prep import PreparedImage, image_preparer, QWEN_PATCH
+from backend.service.semantic.room_naming import room_namer
+
+# Bump whenever the room prompt or its JSON changes, so cached answers aren't reused
+ROOM_PROMPT_VERSION = "room-batch-1"
+
+
+class RoomBatch:
+    """Crops of a few rooms that go to the model as one request"""
+
+    def __init__(self):
+        self.views: List[PreparedImage] = []
+        self.rooms: List[Dict] = []
+        self.tokens = 0
+
+    @property
+    def room_ids(self) -> List:
+        return [room["id"] for room in self.rooms]
+
+    def add(self, room: Dict, view: PreparedImage):
+        self.rooms.append(room)
+        self.views.append(view)
+        self.tokens += view.tokens
+
+
+class RoomBatchPlanner:
+    """
+    One crop per unnamed room at a fixed pixel budget, packed greedily into batches
+    under a vision-token budget, so request count and cost follow the number of rooms
+    rather than the size of the sheet.
+    """
+
+    def __init__(self):
+        self.crop_max_pixels = int(os.getenv("STAGE4_ROOM_CROP_MAX_PIXELS", 256 * QWEN_PATCH * QWEN_PATCH))
+        self.batch_tokens = int(os.getenv("STAGE4_BATCH_TOKENS", 3000))
+        self.batch_max_images = int(os.getenv("STAGE4_BATCH_MAX_IMAGES", 8))
+
+    def plan(self, image_data: Dict, rooms: List[Dict], model: str) -> List[RoomBatch]:
+        pending = [r for r in rooms if not r.get("resolved") and r.get("bbox")]
+        views = image_preparer.prepare_crops(image_data, [r["bbox"] for r in pending], model, self.crop_max_pixels)
+
+        batches = []
+        current = RoomBatch()
+        for room, view in zip(pending, views):
+            if view is None:
+                continue
+            full = len(current.views) >= self.batch_max_images or current.tokens + view.tokens > self.batch_tokens
+            if current.views and full:
+                batches.append(current)
+                current = RoomBatch()
+            current.add(room, view)
+        if current.views:
+            batches.append(current)
+
+        logger.info(f"Room batches: {sum(len(b.rooms) for b in batches)} rooms in {len(batches)} request(s), "
+                   f"~{sum(b.tokens for b in batches)} vision tokens")
+        return batches
+
+    def instructions(self) -> str:
+        """Static part of every batch prompt"""
+        floorings = room_namer.floorings()
+        flooring = f'\n- "flooring": one of {"/".join(floorings)}' if floorings else ""
+        example = ', "flooring": "Wood"' if floorings else ""
+        return f"""You are an expert architectural analyst. Each image is a close-up of one room of a floor plan,
+centred on the room with a small margin of its surroundings.
+
+For every room listed, give:
+- "name": the room's name as it would be labelled on the plan (e.g. "Bedroom 2")
+- "purpose": one of {'/'.join(room_namer.purposes())}{flooring}
+
+Output compact JSON (no code fences):
+{{"rooms": [{{"id": 0, "name": "Bedroom 2", "purpose": "bedroom"{example}}}]}}"""
+
+    def describe(self, batch: RoomBatch, scale_info: Dict) -> str:
+        """Per-batch part: which image shows which room"""
+        lines = [f"- Image {k + 1}: room id {room['id']}, {round(room.get('area_sqm', 0), 1)} m2"
+                 for k, room in enumerate(batch.rooms)]
+        return f"Scale: {scale_info.get('scale_string')}\nRooms:\n" + "\n".join(lines)
+
+    def schema(self, batch: RoomBatch) -> Dict:
+        """Output schema for constrained decoding: only this batch's ids, at most one entry each"""
+        return {"type": "object", "properties": {
+            "rooms": {
+                "type": "array",
+                "maxItems": len(batch.rooms),
+                "items": {"type": "object", "properties": {
+                    "id": {"enum": batch.room_ids},
+                    "name": {"type": "string", "maxLength": 40},
+                    **room_namer.label_properties()
+                }}
+            }
+        }}
+
+
+async def run_room_batches(
+    batches: List[RoomBatch],
+    scale_info: Dict,
+    model_id: str,
+    call: Callable[[RoomBatch], Awaitable[Optional[Dict]]]
+) -> List[Dict]:
+    """
+    Run every batch concurrently (the model clients enforce their own limits), each through
+    the semantic cache. Answers are kept only for ids that were in the batch, so a dropped
+    or invented entry can't land on another room; a failed batch loses only its own rooms.
+    """
+    async def run(batch: RoomBatch) -> List[Dict]:
+        key = semantic_cache.key(
+            [v.image for v in batch.views],
+            {"rooms": batch.room_ids, "scale": scale_info.get("scale_string")},
+            ROOM_PROMPT_VERSION, model_id
+        )
+        analysis = await semantic_cache.get(key)
+        if analysis is None:
+            analysis = await call(batch)
+            if analysis is None:
+                return []
+            await semantic_cache.put(key, model_id, analysis)
+        allowed = set(batch.room_ids)
+        return [r for r in analysis.get("rooms", []) if isinstance(r, dict) and r.get("id") in allowed]
+
+    results = await asyncio.gather(*[run(batch) for batch in batches], return_exceptions=True)
+    updates = []
+    for batch, result in zip(batches, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Room batch {batch.room_ids} failed: {result}")
+            continue
+        updates += result
+    logger.info(f"Room batches: {len(updates)}/{sum(len(b.rooms) for b in batches)} rooms labelled")
+    return updates
+
+
+# Global instance
+room_batch_planner = RoomBatchPlanner()
@@ -0,0 +1,217 @@
+"""
+Room Naming: label rooms from the PDF text layer by spatial join, before any LLM call
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from backend.service.geometry.transforms import apply_affine_boxes
+
+VOCABULARY_PATH = Path(__file__).parent.parent.parent / "core" / "room_vocabulary.json"
+
+
+def points_in_polygons(points: np.ndarray, polygons: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Every (point, polygon) containment pair, by even-odd ray casting.
+    Bounding boxes prune the pairs first; the crossing test then runs over all
+    surviving pairs and all edges at once on a padded (polygon, vertex) array.
+
+    Returns:
+        point indices, polygon indices
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    empty = np.empty(0, dtype=np.int64)
+    if len(points) == 0 or len(polygons) == 0:
+        return empty, empty
+
+    lens = np.array([len(p) for p in polygons], dtype=np.int64)
+    flat = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polygons])
+    starts = np.cumsum(lens) - lens
+    poly_id = np.repeat(np.arange(len(polygons)), lens)
+    local = np.arange(len(flat)) - starts[poly_id]
+    following = np.where(local + 1 == lens[poly_id], starts[poly_id], np.arange(len(flat)) + 1)
+
+    # Padded edges are degenerate (a == b) and never cross the ray
+    a = np.zeros((len(polygons), lens.max(), 2))
+    b = np.zeros_like(a)
+    a[poly_id, local] = flat
+    b[poly_id, local] = flat[following]
+
+    lo = np.minimum.reduceat(flat, starts)
+    hi = np.maximum.reduceat(flat, starts)
+    inside_box = np.all((points[:, None] >= lo[None]) & (points[:, None] <= hi[None]), axis=2)
+    pi, ri = np.nonzero(inside_box)
+    if len(pi) == 0:
+        return empty, empty
+
+    px = points[pi, 0][:, None]
+    py = points[pi, 1][:, None]
+    ax, ay, bx, by = a[ri, :, 0], a[ri, :, 1], b[ri, :, 0], b[ri, :, 1]
+    straddles = (ay > py) != (by > py)
+    dy = np.where(straddles, by - ay, 1.0)
+    x_cross = ax + (py - ay) * (bx - ax) / dy
+    crossings = (straddles & (px < x_cross)).sum(axis=1)
+    inside = crossings % 2 == 1
+    return pi[inside], ri[inside]
+
+
+class RoomNamer:
+    """Spatial join of text spans onto room polygons, normalised through a vocabulary table"""
+
+    def __init__(self):
+        self.aliases: Dict[str, str] = {}
+        self.finishes: Dict[str, Dict] = {}
+        self.max_words = 1
+        self._load_vocabulary()
+
+    def _load_vocabulary(self):
+        if not VOCABULARY_PATH.exists():
+            logger.warning(f"Room vocabulary not found: {VOCABULARY_PATH}")
+            return
+        with open(VOCABULARY_PATH, 'r') as f:
+            vocabulary = json.load(f)
+        for purpose, entry in vocabulary.get("purposes", {}).items():
+            self.finishes[purpose] = entry.get("finishes", {})
+            for alias in entry.get("aliases", []):
+                self.aliases[self._normalise(alias)] = purpose
+        self.max_words = max((len(a.split()) for a in self.aliases), default=1)
+
+    def purposes(self) -> List[str]:
+        """Vocabulary purposes, plus "other" for anything outside it"""
+        return sorted(self.finishes) + ["other"]
+
+    def floorings(self) -> List[str]:
+        return sorted({f["flooring"] for f in self.finishes.values() if f.get("flooring")})
+
+    def label_properties(self) -> Dict[str, Dict]:
+        """Output schema for a room's purpose and flooring; no flooring without a vocabulary to pick from"""
+        properties = {"purpose": {"enum": self.purposes()}}
+        if self.floorings():
+            properties["flooring"] = {"enum": self.floorings()}
+        return properties
+
+    @staticmethod
+    def _normalise(text: str) -> str:
+        return " ".join(re.sub(r"[^A-Z0-9]+", " ", text.upper()).split())
+
+    def match(self, text: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Purpose and room number for a label such as "BEDROOM 2" or "W.C.",
+        or None if no vocabulary phrase occurs in it (dimensions, levels, notes).
+        """
+        words = self._normalise(text).split()
+        number = next((w for w in words if any(c.isdigit() for c in w)), None)
+        words = [w for w in words if not any(c.isdigit() for c in w)]
+        # Longest phrase first, so "MASTER BEDROOM" beats "BEDROOM"
+        for n in range(min(len(words), self.max_words), 0, -1):
+            for i in range(len(words) - n + 1):
+                purpose = self.aliases.get(" ".join(words[i:i + n]))
+                if purpose is not None:
+                    return purpose, number
+        return None
+
+    def name_rooms(self, rooms: List[Dict], text_spans: List[Dict], pt_to_px: Optional[np.ndarray]) -> int:
+        """
+        Name rooms in place from the text spans inside their boundaries.
+
+        Args:
+            rooms: Rooms from segmentation (page-pixel boundaries)
+            text_spans: Spans with bbox in PDF points (Stage 1)
+            pt_to_px: 3x3 affine from PDF points to page pixels (PageFrames.pt_to_px)
+
+        Returns:
+            Number of rooms resolved from the text layer
+        """
+        for room in rooms:
+            room.setdefault("resolved", False)
+        if not rooms or not text_spans or pt_to_px is None:
+            return 0
+
+        # Only spans that read as a room name take part in the join
+        matches = [(span, self.match(span.get("text", ""))) for span in text_spans]
+        labels = [(span, m) for span, m in matches if m is not None]
+        if not labels:
+            return 0
+
+        # Rotated pages swap the bbox corners, so map all four and take the bounds
+        bboxes = apply_affine_boxes(pt_to_px, [span["bbox"] for span, _ in labels])
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) / 2
+        sizes = np.array([span.get("size", 0) for span, _ in labels], dtype=np.float64)
+
+        span_idx, room_idx = points_in_polygons(centers, [np.asarray(r["boundary"]) for r in rooms])
+        # One label per room: the largest text, as titles outrank annotations
+        order = np.lexsort((-sizes[span_idx], room_idx))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = room_idx[order][1:] != room_idx[order][:-1]
+
+        resolved = 0
+        for s, r in zip(span_idx[order][first].tolist(), room_idx[order][first].tolist()):
+            span, (purpose, number) = labels[s]
+            room = rooms[r]
+            room.update({
+                "name": " ".join(span["text"].split()),
+                "purpose": purpose,
+                "name_source": "text_layer",
+                "resolved": True,
+                **self.finishes.get(purpose, {})
+            })
+            if number is not None:
+                room["number"] = number
+            resolved += 1
+
+        logger.info(f"Room naming: {resolved}/{len(rooms)} rooms named from the text layer, "
+                   f"{len(rooms) - resolved} left for semantic analysis")
+        return resolved
+
+
+def unresolved_rooms(rooms: List[Dict], to_image=None) -> List[Dict]:
+    """
+    Compact description of the rooms Stage 4 still has to label.
+    `to_image` maps page-pixel label points into the coordinates of the image the model sees.
+    """
+    pending = []
+    for room in rooms:
+        if room.get("resolved"):
+            continue
+        center = room.get("center")
+        if center is not None and to_image is not None:
+            center = np.round(to_image(center)).astype(int).tolist()
+        pending.append({"id": room["id"], "center": center, "area_sqm": round(room.get("area_sqm", 0), 1)})
+    return pending
+
+
+def merge_element_analysis(elements: List[Dict], validated: List[Dict]):
+    """
+    Apply LLM answers to walls / doors / windows by id (list position means nothing once one is dropped),
+    never overwriting elements the semantic cascade already resolved
+    """
+    by_id = {update.get("id"): update for update in validated if isinstance(update, dict)}
+    for i, element in enumerate(elements):
+        if element.get("resolved"):
+            continue
+        update = by_id.get(element.get("id", i))
+        if update:
+            element.update({k: v for k, v in update.items() if k not in ("id", "function")})
+            # Qwen answers "function"; Stage 5 reads the detector's wall_function
+            if isinstance(update.get("function"), str):
+                element["wall_function"] = update["function"].lower()
+
+
+def merge_room_analysis(rooms: List[Dict], validated_rooms: List[Dict]):
+    """Apply LLM room labels by id, never overwriting text-layer names"""
+    by_id = {room.get("id"): room for room in rooms}
+    for update in validated_rooms:
+        room = by_id.get(update.get("id"))
+        if room is None or room.get("resolved"):
+            continue
+        room.update(update)
+        room["name_source"] = "llm"
+
+
+# Global instance
+room_namer = RoomNamer()
@@ -10,6 +10,9 @@ from typing import Dict
 from loguru import logger
 import os
 
+from backend.service.geometry.transforms import PageFrames
+from backend.service.pdf_processing.processors import extract_text_spans
+
 # INCREASE PIL IMAGE SIZE LIMIT
 # Image.MAX_IMAGE_PIXELS = None  # Remove limit entirely
 # OR set a higher limit:
@@ -64,6 +67,10 @@ class Stage1PDFProcessor:
         # Convert to PIL Image
         img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
         
+        # Text layer (room names, scale notes) in PDF points
+        text_spans = extract_text_spans(page)
+        pixels_per_point = zoom
+        
         # Check if image is too large and resize if needed
         width, height = img.size
         max_dim = max(width, height)
@@ -76,11 +83,15 @@ class Stage1PDFProcessor:
             new_width = int(width * scale)
             new_height = int(height * scale)
             img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            pixels_per_point = zoom * scale
             logger.info(f"Resized to {new_width}x{new_height}")
         
         # Convert to numpy array
         image_array = np.array(img)
         
+        # Page rotation, so text / vector coordinates (already cropbox-relative) map onto this raster
+        frames = PageFrames.from_page(page, pixels_per_point)
+        
         doc.close()
         
         logger.info(f"PDF converted: {image_array.shape}")
@@ -89,5 +100,7 @@ class Stage1PDFProcessor:
             "image": image_array,
             "width": image_array.shape[1],
             "height": image_array.shape[0],
-            "original_pdf": pdf_path
+            "original_pdf": pdf_path,
+            "text_spans": text_spans,
+            **frames.to_dict()
         }
\ No newline at end of file
@@ -9,8 +9,12 @@ import re
 from typing import Dict, Optional, Tuple
 from loguru import logger
 import os
+import time
 import numpy as np
 
+from backend.service.geometry.transforms import PageFrames
+from backend.service.pdf_processing.layout import crop_to_region
+
 
 class Stage2ScaleDetector:
     """Detect scale and calibrate pixels-to-mm"""
@@ -31,8 +35,17 @@ class Stage2ScaleDetector:
         """
         image = image_data["image"]
         
-        # Try OCR to find scale notation
-        scale = await self._ocr_scale_detection(image)
+        # Try OCR to find scale notation, on the non-blank part of the sheet only
+        # (title block included - that's where scale notes usually are)
+        ocr_image = crop_to_region(image_data, "nonblank")
+        skipped = 1.0 - ocr_image.size / max(image.size, 1)
+        started = time.monotonic()
+        scale = await self._ocr_scale_detection(ocr_image)
+        if skipped > 0:
+            # Tesseract time scales roughly with pixel count
+            elapsed = time.monotonic() - started
+            logger.info(f"OCR skipped {skipped:.0%} blank pixels "
+                        f"(~{elapsed * skipped / max(1.0 - skipped, 1e-6):.1f}s saved)")
         
         if scale is None and self.enable_auto:
             # Try pattern matching for scale bars
@@ -44,12 +57,15 @@ class Stage2ScaleDetector:
         
         # Calculate pixel to mm conversion
         # This is simplified - actual calculation needs dimension text
-        pixels_per_mm = await self._calculate_conversion(image, scale)
+        # Resolution the raster was actually rendered at, not the Stage 1 default
+        frames = PageFrames.from_image_data(image_data, default_dpi=300)
+        pixels_per_mm = await self._calculate_conversion(frames, scale)
         
         return {
             "scale": scale,
             "scale_string": f"1:{scale}",
             "pixels_per_mm": pixels_per_mm,
+            "dpi": frames.dpi,
             "detection_method": "ocr" if scale else "default"
         }
     
@@ -114,7 +130,7 @@ class Stage2ScaleDetector:
         
         return None
     
-    async def _calculate_conversion(self, image, scale: int) -> float:
+    async def _calculate_conversion(self, frames: PageFrames, scale: int) -> float:
         """
         Calculate pixels per millimeter
         This is simplified - needs actual dimension text
@@ -125,9 +141,7 @@ class Stage2ScaleDetector:
         # Assuming A3 drawing at given scale
         # 1:100 means 1mm on paper = 100mm in reality
         
-        dpi = 300  # from PDF conversion
-        mm_per_inch = 25.4
-        pixels_per_mm_paper = dpi / mm_per_inch
+        pixels_per_mm_paper = frames.pixels_per_paper_mm
         
         # If scale is 1:100, then 1mm on paper = 100mm real
         # So pixels per mm real = pixels_per_mm_paper / scale
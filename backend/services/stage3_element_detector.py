@@ -1,177 +1,122 @@
-from pathlib import Path
 from loguru import logger
 import os
-import sys
-import torch
+import asyncio
+import time
 import numpy as np
-from typing import Dict, List, Optional
-from ultralytics import YOLO
-
-# Add this before loading the model
-torch.serialization.add_safe_globals([__import__('ultralytics.nn.tasks', fromlist=['DetectionModel']).DetectionModel])
+from typing import Dict, List
+
+from backend.service.detection.batching import detection_service
+from backend.service.detection.preprocess import letterbox, unletterbox_boxes
+from backend.service.detection.nms import nms
+from backend.service.detection.table import DetectionTable, TYPE_CODES
+from backend.service.detection.registry import model_registry
+from backend.service.detection.tile_cache import tile_cache, tile_grid, TileCacheStats
+from backend.service.pdf_processing.layout import get_layout_mask
+from backend.service.geometry.transforms import PageFrames, offset_boxes
+from backend.service.geometry.thickness import get_distance_map, sample_wall_thickness
+from backend.service.geometry.wall_graph import WallGraph, build_wall_graph
+from backend.service.geometry.host_walls import assign_host_walls
+from backend.service.geometry.rooms import opening_closures, room_segmenter
+from backend.service.semantic.room_naming import room_namer
 
 
 class Stage3ElementDetector:
     """Detect architectural elements using YOLOv11 with dynamic model support"""
 
     def __init__(self):
-        self.weights_dir = Path(os.getenv("YOLO_WEIGHTS_DIR", "ml/weights"))
-        logger.info(f"YOLOv11_model_path_directory: {self.weights_dir}")
-
         self.confidence = float(os.getenv("DETECTION_CONFIDENCE", 0.6))
         self.nms_threshold = float(os.getenv("NMS_THRESHOLD", 0.4))
-
-        # Initialize models map
-        self.models = {}
-        self._load_models()
-
-    def _load_models(self):
-        """
-        Load YOLO model for element detection.
-        Loads yolov11_floorplan.pt (monolithic model).
-        If not found, prompts user whether to proceed with base model.
-        """
-        
-        # Check for specialized models first (optional feature)
-        specialized_found = False
-        specialized_types = ['wall', 'door', 'window', 'column']
-
-        for e_type in specialized_types:
-            weight_path = self.weights_dir / f"{e_type}.pt"
-            if weight_path.exists():
-                logger.info(f"Loading specialized model for {e_type}: {weight_path}")
-                self.models[e_type] = YOLO(str(weight_path))
-                specialized_found = True
-
-        # If no specialized models, load monolithic model (your main model)
-        if not specialized_found:
-            model_path = self.weights_dir / "yolov11_floorplan.pt"
-            
-            # logger.info(f"Looking for custom model at: {model_path}")
-            # logger.info(f"Absolute path: {model_path.resolve()}")
-            
-            # Check if custom model exists
-            if model_path.exists() and model_path.is_file():
-                file_size_mb = model_path.stat().st_size / (1024 * 1024)
-                logger.info(f"✓ Found custom model: {model_path.name} ({file_size_mb:.1f} MB)")
-                
-                try:
-                    logger.info("Loading custom YOLO model...")
-                    self.models['all'] = YOLO(str(model_path))
-                    logger.success(f"✓ Successfully loaded custom model: yolov11_floorplan.pt")
-                    # logger.info("Model ready for element detection (columns, beams, slabs, grid lines)")
-                    return  # Success - exit method
-                    
-                except Exception as e:
-                    logger.error(f"✗ Failed to load custom model: {e}")
-                    logger.warning("The model file exists but cannot be loaded. It may be corrupted.")
-                    # Fall through to user prompt
-            else:
-                logger.warning(f"✗ Custom model not found at: {model_path}")
-                
-                # Show what's in the weights directory
-                if self.weights_dir.exists():
-                    logger.info(f"Contents of {self.weights_dir}:")
-                    weights_found = False
-                    for item in self.weights_dir.iterdir():
-                        logger.info(f"  - {item.name}")
-                        weights_found = True
-                    if not weights_found:
-                        logger.info("  (directory is empty)")
-                else:
-                    logger.warning(f"Weights directory does not exist: {self.weights_dir}")
-                    logger.info(f"Creating directory: {self.weights_dir}")
-                    self.weights_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Model not found or failed to load - ask user what to do
-            logger.warning("=" * 70)
-            logger.warning("CUSTOM MODEL NOT FOUND OR FAILED TO LOAD")
-            logger.warning("=" * 70)
-            logger.warning("")
-            logger.warning("The trained model 'yolov11_floorplan.pt' was not found or is corrupted.")
-            logger.warning("This model is required for accurate detection of:")
-            logger.warning("  - Columns")
-            logger.warning("  - Beams")
-            logger.warning("  - Slabs")
-            logger.warning("  - Grid Lines")
-            logger.warning("")
-            logger.warning("Options:")
-            logger.warning("  1. Train the model first (RECOMMENDED)")
-            logger.warning("     cd backend/training")
-            logger.warning("     python train_yolo.py ./columns-and-ducts-detection-1")
-            logger.warning("")
-            logger.warning("  2. Use base YOLOv8n model (POOR ACCURACY - testing only)")
-            logger.warning("=" * 70)
-            logger.warning("")
-            
-            # Ask user for confirmation
-            print("\n" + "⚠" * 35)
-            print("WARNING: Custom model not found or failed to load!")
-            print("⚠" * 35)
-            
-            try:
-                response = input("\nDo you want to proceed with base YOLOv8n model? (yes/no): ").strip().lower()
-                
-                if response in ['yes', 'y']:
-                    logger.warning("User chose to proceed with base YOLOv8n model")
-                    logger.warning("⚠ WARNING: Base model is NOT trained for construction elements!")
-                    logger.warning("⚠ Detection accuracy will be VERY POOR until you train a custom model.")
-                    
-                    try:
-                        logger.info("Loading base YOLOv8n model...")
-                        self.models['all'] = YOLO('yolov8n.pt')
-                        logger.warning("✓ Loaded base YOLOv8n (UNTRAINED - for testing only)")
-                        
-                    except Exception as e:
-                        logger.error(f"✗ Failed to load base model: {e}")
-                        logger.error("Cannot proceed without a model. Exiting.")
-                        sys.exit(1)
-                else:
-                    logger.info("User chose not to proceed without custom model")
-                    logger.info("\nPlease train the model first:")
-                    logger.info("  1. cd backend/training")
-                    logger.info("  2. python download_data.py YOUR_ROBOFLOW_API_KEY")
-                    logger.info("  3. python train_yolo.py ./columns-and-ducts-detection-1")
-                    logger.info("  4. cp runs/detect/train/weights/best.pt ../ml/weights/yolov11_floorplan.pt")
-                    logger.info("\nExiting...")
-                    sys.exit(0)
-                    
-            except KeyboardInterrupt:
-                logger.info("\n\nInterrupted by user. Exiting...")
-                sys.exit(0)
+        self.imgsz = int(os.getenv("DETECTION_IMGSZ", 640))
+        # Overlap above which boxes from different specialised models are duplicates
+        self.cross_model_iou = float(os.getenv("CROSS_MODEL_IOU", 0.7))
+        # Inference tiles (0 = whole image as one tile)
+        self.tile_size = int(os.getenv("DETECTION_TILE_SIZE", 1024))
+        self.tile_overlap = int(os.getenv("DETECTION_TILE_OVERLAP", 128))
+        # Wall endpoints closer than this are the same joint
+        self.wall_snap_mm = float(os.getenv("WALL_SNAP_MM", 300))
+        # Doors/windows further than this from every wall centerline stay unhosted
+        self.opening_host_radius_mm = float(os.getenv("OPENING_HOST_RADIUS_MM", 400))
+
+        # Models are owned by the registry and loaded lazily/in the background,
+        # so constructing the detector (and importing the API) stays cheap
+        self.registry = model_registry
 
     async def detect(self, image_data: Dict, scale_info: Dict) -> Dict:
         """
-        Detect architectural elements
+        Detect architectural elements.
+        Tile cache and layout-mask savings for the job go to image_data["detection_stats"].
         """
         image = image_data["image"]
         pixels_per_mm = scale_info["pixels_per_mm"]
-
-        elements = {
-            "walls": [], "doors": [], "windows": [], 
-            "stairs": [], "rooms": [], "fixtures": [], "columns": []
+        job_id = image_data.get("job_id", "-")
+        models = await self.registry.get_models()
+
+        # Fixed tile grid: tiles whose pixels are unchanged since an earlier
+        # revision reuse their cached boxes, only changed tiles are re-inferred
+        tiles = tile_grid(image.shape[0], image.shape[1], self.tile_size, self.tile_overlap)
+        signature = self._cache_signature()
+        stats = TileCacheStats()
+
+        # Tiles with no drawable content (margins, frame, title block) are never inferred
+        layout = get_layout_mask(image_data)
+        blank = layout.tile_fractions(tiles) <= 0
+
+        tile_boxes = [None] * len(tiles)
+        for i in np.flatnonzero(blank).tolist():
+            tile_boxes[i] = self._empty_tile()
+        drawn = np.flatnonzero(~blank).tolist()
+        crops = [np.ascontiguousarray(image[y0:y1, x0:x1]) for x0, y0, x1, y1 in tiles[drawn].tolist()]
+        # Hashing and disk reads stay off the event loop
+        keys, cached = await asyncio.to_thread(tile_cache.lookup, crops, signature)
+
+        pending = []
+        for i, key, tile, entry in zip(drawn, keys, crops, cached):
+            if entry is not None:
+                tile_boxes[i] = entry
+                stats.hits += 1
+            else:
+                pending.append((i, key, tile))
+
+        if pending:
+            # All missing tiles go to the batching service at once so they share forward passes
+            started = time.monotonic()
+            fresh = await asyncio.gather(*[self._detect_tile(models, tile) for _, _, tile in pending])
+            stats.misses = len(pending)
+            stats.inference_seconds = time.monotonic() - started
+            tile_cache.record_inference(stats.inference_seconds / len(pending))
+
+            for (i, _, _), entry in zip(pending, fresh):
+                tile_boxes[i] = entry
+            await asyncio.to_thread(tile_cache.store, [key for _, key, _ in pending], fresh)
+
+        boxes, scores, type_codes = self._merge_tiles(tiles, tile_boxes)
+
+        # Features for every box are computed column-wise; dicts are built once at the end
+        table = DetectionTable.from_boxes(boxes, scores, type_codes, pixels_per_mm)
+        self._measure_walls(table, image_data, pixels_per_mm)
+        wall_graph = self._connect_walls(table, pixels_per_mm)
+        self._assign_to_walls(table, pixels_per_mm)
+        elements = table.to_elements()
+        elements["wall_graph"] = wall_graph.to_dict()
+        elements["rooms"] = self._detect_rooms(table, image.shape[:2], pixels_per_mm)
+        # Names already printed in the PDF text layer need no LLM call in Stage 4
+        pt_to_px = PageFrames.from_image_data(image_data).pt_to_px if image_data.get("pixels_per_point") else None
+        room_namer.name_rooms(elements["rooms"], image_data.get("text_spans", []), pt_to_px)
+
+        cache_stats = stats.as_dict(tile_cache.mean_tile_seconds)
+        skipped = int(blank.sum())
+        # Job metadata, not an element type: consumers iterate the element lists
+        image_data["detection_stats"] = {
+            **cache_stats,
+            "blank_tiles_skipped": skipped,
+            "pixels_skipped_fraction": 1.0 - layout.drawable_fraction,
+            "mask_time_saved_s": skipped * tile_cache.mean_tile_seconds
         }
-
-        # Run detection
-        if 'all' in self.models:
-            # Monolithic detection
-            results = self.models['all'].predict(
-                image, conf=self.confidence, iou=self.nms_threshold, verbose=False
-            )
-            await self._process_results(results, elements, image, pixels_per_mm)
-        else:
-            # Specialized detection
-            for e_type, model in self.models.items():
-                logger.info(f"Running detection for {e_type}...")
-                results = model.predict(
-                    image, conf=self.confidence, iou=self.nms_threshold, verbose=False
-                )
-                # Note: Specialized models usually output class 0 for their specific type
-                # We need to map that correctly
-                await self._process_results(results, elements, image, pixels_per_mm, override_type=e_type)
-
-        # Post-processing
-        elements = await self._post_process(elements, image, pixels_per_mm)
+        logger.info(f"Job {job_id}: layout mask skipped {skipped}/{len(tiles)} tiles "
+                   f"({1.0 - layout.drawable_fraction:.0%} of pixels), "
+                   f"~{skipped * tile_cache.mean_tile_seconds:.1f}s inference saved")
+        logger.info(f"Job {job_id}: tile cache {cache_stats['cache_hits']}/{cache_stats['tiles']} hits "
+                   f"({cache_stats['hit_rate']:.0%}), ~{cache_stats['time_saved_s']:.1f}s inference saved")
 
         logger.info(f"Detected: {len(elements['walls'])} walls, "
                    f"{len(elements['doors'])} doors, "
@@ -179,153 +124,126 @@ class Stage3ElementDetector:
 
         return elements
 
-    async def _process_results(
-        self, 
-        results, 
-        elements_dict: Dict, 
-        image: np.ndarray, 
-        pixels_per_mm: float,
-        override_type: Optional[str] = None
-    ):
-        """Process YOLO results and populate elements dict"""
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                confidence = float(box.conf[0])
-                bbox = box.xyxy[0].cpu().numpy()
-
-                if override_type:
-                    element_type = override_type
-                else:
-                    class_id = int(box.cls[0])
-                    element_type = self._map_class_to_type(class_id)
-
-                if element_type:
-                    element = await self._parse_element(
-                        element_type, bbox, confidence, image, pixels_per_mm
-                    )
-                    # Append to correct list (pluralized key)
-                    key = element_type + "s"
-                    if key in elements_dict:
-                        elements_dict[key].append(element)
-
-    def _map_class_to_type(self, class_id: int) -> Optional[str]:
-        """Map YOLO class ID to element type"""
-        mapping = {
-            0: "wall", 1: "door", 2: "window", 
-            3: "stair", 4: "room", 5: "fixture", 6: "column"
-        }
-        return mapping.get(class_id)
-
-    async def _parse_element(
-        self,
-        element_type: str,
-        bbox: np.ndarray,
-        confidence: float,
-        image: np.ndarray,
-        pixels_per_mm: float
-    ) -> Dict:
-        """Parse detected element into structured data"""
-
-        x1, y1, x2, y2 = bbox
-        width_px = x2 - x1
-        height_px = y2 - y1
-
-        width_mm = width_px / pixels_per_mm
-        height_mm = height_px / pixels_per_mm
-
-        element = {
-            "type": element_type,
-            "bbox": [int(x1), int(y1), int(x2), int(y2)],
-            "confidence": confidence,
-            "center": [int((x1 + x2) / 2), int((y1 + y2) / 2)],
-            "dimensions": {
-                "width_mm": width_mm,
-                "height_mm": height_mm
-            }
-        }
+    def _cache_signature(self) -> str:
+        """Everything besides the pixels that changes what a tile's boxes would be"""
+        versions = ",".join(f"{k}={v}" for k, v in sorted(self.registry.versions.items()))
+        return f"{versions}|{self.confidence}|{self.nms_threshold}|{self.imgsz}|{self.cross_model_iou}"
 
-        # Extract additional features based on type
-        if element_type == "wall":
-            element.update(await self._analyze_wall(bbox, image))
-        elif element_type == "door":
-            element.update(await self._analyze_door(bbox, image))
-        elif element_type == "window":
-            element.update(await self._analyze_window(bbox, image))
-        elif element_type == "column":
-            element.update(await self._analyze_column(bbox, image))
-
-        return element
-
-    async def _analyze_column(self, bbox, image) -> Dict:
-        """Extract column-specific features"""
-        x1, y1, x2, y2 = [int(v) for v in bbox]
-        width_px = x2 - x1
-        height_px = y2 - y1
-
-        aspect_ratio = width_px / height_px if height_px > 0 else 1
-        is_circular = 0.9 < aspect_ratio < 1.1 
-
-        return {
-            "column_shape": "circular" if is_circular else "rectangular",
-            "material": "Concrete"
-        }
-
-    async def _analyze_wall(self, bbox, image) -> Dict:
-        """Extract wall-specific features"""
-        x1, y1, x2, y2 = [int(v) for v in bbox]
-        wall_region = image[y1:y2, x1:x2]
-        thickness = await self._estimate_line_thickness(wall_region)
-        is_exterior = thickness > 200  # mm
-
-        return {
-            "thickness": thickness,
-            "wall_function": "exterior" if is_exterior else "interior",
-            "endpoints": [
-                [int(x1), int((y1 + y2) / 2)],
-                [int(x2), int((y1 + y2) / 2)]
-            ]
-        }
-
-    async def _analyze_door(self, bbox, image) -> Dict:
-        """Extract door-specific features"""
-        x1, y1, x2, y2 = [int(v) for v in bbox]
-        door_region = image[y1:y2, x1:x2]
-        swing = await self._detect_door_swing(door_region)
-        width = x2 - x1
-        door_type = "double" if width > 1800 else "single"
-
-        return {
-            "door_type": door_type,
-            "swing_direction": swing,
-            "width": width
-        }
-
-    async def _analyze_window(self, bbox, image) -> Dict:
-        return {"window_type": "fixed", "has_sill": True}
-
-    async def _estimate_line_thickness(self, region: np.ndarray) -> float:
-        return 200.0  # mm
-
-    async def _detect_door_swing(self, region: np.ndarray) -> str:
-        return "right"
-
-    async def _post_process(self, elements: Dict, image: np.ndarray, pixels_per_mm: float) -> Dict:
-        """Post-process detected elements"""
-        # Simplified post-processing logic
-        elements["walls"] = await self._connect_walls(elements["walls"])
-        elements["doors"] = await self._assign_to_walls(elements["doors"], elements["walls"])
-        elements["windows"] = await self._assign_to_walls(elements["windows"], elements["walls"])
-        elements["rooms"] = await self._detect_rooms(elements["walls"], image)
-        return elements
-
-    async def _connect_walls(self, walls: List[Dict]) -> List[Dict]:
-        return walls
-
-    async def _assign_to_walls(self, openings: List[Dict], walls: List[Dict]) -> List[Dict]:
-        for opening in openings:
-            opening["host_wall_id"] = 0
-        return openings
-
-    async def _detect_rooms(self, walls: List[Dict], image: np.ndarray) -> List[Dict]:
-        return []
\ No newline at end of file
+    async def _detect_tile(self, models: Dict, tile: np.ndarray):
+        """Run detection on one tile; boxes are in tile coordinates"""
+        # Run detection through the shared batching service so concurrent jobs
+        # share forward passes instead of competing for cores
+        if 'all' in models:
+            # Monolithic detection
+            result = await detection_service.infer(
+                'all', models['all'], tile, self.confidence, self.nms_threshold
+            )
+            return self._result_arrays(result)
+
+        # Specialized detection: letterbox once, run every model concurrently
+        return await self._detect_specialized(models, tile)
+
+    def _merge_tiles(self, tiles: np.ndarray, tile_boxes: List):
+        """Shift per-tile boxes to page coordinates and drop duplicates from tile overlaps"""
+        counts = np.array([len(entry[1]) for entry in tile_boxes], dtype=np.int64)
+        boxes = np.concatenate([entry[0] for entry in tile_boxes]).reshape(-1, 4).astype(np.float32)
+        scores = np.concatenate([entry[1] for entry in tile_boxes]).astype(np.float32)
+        type_codes = np.concatenate([entry[2] for entry in tile_boxes]).astype(np.int64)
+
+        boxes = offset_boxes(boxes, np.repeat(tiles[:, :2], counts, axis=0))
+
+        if len(tiles) > 1 and len(boxes):
+            keep = nms(boxes, scores, self.nms_threshold, classes=type_codes)
+            boxes, scores, type_codes = boxes[keep], scores[keep], type_codes[keep]
+
+        return boxes, scores, type_codes
+
+    def _empty_tile(self):
+        return (
+            np.empty((0, 4), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int64)
+        )
+
+    def _result_arrays(self, result):
+        """Move a whole ultralytics result to NumPy in one transfer per tensor"""
+        boxes = result.boxes
+        return (
+            boxes.xyxy.cpu().numpy(),
+            boxes.conf.cpu().numpy(),
+            boxes.cls.cpu().numpy().astype(np.int64)
+        )
+
+    async def _detect_specialized(self, models: Dict, image: np.ndarray):
+        """Run specialised models on one shared tensor and drop cross-model duplicates"""
+        tensor, ratio, pad = letterbox(image, self.imgsz)
+        types = list(models.keys())
+
+        results = await asyncio.gather(*[
+            detection_service.infer(e_type, models[e_type], tensor, self.confidence, self.nms_threshold)
+            for e_type in types
+        ])
+
+        boxes, scores, type_codes = [], [], []
+        for e_type, result in zip(types, results):
+            # Specialised models output class 0 for their own type, so the model decides the type
+            xyxy, conf, _ = self._result_arrays(result)
+            boxes.append(xyxy)
+            scores.append(conf)
+            type_codes.append(np.full(len(conf), TYPE_CODES[e_type], dtype=np.int64))
+
+        boxes = unletterbox_boxes(np.concatenate(boxes).reshape(-1, 4), ratio, pad)
+        scores = np.concatenate(scores)
+        type_codes = np.concatenate(type_codes)
+
+        keep = nms(boxes, scores, self.cross_model_iou)
+        logger.info(f"Specialised models: {len(boxes)} boxes, {len(boxes) - len(keep)} cross-model duplicates removed")
+
+        return boxes[keep], scores[keep], type_codes[keep]
+
+    def _measure_walls(self, table: DetectionTable, image_data: Dict, pixels_per_mm: float):
+        """Wall thickness from the shared page distance map, all walls in one indexing pass"""
+        walls = table.mask("wall")
+        if not walls.any():
+            return
+        dist = get_distance_map(image_data)
+        thickness_px = sample_wall_thickness(dist, table["bbox"][walls])
+        table.set_wall_thickness(walls, thickness_px / pixels_per_mm)
+
+    def _connect_walls(self, table: DetectionTable, pixels_per_mm: float) -> WallGraph:
+        """Snap wall endpoints into shared joints and record each wall's end nodes"""
+        walls = table.mask("wall")
+        graph = build_wall_graph(table["endpoints"][walls], self.wall_snap_mm * pixels_per_mm)
+        table["endpoints"][walls] = graph.snapped_endpoints()
+        table["nodes"][walls] = graph.wall_nodes
+        return graph
+
+    def _assign_to_walls(self, table: DetectionTable, pixels_per_mm: float):
+        """Resolve the host wall and insertion point of every door and window in one batch"""
+        openings = table.mask("door") | table.mask("window")
+        if not openings.any():
+            return
+        # Snapped centerlines, in wall-id order
+        walls = table["endpoints"][table.mask("wall")]
+        host, insertion, _ = assign_host_walls(
+            table["bbox"][openings], walls, self.opening_host_radius_mm * pixels_per_mm
+        )
+        table["host_wall"][openings] = host
+        table["insertion"][openings] = insertion
+
+    def _detect_rooms(self, table: DetectionTable, page_shape, pixels_per_mm: float) -> List[Dict]:
+        """Rooms from the wall centerlines, with doors and windows closed along their host walls"""
+        walls = table.mask("wall")
+        endpoints = table["endpoints"][walls]
+        thickness_px = table["thickness"][walls] * pixels_per_mm
+
+        openings = table.mask("door") | table.mask("window")
+        closures, hosts = opening_closures(
+            table["bbox"][openings], table["host_wall"][openings], table["insertion"][openings], endpoints
+        )
+        return room_segmenter.segment(
+            np.concatenate([endpoints, closures]),
+            np.concatenate([thickness_px, thickness_px[hosts]]),
+            page_shape,
+            pixels_per_mm
+        )
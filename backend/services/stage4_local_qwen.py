@@ -3,165 +3,266 @@ Stage 4: Local Qwen2.5-VL Analysis
 Uses local Qwen2.5-VL-7B-Instruct model for semantic analysis and control
 """
 
-import os
-import torch
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
-from PIL import Image
-from typing import Dict, Any
+from typing import Callable, Dict, Any, Optional
 from loguru import logger
 import json
-import io
+import os
+import time
+
+from backend.service.semantic.analysis_cache import semantic_cache, detection_summary
+from backend.service.semantic.cascade import semantic_cascade
+from backend.service.semantic.element_stream import ElementCallback, ElementStream
+from backend.service.semantic.image_prep import image_preparer, log_vision_call
+from backend.service.semantic.json_constraint import schema_token_budget
+from backend.service.semantic.room_naming import room_namer, unresolved_rooms, merge_room_analysis, merge_element_analysis
+from backend.service.semantic.qwen_service import get_qwen_client
+from backend.service.semantic.room_batches import RoomBatch, room_batch_planner, run_room_batches
+
+WALL_MATERIALS = ["Concrete", "Brick", "Gypsum"]
+WALL_FUNCTIONS = ["Exterior", "Interior"]
+# Bump whenever the prompt or the output schema changes, so cached answers aren't reused
+PROMPT_VERSION = "qwen-analysis-4"
+
 
 class Stage4LocalQwenAnalyzer:
     """Use local Qwen2.5-VL for semantic understanding and recipe generation"""
     
     def __init__(self):
-        # Switch to lighter model as per user request to avoid OOM
-        # Default: "Qwen/Qwen2.5-VL-3B-Instruct"
-        self.model_path = os.getenv("Qwen_MODEL_PATH", "Qwen/Qwen2.5-VL-3B-Instruct")
-        self.device = "cpu" if torch.cuda.is_available() else "cpu"
-        
-        try:
-            logger.info(f"Loading Qwen2.5-VL from {self.model_path} on {self.device}...")
-            
-            # Load Model with memory optimization
-            # 1. Use float16 (half precision)
-            # 2. device_map="auto" allows offloading to CPU if GPU is full
-            self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                self.model_path,
-                torch_dtype=torch.float32 if self.device == "cuda" else torch.float32,
-                device_map="auto",
-                low_cpu_mem_usage=True
-            )
-            
-            # Load Processor
-            self.processor = AutoProcessor.from_pretrained(self.model_path)
-            
-            logger.info("Qwen2.5-VL loaded successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to load Qwen2.5-VL: {str(e)}")
-            raise
+        # The model itself lives in the shared Qwen service (one copy per node),
+        # so creating analyzers is cheap
+        self.qwen = get_qwen_client()
+        # Hard ceiling; the actual cap is sized to the elements being labelled
+        self.max_new_tokens = int(os.getenv("QWEN_MAX_NEW_TOKENS", 4096))
+        # sheet: one whole-plan request | rooms: batched per-room crops
+        self.mode = os.getenv("STAGE4_MODE", "sheet")
+        # Apply each validated element as soon as its JSON closes instead of after the last token
+        self.streaming = os.getenv("STAGE4_STREAMING", "true").lower() == "true"
 
     async def analyze(
         self,
         image_data: Dict,
         detected_elements: Dict,
-        scale_info: Dict
+        scale_info: Dict,
+        on_element: Optional[ElementCallback] = None
     ) -> Dict:
         """
-        Analyze floor plan with Qwen2.5-VL
+        Analyze floor plan with Qwen2.5-VL.
+        on_element is awaited with (kind, element) for every element the answer enriches,
+        while tokens are still being generated.
         """
         logger.info("Analyzing with Local Qwen2.5-VL...")
+        if self.mode == "rooms":
+            return await self._analyze_rooms(image_data, detected_elements, scale_info)
         
-        # Prepare Image
-        pil_image = Image.fromarray(image_data["image"])
-        
-        # Create Prompt
-        prompt = self._create_prompt(detected_elements, scale_info)
+        # Confident walls are resolved from geometry; the model only labels the residue
+        routing = semantic_cascade.route(detected_elements, kinds=("walls",))
+        if not semantic_cascade.needs_llm(detected_elements, kinds=("walls", "rooms")):
+            logger.info("Everything resolved locally, Qwen not called")
+            enriched = await self._merge_data(detected_elements, {})
+            enriched["metadata"]["semantic_cascade"] = semantic_cascade.report(routing, skipped=True)
+            return enriched
         
-        # Prepare Inputs
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_image},
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ]
+        enriched = await self._analyze_sheet(image_data, detected_elements, scale_info, on_element)
+        enriched.setdefault("metadata", {})["semantic_cascade"] = semantic_cascade.report(routing, skipped=False)
+        return enriched
+
+    async def _analyze_sheet(
+        self,
+        image_data: Dict,
+        detected_elements: Dict,
+        scale_info: Dict,
+        on_element: Optional[ElementCallback] = None
+    ) -> Dict:
+        """One whole-plan request for the unresolved walls and unnamed rooms"""
+        messages, views, schema = self._build_request(image_data, detected_elements, scale_info)
         
-        text = self.processor.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True
+        # Same sheet, same detections, same prompt and model: reuse the earlier answer.
+        # The model is whatever the service serving us has loaded, not this process's env
+        model_id = await self.qwen.model_id()
+        cache_key = semantic_cache.key(
+            [v.image for v in views], detection_summary(detected_elements, scale_info), PROMPT_VERSION, model_id
         )
+        stream = ElementStream(detected_elements, on_element)
+        analysis = await semantic_cache.get(cache_key)
+        if analysis is not None:
+            logger.info("Qwen analysis served from the semantic cache")
+        else:
+            started = time.monotonic()
+            analysis = await self._call_qwen(messages, views, schema, on_text=stream.feed if self.streaming else None)
+            sent = len(semantic_cascade.residue_ids(detected_elements, "walls")) + \
+                len(semantic_cascade.residue_ids(detected_elements, "rooms"))
+            semantic_cascade.record_llm(time.monotonic() - started, sent)
+            if analysis is None:
+                # Fallback: return detected elements without enrichment (beyond entries already streamed)
+                await stream.finish()
+                return detected_elements
+            await semantic_cache.put(cache_key, model_id, analysis)
+        # Whatever wasn't streamed (cache hit, streaming off) goes through the same path
+        stream.replay(analysis)
+        await stream.finish()
         
-        image_inputs, video_inputs = process_vision_info(messages)
-        inputs = self.processor(
-            text=[text],
-            images=image_inputs,
-            videos=video_inputs,
-            padding=True,
-            return_tensors="pt",
-        )
+        # Merge
+        enriched = await self._merge_data(detected_elements, analysis)
+        logger.info("Qwen analysis complete")
+        return enriched
+
+    async def _analyze_rooms(self, image_data: Dict, detected_elements: Dict, scale_info: Dict) -> Dict:
+        """Label unnamed rooms from batched close-ups; merged by id through the same _merge_data"""
+        batches = room_batch_planner.plan(image_data, detected_elements.get('rooms', []), "qwen")
+        instructions = room_batch_planner.instructions()
+
+        async def call(batch: RoomBatch) -> Optional[Dict]:
+            messages = [
+                # Same text for every batch, so the service's prefix cache covers it
+                {"role": "system", "content": [{"type": "text", "text": instructions}]},
+                {
+                    "role": "user",
+                    "content": [
+                        *[{"type": "image", "image": v.image, "max_pixels": v.size[0] * v.size[1]} for v in batch.views],
+                        {"type": "text", "text": room_batch_planner.describe(batch, scale_info)},
+                    ],
+                }
+            ]
+            return await self._call_qwen(messages, batch.views, room_batch_planner.schema(batch))
 
+        rooms = await run_room_batches(batches, scale_info, await self.qwen.model_id(), call)
+        enriched = await self._merge_data(detected_elements, {"validated_elements": {"rooms": rooms}})
+        logger.info("Qwen room analysis complete")
+        return enriched
+
+    async def _call_qwen(
+        self,
+        messages,
+        views,
+        schema: Dict,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict]:
+        """Parsed JSON analysis, or None if the output wasn't valid JSON. on_text receives the text as it is generated."""
+        max_new_tokens = schema_token_budget(schema, self.max_new_tokens)
         
-        # Ensure all inputs are on CPU
-        inputs['input_ids'] = inputs['input_ids'].to('cpu')
-        inputs['attention_mask'] = inputs['attention_mask'].to('cpu') 
-        inputs['pixel_values'] = inputs['pixel_values'].to('cpu')
-        inputs = inputs.to(self.device)
-
-        # Generate
-        generated_ids = self.model.generate(**inputs, max_new_tokens=4096)
-        output_ids = output_ids.cpu()  # Move to CPU
-        generated_ids_trimmed = [
-            out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-        ]
-        output_text = self.processor.batch_decode(
-            generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )[0]
+        # Decoding is constrained to the schema, so the output is bare JSON that ends
+        # where the object closes
+        result = await self.qwen.generate(messages, max_new_tokens=max_new_tokens, json_schema=schema, on_text=on_text)
+        log_vision_call("Qwen", views, result.get("prompt_tokens"), result.get("prefill_s"), result.get("total_s", 0.0))
+        logger.info(f"Qwen output: {result.get('generated_tokens')}/{max_new_tokens} tokens, "
+                   f"{result.get('cached_prefix_tokens', 0)} prompt tokens from the prefix cache")
+        output_text = result["text"]
         
         # Parse JSON
         try:
-            # Extract JSON from code block if present
-            if "```json" in output_text:
-                output_text = output_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in output_text:
-                output_text = output_text.split("```")[1].strip()
-                
-            analysis = json.loads(output_text)
-            
-            # Merge
-            enriched = await self._merge_data(detected_elements, analysis)
-            logger.info("Qwen analysis complete")
-            return enriched
-            
+            return json.loads(output_text)
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse Qwen JSON output: {e}")
             logger.error(f"Raw Output: {output_text}")
-            # Fallback: return detected elements without enrichment
-            return detected_elements
+            return None
 
-    def _create_prompt(self, detected_elements: Dict, scale_info: Dict) -> str:
-        return f"""You are an expert architectural analyst. Analyze this floor plan image and the detected data below.
+    def _build_request(self, image_data: Dict, detected_elements: Dict, scale_info: Dict):
+        """Chat messages, the image views they carry, and the output schema"""
+        # Drawable region within QWEN_MAX_PIXELS (28px patches), plus close-ups of unnamed rooms
+        overview = image_preparer.prepare(image_data, "qwen")
+        details, detail_ids = image_preparer.prepare_room_details(image_data, detected_elements.get('rooms', []), "qwen")
+        views = [overview, *details]
         
-Data:
-- Scale: {scale_info['scale_string']}
-- Walls: {len(detected_elements['walls'])}
-- Doors: {len(detected_elements['doors'])}
-- Windows: {len(detected_elements['windows'])}
+        # Create Prompt
+        prompt = self._create_prompt(detected_elements, scale_info, overview, detail_ids)
+        schema = self._output_schema(detected_elements)
+        
+        # Prepare Inputs (images are already patch-aligned, so max_pixels = their own size).
+        # The instructions go first as a system message: identical on every call, so the
+        # Qwen service reuses their KV cache and only prefills the images and the data.
+        messages = [
+            {"role": "system", "content": [{"type": "text", "text": self._create_instructions()}]},
+            {
+                "role": "user",
+                "content": [
+                    *[{"type": "image", "image": v.image, "max_pixels": v.size[0] * v.size[1]} for v in views],
+                    {"type": "text", "text": prompt},
+                ],
+            }
+        ]
+        return messages, views, schema
+
+    def _create_instructions(self) -> str:
+        """Static part of the prompt - must not depend on the job, or the prefix cache misses"""
+        floorings = room_namer.floorings()
+        flooring = f', "flooring": "{"/".join(floorings)}"' if floorings else ""
+        return f"""You are an expert architectural analyst. Analyze the floor plan images and the detected data you are given.
 
 Task:
 1. Validate the element types (e.g., is it a bedroom or bathroom?).
 2. Infer materials (e.g., bathrooms have tiles, bedrooms have wood).
 3. Identify structural logic (thick walls are concrete, thin are partition).
+4. Only list the unnamed rooms given in the data under "rooms", and the walls still to classify
+   under "walls", using their ids.
 
-Output strictly valid JSON matching this schema:
+Output compact JSON (no code fences) matching this schema, rooms first:
 {{
   "validated_elements": {{
-    "walls": [
-      {{ "id": 0, "material": "Concrete/Brick/Gypsum", "function": "Exterior/Interior" }}
-    ],
     "rooms": [
-      {{ "id": 0, "purpose": "Living/Bedroom/Bath", "flooring": "Wood/Tile/Carpet" }}
+      {{ "id": 0, "purpose": "{'/'.join(room_namer.purposes())}"{flooring} }}
+    ],
+    "walls": [
+      {{ "id": 0, "material": "{'/'.join(WALL_MATERIALS)}", "function": "{'/'.join(WALL_FUNCTIONS)}" }}
     ]
   }},
   "design_intent": "Modern/Classic"
 }}
 """
 
+    def _create_prompt(self, detected_elements: Dict, scale_info: Dict, overview, detail_ids) -> str:
+        # Rooms already named from the PDF text layer are not sent again
+        pending_rooms = unresolved_rooms(detected_elements.get('rooms', []), overview.page_to_image)
+        return f"""Data:
+- Scale: {scale_info['scale_string']}
+- Walls: {len(detected_elements['walls'])}, still to classify (the others were resolved from geometry): {json.dumps(semantic_cascade.residue_ids(detected_elements, 'walls'))}
+- Doors: {len(detected_elements['doors'])}
+- Windows: {len(detected_elements['windows'])}
+- Unnamed rooms (id, label point in first-image pixels, area): {json.dumps(pending_rooms)}
+- The first image is the whole plan; the following images are close-ups of rooms {detail_ids}
+"""
+
+    def _output_schema(self, detected_elements: Dict) -> Dict:
+        """
+        Schema the decoder is held to. Ids and array lengths come from the detected elements,
+        so the output can't grow past what there is to label.
+        """
+        validated = {}
+        pending_ids = [r["id"] for r in detected_elements.get('rooms', []) if not r.get("resolved")]
+        if pending_ids:
+            validated["rooms"] = {
+                "type": "array",
+                "maxItems": len(pending_ids),
+                "items": {"type": "object", "properties": {
+                    "id": {"enum": pending_ids},
+                    **room_namer.label_properties()
+                }}
+            }
+        # Only walls the semantic cascade left unresolved
+        wall_ids = semantic_cascade.residue_ids(detected_elements, 'walls')
+        if wall_ids:
+            validated["walls"] = {
+                "type": "array",
+                "maxItems": len(wall_ids),
+                "items": {"type": "object", "properties": {
+                    "id": {"enum": wall_ids},
+                    "material": {"enum": WALL_MATERIALS},
+                    "function": {"enum": WALL_FUNCTIONS}
+                }}
+            }
+        return {"type": "object", "properties": {
+            "validated_elements": {"type": "object", "properties": validated},
+            "design_intent": {"type": "string", "maxLength": 40}
+        }}
+
     async def _merge_data(self, detected: Dict, analysis: Dict) -> Dict:
         enriched = detected.copy()
         enriched["metadata"] = {"design_intent": analysis.get("design_intent", "Unknown")}
         
-        # Merge logic (simplified)
-        validated_walls = analysis.get("validated_elements", {}).get("walls", [])
-        for i, wall in enumerate(enriched["walls"]):
-            if i < len(validated_walls):
-                wall.update(validated_walls[i])
+        # Walls by id: the model may label only some of them
+        merge_element_analysis(enriched["walls"], analysis.get("validated_elements", {}).get("walls", []))
+        
+        merge_room_analysis(enriched.get("rooms", []), analysis.get("validated_elements", {}).get("rooms", []))
                 
         return enriched
 
-# Helper for Qwen vision processing (standard boilerplate)
-from qwen_vl_utils import process_vision_info
 
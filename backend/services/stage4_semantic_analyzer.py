@@ -5,12 +5,22 @@ Using the new google-genai package
 
 import os
 import json
-from typing import Dict
+import time
+from typing import Callable, Dict, Optional
 from loguru import logger
-from PIL import Image
-from google import genai
 from google.genai import types
 
+from backend.service.semantic.analysis_cache import semantic_cache, detection_summary
+from backend.service.semantic.cascade import semantic_cascade
+from backend.service.semantic.element_stream import ElementCallback, ElementStream
+from backend.service.semantic.gemini_client import GeminiClient
+from backend.service.semantic.image_prep import image_preparer, log_vision_call
+from backend.service.semantic.room_batches import RoomBatch, room_batch_planner, run_room_batches
+from backend.service.semantic.room_naming import unresolved_rooms, merge_room_analysis, merge_element_analysis
+
+# Bump whenever the prompt or the expected JSON changes, so cached answers aren't reused
+PROMPT_VERSION = "gemini-analysis-4"
+
 
 class Stage4SemanticAnalyzer:
     """Use Google Gemini for semantic understanding"""
@@ -34,16 +44,21 @@ class Stage4SemanticAnalyzer:
         if not api_key:
             raise ValueError("GOOGLE_API_KEY not found in google_key.txt")
         
-        # Configure Gemini client
-        self.client = genai.Client(api_key=api_key)
+        # Configure Gemini client (async, shared concurrency cap, deadlines and retries)
         self.model_id = "gemini-2.5-flash"  # Latest model from the list
+        self.gemini = GeminiClient(api_key, self.model_id)
+        # sheet: one whole-plan request | rooms: batched per-room crops
+        self.mode = os.getenv("STAGE4_MODE", "sheet")
+        # Apply each validated element as soon as its JSON closes instead of after the last token
+        self.streaming = os.getenv("STAGE4_STREAMING", "true").lower() == "true"
         logger.info(f"✓ Google Gemini initialized with model: {self.model_id}")
     
     async def analyze(
         self,
         image_data: Dict,
         detected_elements: Dict,
-        scale_info: Dict
+        scale_info: Dict,
+        on_element: Optional[ElementCallback] = None
     ) -> Dict:
         """
         Analyze floor plan with Google Gemini
@@ -52,54 +67,145 @@ class Stage4SemanticAnalyzer:
             image_data: Processed image
             detected_elements: Elements from YOLO
             scale_info: Scale calibration
+            on_element: Awaited with (kind, element) for every element the answer enriches,
+                        while the response is still streaming (e.g. websocket_progress(job_id))
             
         Returns:
             Enriched and validated data
         """
         logger.info("Analyzing with Google Gemini...")
+        if self.mode == "rooms":
+            return await self._analyze_rooms(image_data, detected_elements, scale_info)
         
-        # Convert to PIL Image
-        pil_image = Image.fromarray(image_data["image"])
+        # Confident elements are resolved from geometry; Gemini only sees the residue
+        routing = semantic_cascade.route(detected_elements)
+        if not semantic_cascade.needs_llm(detected_elements):
+            logger.info("✓ Everything resolved locally, Gemini not called")
+            enriched = await self._merge_data(detected_elements, {})
+            enriched["metadata"]["semantic_cascade"] = semantic_cascade.report(routing, skipped=True)
+            return enriched
+        
+        enriched = await self._analyze_sheet(image_data, detected_elements, scale_info, on_element)
+        enriched.setdefault("metadata", {})["semantic_cascade"] = semantic_cascade.report(routing, skipped=False)
+        return enriched
+    
+    async def _analyze_sheet(
+        self,
+        image_data: Dict,
+        detected_elements: Dict,
+        scale_info: Dict,
+        on_element: Optional[ElementCallback] = None
+    ) -> Dict:
+        """One whole-plan request for the unresolved elements and unnamed rooms"""
+        # Drawable region within the token budget, plus close-ups of rooms the text layer didn't name
+        overview = image_preparer.prepare(image_data, "gemini")
+        details, detail_ids = image_preparer.prepare_room_details(image_data, detected_elements['rooms'], "gemini")
         
         # Create analysis prompt
-        prompt = self._create_prompt(detected_elements, scale_info)
+        prompt = self._create_prompt(detected_elements, scale_info, overview, detail_ids)
+        views = [overview, *details]
+        
+        # Same sheet, same detections, same prompt and model: reuse the earlier answer
+        cache_key = semantic_cache.key(
+            [v.image for v in views], detection_summary(detected_elements, scale_info), PROMPT_VERSION, self.model_id
+        )
+        stream = ElementStream(detected_elements, on_element)
+        analysis = await semantic_cache.get(cache_key)
+        if analysis is not None:
+            logger.info("✓ Gemini analysis served from the semantic cache")
+        else:
+            started = time.monotonic()
+            analysis = await self._call_gemini(prompt, views, on_text=stream.feed if self.streaming else None)
+            semantic_cascade.record_llm(time.monotonic() - started, self._pending_count(detected_elements))
+            if analysis is None:
+                # Fallback: return detected elements without enrichment (beyond entries already streamed)
+                await stream.finish()
+                return detected_elements
+            await semantic_cache.put(cache_key, self.model_id, analysis)
+        # Whatever wasn't streamed (cache hit, streaming off) goes through the same path
+        stream.replay(analysis)
+        await stream.finish()
+        
+        # Merge with detected elements
+        enriched = await self._merge_data(detected_elements, analysis)
+        
+        logger.info("✓ Gemini analysis complete")
         
-        # Call Gemini API with image and text
+        return enriched
+    
+    async def _analyze_rooms(self, image_data: Dict, detected_elements: Dict, scale_info: Dict) -> Dict:
+        """
+        Label unnamed rooms from close-ups, several rooms per request; batches run concurrently
+        under the Gemini limiter and are merged by id through the same _merge_data
+        """
+        detected_rooms = detected_elements.get('rooms', [])
+        if not detected_rooms:
+            logger.info("No rooms detected - skipping Gemini room analysis")
+            return detected_elements
+        batches = room_batch_planner.plan(image_data, detected_rooms, "gemini")
+        instructions = room_batch_planner.instructions()
+
+        async def call(batch: RoomBatch) -> Optional[Dict]:
+            prompt = f"{instructions}\n\n{room_batch_planner.describe(batch, scale_info)}"
+            # ~40 output tokens per room
+            return await self._call_gemini(prompt, batch.views, max_output_tokens=64 + 48 * len(batch.rooms))
+
+        rooms = await run_room_batches(batches, scale_info, self.model_id, call)
+        enriched = await self._merge_data(detected_elements, {"validated_elements": {"rooms": rooms}})
+        logger.info("✓ Gemini room analysis complete")
+        return enriched
+    
+    @staticmethod
+    def _pending_count(detected_elements: Dict) -> int:
+        """Elements and rooms the request asks about"""
+        kinds = ("walls", "doors", "windows", "rooms")
+        return sum(len(semantic_cascade.residue_ids(detected_elements, kind)) for kind in kinds)
+    
+    async def _call_gemini(
+        self,
+        prompt: str,
+        views,
+        max_output_tokens: int = 4000,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict]:
+        """Parsed JSON analysis, or None if the response wasn't valid JSON. With on_text the response is streamed."""
         try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=[prompt, pil_image],
-                config=types.GenerateContentConfig(
-                    temperature=0.1,
-                    max_output_tokens=4000,
-                )
+            started = time.monotonic()
+            contents = [prompt, *[v.image for v in views]]
+            config = types.GenerateContentConfig(
+                temperature=0.1,
+                max_output_tokens=max_output_tokens,
+                response_mime_type="application/json",
             )
-            
-            response_text = response.text
+            if on_text is not None:
+                response_text, usage = await self.gemini.generate_content_stream(contents, config, on_text)
+            else:
+                response = await self.gemini.generate_content(contents=contents, config=config)
+                response_text, usage = response.text, getattr(response, "usage_metadata", None)
+            log_vision_call("Gemini", views, getattr(usage, "prompt_token_count", None),
+                            None, time.monotonic() - started)
             
             # Clean and parse JSON
             response_text = response_text.replace('```json', '').replace('```', '').strip()
-            analysis = json.loads(response_text)
-            
-            # Merge with detected elements
-            enriched = await self._merge_data(detected_elements, analysis)
-            
-            logger.info("✓ Gemini analysis complete")
-            
-            return enriched
+            return json.loads(response_text)
             
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse Gemini JSON output: {e}")
             logger.error(f"Raw output: {response_text}")
-            # Fallback: return detected elements without enrichment
-            return detected_elements
+            return None
         except Exception as e:
             logger.error(f"Gemini API error: {e}")
             raise
     
-    def _create_prompt(self, detected_elements: Dict, scale_info: Dict) -> str:
+    def _create_prompt(self, detected_elements: Dict, scale_info: Dict, overview, detail_ids) -> str:
         """Create analysis prompt for Gemini"""
         
+        # Rooms already named from the PDF text layer are not sent again
+        pending_rooms = unresolved_rooms(detected_elements['rooms'], overview.page_to_image)
+        logger.info(f"Sending {len(pending_rooms)}/{len(detected_elements['rooms'])} unnamed rooms for analysis")
+        # Walls, doors and windows the cascade couldn't resolve
+        residue = {kind: semantic_cascade.residue_ids(detected_elements, kind) for kind in ("walls", "doors", "windows")}
+        
         return f"""You are an expert architectural analyst. Analyze this floor plan image and validate/enrich the detected elements.
 
 Detected Data:
@@ -107,9 +213,14 @@ Detected Data:
 - Walls: {len(detected_elements['walls'])} detected
 - Doors: {len(detected_elements['doors'])} detected
 - Windows: {len(detected_elements['windows'])} detected
-- Rooms: {len(detected_elements['rooms'])} detected
+- Rooms: {len(detected_elements['rooms'])} detected, {len(detected_elements['rooms']) - len(pending_rooms)} already named
+- Unnamed rooms (id, label point in first-image pixels, area): {json.dumps(pending_rooms)}
+- Elements still to classify (ids; the others were resolved from geometry): {json.dumps(residue)}
+- The first image is the whole plan; the following images are close-ups of rooms {detail_ids}
 
 Task: Provide architectural analysis in strict JSON format.
+Only list the unnamed rooms above under "rooms", using their ids (an empty list if there are none).
+Likewise only list the walls, doors and windows still to classify, using their ids.
 
 Required JSON schema:
 {{
@@ -182,28 +293,14 @@ IMPORTANT: Respond with ONLY valid JSON. No preamble, no explanation, just the J
             "total_floor_area": analysis.get("inferred_properties", {}).get("total_floor_area")
         }
         
-        # Enrich walls
-        validated_walls = analysis.get("validated_elements", {}).get("walls", [])
-        for i, wall in enumerate(enriched["walls"]):
-            if i < len(validated_walls):
-                wall.update(validated_walls[i])
-        
-        # Enrich doors
-        validated_doors = analysis.get("validated_elements", {}).get("doors", [])
-        for i, door in enumerate(enriched["doors"]):
-            if i < len(validated_doors):
-                door.update(validated_doors[i])
-        
-        # Enrich windows
-        validated_windows = analysis.get("validated_elements", {}).get("windows", [])
-        for i, window in enumerate(enriched["windows"]):
-            if i < len(validated_windows):
-                window.update(validated_windows[i])
-        
-        # Enrich rooms
+        # Enrich walls, doors and windows (by id - a dropped entry mustn't shift the rest)
+        validated = analysis.get("validated_elements", {})
+        merge_element_analysis(enriched["walls"], validated.get("walls", []))
+        merge_element_analysis(enriched["doors"], validated.get("doors", []))
+        merge_element_analysis(enriched["windows"], validated.get("windows", []))
+        
+        # Enrich rooms (by id - only unnamed rooms were sent)
         validated_rooms = analysis.get("validated_elements", {}).get("rooms", [])
-        for i, room in enumerate(enriched["rooms"]):
-            if i < len(validated_rooms):
-                room.update(validated_rooms[i])
+        merge_room_analysis(enriched["rooms"], validated_rooms)
         
         return enriched
\ No newline at end of file
@@ -9,8 +9,12 @@ import json
 from typing import Dict, List
 from pathlib import Path
 from datetime import datetime
+
+import numpy as np
 from loguru import logger
 
+from backend.service.geometry.model import GeometryModel, NO_ID
+
 
 class Stage6BIMEnrichment:
     """Generate Revit API transaction commands for native solid objects"""
@@ -28,11 +32,13 @@ class Stage6BIMEnrichment:
                 return json.load(f)
         return {}
     
-    async def generate(self, geometry_data: Dict, project_name: str) -> Dict:
+    async def generate(self, geometry_data, project_name: str) -> Dict:
         """
         Generate complete Revit transaction.
+        Reads Stage 5's GeometryModel arrays directly; a dict in the older per-element form is converted first.
         """
         logger.info(f"Generating Revit Native Transaction for {project_name}")
+        geometry = geometry_data if isinstance(geometry_data, GeometryModel) else GeometryModel.from_dict(geometry_data)
         
         transaction = {
             "version": self.revit_version,
@@ -47,65 +53,103 @@ class Stage6BIMEnrichment:
                 {"name": "Level 1", "elevation": 0},
                 {"name": "Level 2", "elevation": 3000}
             ],
-            "walls": await self._create_wall_commands(geometry_data['walls']),
-            "doors": await self._create_door_commands(geometry_data['doors']),
-            "windows": await self._create_window_commands(geometry_data['windows']),
-            "columns": await self._create_column_commands(geometry_data.get('columns', [])),
-            "floors": await self._create_floor_commands(geometry_data['floors']),
-            "rooms": await self._create_room_commands(geometry_data['rooms']),
+            "walls": await self._create_wall_commands(geometry),
+            "doors": await self._create_door_commands(geometry.doors, geometry.id_labels),
+            "windows": await self._create_window_commands(geometry.windows, geometry.id_labels),
+            "columns": await self._create_column_commands(geometry.columns),
+            "floors": await self._create_floor_commands(geometry),
+            "rooms": await self._create_room_commands(geometry.rooms),
             "views": await self._create_view_commands()
         }
         
         return transaction
 
-    async def _create_wall_commands(self, walls: List[Dict]) -> List[Dict]:
+    @staticmethod
+    def _points(xyz: np.ndarray) -> List[Dict]:
+        return [{"x": x, "y": y, "z": z} for x, y, z in xyz.tolist()]
+
+    async def _create_wall_commands(self, geometry: GeometryModel) -> List[Dict]:
         """Commands for Wall.Create (Native Solid)"""
+        walls = geometry.walls
+        # Whole columns at once: wall types by function, Python values in bulk
+        exterior = np.char.lower(walls["function"]) == "exterior"
+        wall_types = np.where(
+            exterior,
+            self.mapping.get('walls', {}).get('exterior', "Generic - 300mm"),
+            self.mapping.get('walls', {}).get('interior', "Generic - 200mm")
+        ).tolist()
+        # Non-integer ids (coded in the id column) go out as they came in
+        ids = [geometry.id_labels.get(wall_id, wall_id) for wall_id in walls["id"].tolist()]
+        starts, ends = self._points(walls["start"]), self._points(walls["end"])
+        heights = walls["height"].tolist()
+        structural = walls["structural"].tolist()
+        functions = walls["function"].tolist()
+        materials = walls["material"].tolist()
+        
         commands = []
-        for i, wall in enumerate(walls):
-            wall_type = self._get_wall_type(wall)
-            
+        for i, wall_id in enumerate(ids):
             cmd = {
+                "id": f"wall_{wall_id if wall_id != NO_ID else i}",
                 "command": "Wall.Create",
                 "parameters": {
                     "curve": {
-                        "start": wall["start_point"],
-                        "end": wall["end_point"]
+                        "start": starts[i],
+                        "end": ends[i]
                     },
-                    "wall_type": wall_type,
+                    "wall_type": wall_types[i],
                     "level": "Level 1",
-                    "height": wall["height"],
+                    "height": heights[i],
                     "offset": 0,
                     "flip": False,
-                    "structural": wall["is_structural"]
+                    "structural": structural[i],
+                    "joins": self._wall_joins(geometry.wall_joins(i) or {})
                 },
                 "properties": {
-                    "function": wall["function"],
-                    "material": wall["material"],
+                    "function": functions[i],
+                    "material": materials[i],
                     "fire_rating": ""
                 }
             }
             commands.append(cmd)
         return commands
 
-    def _get_wall_type(self, wall: Dict) -> str:
-        """Map thickness to Revit Wall Type"""
-        wall_function = wall.get('function', 'Interior')
-        if wall_function.lower() == 'exterior':
-            return self.mapping.get('walls', {}).get('exterior', "Generic - 300mm")
-        return self.mapping.get('walls', {}).get('interior', "Generic - 200mm")
+    def _wall_joins(self, joins: Dict) -> Dict:
+        """
+        Walls Revit should join at each end (ids match the Wall.Create command ids),
+        with the join type and face trims Stage 5 solved, when present
+        """
+        commands = {}
+        for end, join in joins.items():
+            command = {
+                "junction": join.get("junction"),
+                "walls": [f"wall_{w}" for w in join.get("walls", [])]
+            }
+            if "type" in join:
+                command["type"] = join["type"]
+                command["trim"] = join["trim"]
+            commands[end] = command
+        return commands
+
+    @staticmethod
+    def _host_wall_refs(openings: np.ndarray, id_labels: Dict) -> List:
+        """Wall.Create command id of each opening's host (None leaves it unhosted)"""
+        return [f"wall_{id_labels.get(host, host)}" if host != NO_ID else None
+                for host in openings["host_wall_id"].tolist()]
 
-    async def _create_door_commands(self, doors: List[Dict]) -> List[Dict]:
+    async def _create_door_commands(self, doors: np.ndarray, id_labels: Dict) -> List[Dict]:
         """Commands for FamilyInstance.Create (Native Doors)"""
+        families = self._family_infos(doors, "door")
+        locations = self._points(doors["location"])
+        hosts = self._host_wall_refs(doors, id_labels)
+        
         commands = []
-        for i, door in enumerate(doors):
-            family, symbol = self._get_family_info(door, "door")
-            
+        for (family, symbol), location, host in zip(families, locations, hosts):
             cmd = {
                 "parameters": {
                     "family": family,
                     "symbol": symbol,
-                    "location": door["location"],
-                    "host_wall_id": f"wall_{door.get('host_wall_id', 0)}",
+                    "location": location,
+                    "host_wall_id": host,
                     "level": "Level 1",
                     "rotation": 0
                 }
@@ -113,29 +157,38 @@ class Stage6BIMEnrichment:
             commands.append(cmd)
         return commands
 
-    async def _create_window_commands(self, windows: List[Dict]) -> List[Dict]:
+    async def _create_window_commands(self, windows: np.ndarray, id_labels: Dict) -> List[Dict]:
         """Commands for FamilyInstance.Create (Native Windows)"""
+        families = self._family_infos(windows, "window")
+        locations = self._points(windows["location"])
+        hosts = self._host_wall_refs(windows, id_labels)
+        
         commands = []
-        for i, window in enumerate(windows):
-            family, symbol = self._get_family_info(window, "window")
-            
+        for (family, symbol), location, host in zip(families, locations, hosts):
             cmd = {
                 "parameters": {
                     "family": family,
                     "symbol": symbol,
-                    "location": window["location"],
-                    "host_wall_id": f"wall_{window.get('host_wall_id', 0)}",
+                    "location": location,
+                    "host_wall_id": host,
                     "level": "Level 1"
                 }
             }
             commands.append(cmd)
         return commands
 
-    async def _create_column_commands(self, columns: List[Dict]) -> List[Dict]:
+    async def _create_column_commands(self, columns: np.ndarray) -> List[Dict]:
         """Commands for Column.Create (Native Structural Columns)"""
+        locations = self._points(columns["location"])
+        widths = columns["width"].tolist()
+        depths = columns["depth"].tolist()
+        heights = columns["height"].tolist()
+        shapes = columns["shape"].tolist()
+        materials = columns["material"].tolist()
+        
         commands = []
-        for i, column in enumerate(columns):
-            family, symbol = self._get_column_family(column)
+        for i, location in enumerate(locations):
+            family, symbol = self._get_column_family(shapes[i], widths[i], depths[i])
             
             cmd = {
                 "id": f"column_{i}",
@@ -143,26 +196,22 @@ class Stage6BIMEnrichment:
                 "parameters": {
                     "family": family,
                     "symbol": symbol,
-                    "location": column["location"],
+                    "location": location,
                     "level": "Level 1",
-                    "height": column.get("height", 2800),
+                    "height": heights[i],
                     "rotation": 0
                 },
                 "properties": {
-                    "width": column.get("width", 300),
-                    "depth": column.get("depth", 300),
-                    "material": column.get("material", "Concrete")
+                    "width": widths[i],
+                    "depth": depths[i],
+                    "material": materials[i]
                 }
             }
             commands.append(cmd)
         return commands
 
-    def _get_column_family(self, column: Dict) -> tuple:
+    def _get_column_family(self, shape: str, width: float, depth: float) -> tuple:
         """Select Revit Column Family based on shape"""
-        shape = column.get("shape", "rectangular")
-        width = column.get("width", 300)
-        depth = column.get("depth", 300)
-        
         if shape == "circular":
             family = "M_Concrete-Round-Column"
             symbol = f"{int(width)}mm"
@@ -172,31 +221,36 @@ class Stage6BIMEnrichment:
             
         return family, symbol
 
-    def _get_family_info(self, element: Dict, e_type: str) -> tuple:
+    def _family_infos(self, openings: np.ndarray, e_type: str) -> List[tuple]:
+        """Family and symbol per opening; looked up once per distinct (type, width)"""
+        keys = list(zip(np.char.lower(openings["type_name"]).tolist(), openings["width"].tolist()))
+        infos = {key: self._get_family_info(*key, e_type) for key in set(keys)}
+        return [infos[key] for key in keys]
+
+    def _get_family_info(self, type_name: str, width: float, e_type: str) -> tuple:
         """Get family and symbol from mapping"""
-        type_name = element.get('type_name', 'Standard').lower()
-        width = element.get('width', 900)
-        
         type_map = self.mapping.get(f'{e_type}s', {}).get(type_name, {})
         family = type_map.get('family', "M_Single-Flush" if e_type == "door" else "M_Fixed")
         
         symbols = type_map.get('symbols', {})
         if symbols:
-            widths = sorted([int(k) for k in symbols.keys()])
-            closest = min(widths, key=lambda x: abs(x - width))
-            symbol = symbols.get(str(closest))
+            # Keys are a width ("900") or width x height ("1200x1500")
+            by_width = {int(k.split('x')[0]): k for k in symbols.keys()}
+            closest = min(sorted(by_width), key=lambda x: abs(x - width))
+            symbol = symbols.get(by_width[closest])
         else:
             symbol = f"{int(width)}mm x 2100mm"
             
         return family, symbol
 
-    async def _create_floor_commands(self, floors: List[Dict]) -> List[Dict]:
+    async def _create_floor_commands(self, geometry: GeometryModel) -> List[Dict]:
         """Commands for Floor.Create (Native Solid)"""
         commands = []
-        for i, floor in enumerate(floors):
+        for i in range(len(geometry.floors)):
+            boundary = [{"x": x, "y": y} for x, y in geometry.slab_outline(geometry.floors, i).tolist()]
             cmd = {
                 "parameters": {
-                    "boundary": floor["boundary_points"],
+                    "boundary": boundary,
                     "floor_type": "Generic - 200mm",
                     "level": "Level 1",
                     "structural": True
@@ -205,16 +259,20 @@ class Stage6BIMEnrichment:
             commands.append(cmd)
         return commands
 
-    async def _create_room_commands(self, rooms: List[Dict]) -> List[Dict]:
+    async def _create_room_commands(self, rooms: np.ndarray) -> List[Dict]:
         """Commands for Room.Create (Native Revit Space)"""
+        names = rooms["name"].tolist()
+        numbers = rooms["number"].tolist()
+        points = self._points(rooms["center"])
+        
         commands = []
-        for i, room in enumerate(rooms):
+        for i, point in enumerate(points):
             cmd = {
                 "parameters": {
-                    "name": room["name"],
-                    "number": str(i + 1),
+                    "name": names[i],
+                    "number": numbers[i] or str(i + 1),
                     "level": "Level 1",
-                    "point": room["center_point"]
+                    "point": point
                 }
             }
             commands.append(cmd)
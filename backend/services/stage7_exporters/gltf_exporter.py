@@ -8,46 +8,98 @@ import numpy as np
 from pathlib import Path
 from loguru import logger
 
+from backend.service.geometry.model import GeometryModel
+from backend.service.geometry.wall_mesh import wall_mesh
+
+# Corners of a unit box (x along the element, y across it, z up) and its 12 triangles
+_BOX_CORNERS = np.array([
+    [-1, -1, 0], [1, -1, 0], [1, 1, 0], [-1, 1, 0],
+    [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1]
+], dtype=np.float64)
+_BOX_FACES = np.array([
+    [0, 2, 1], [0, 3, 2], [4, 5, 6], [4, 6, 7],
+    [0, 1, 5], [0, 5, 4], [1, 2, 6], [1, 6, 5],
+    [2, 3, 7], [2, 7, 6], [3, 0, 4], [3, 4, 7]
+], dtype=np.int64)
+
+
+def extruded_quads(corners: np.ndarray, height: np.ndarray) -> trimesh.Trimesh:
+    """
+    One mesh holding N prisms standing on z=0, built with array operations.
+
+    Args:
+        corners: (N, 4, 2) counter-clockwise footprints
+        height: (N,) extrusion heights
+    """
+    n = len(corners)
+    xy = np.concatenate([corners, corners], axis=1)
+    z = _BOX_CORNERS[None, :, 2] * np.asarray(height, dtype=np.float64)[:, None]
+    vertices = np.concatenate([xy, z[..., None]], axis=2).reshape(-1, 3)
+    faces = (_BOX_FACES[None] + 8 * np.arange(n)[:, None, None]).reshape(-1, 3)
+    return trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+
+
+def oriented_boxes(center: np.ndarray, direction: np.ndarray, length: np.ndarray,
+                   width: np.ndarray, height: np.ndarray) -> trimesh.Trimesh:
+    """
+    One mesh holding N boxes standing on z=0, built with array operations.
+
+    Args:
+        center: (N, 2) footprint centres
+        direction: (N, 2) unit vectors along the length
+        length, width, height: (N,) extents
+    """
+    normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1)
+    half_l, half_w = length[:, None] / 2, width[:, None] / 2
+    # (N, 4, 2): scale the unit corners, rotate into the element frame, translate
+    corners = (center[:, None, :]
+               + _BOX_CORNERS[None, :4, 0:1] * half_l[:, None] * direction[:, None, :]
+               + _BOX_CORNERS[None, :4, 1:2] * half_w[:, None] * normal[:, None, :])
+    return extruded_quads(corners, height)
+
+
 class GltfExporter:
-    async def export(self, geometry_data: dict, output_path: str) -> str:
-        """Export geometry to glTF/GLB"""
+    async def export(self, geometry_data, output_path: str) -> str:
+        """Export geometry (Stage 5 GeometryModel, or the per-element dict form) to glTF/GLB"""
         logger.info(f"Exporting glTF to {output_path}")
-        
+        geometry = geometry_data if isinstance(geometry_data, GeometryModel) else GeometryModel.from_dict(geometry_data)
+
         Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         scene = trimesh.Scene()
-        
-        # Add walls
-        for wall in geometry_data.get("walls", []):
-            s, e = wall["start_point"], wall["end_point"]
-            dx, dy = e["x"] - s["x"], e["y"] - s["y"]
-            length = np.sqrt(dx**2 + dy**2)
-            angle = np.arctan2(dy, dx)
-            
-            box = trimesh.creation.box(extents=[length, wall["thickness"], wall["height"]])
-            transform = trimesh.transformations.translation_matrix([
-                (s["x"] + e["x"]) / 2,
-                (s["y"] + e["y"]) / 2,
-                wall["height"] / 2
-            ])
-            rotation = trimesh.transformations.rotation_matrix(angle, [0, 0, 1])
-            box.apply_transform(trimesh.transformations.concatenate_matrices(transform, rotation))
-            box.visual.face_colors = [200, 200, 200, 255]
-            scene.add_geometry(box)
-            
-        # Add columns
-        for col in geometry_data.get("columns", []):
-            loc = col["location"]
-            if col["shape"] == "circular":
-                mesh = trimesh.creation.cylinder(radius=col["width"]/2, height=col["height"])
-            else:
-                mesh = trimesh.creation.box(extents=[col["width"], col["depth"], col["height"]])
-                
-            transform = trimesh.transformations.translation_matrix([
-                loc["x"], loc["y"], col["height"]/2
-            ])
-            mesh.apply_transform(transform)
+
+        # Add walls: every wall in one mesh, footprints cut to their solved joins,
+        # doors and windows cut out as holes
+        walls = geometry.walls
+        if len(walls):
+            vertices, faces = wall_mesh(walls, np.concatenate([geometry.doors, geometry.windows]))
+            mesh = trimesh.Trimesh(vertices=vertices, faces=faces, process=False)
+            mesh.visual.face_colors = [200, 200, 200, 255]
+            scene.add_geometry(mesh, geom_name="walls")
+
+        # Add columns: rectangular ones batched, circular ones as cylinders
+        columns = geometry.columns
+        circular = columns["shape"] == "circular"
+        boxes = columns[~circular]
+        if len(boxes):
+            axis = np.tile([1.0, 0.0], (len(boxes), 1))
+            mesh = oriented_boxes(boxes["location"][:, :2], axis, boxes["width"], boxes["depth"], boxes["height"])
+            mesh.visual.face_colors = [150, 150, 150, 255]
+            scene.add_geometry(mesh, geom_name="columns")
+        for col in columns[circular]:
+            x, y, _ = col["location"]
+            mesh = trimesh.creation.cylinder(radius=col["width"] / 2, height=col["height"])
+            mesh.apply_transform(trimesh.transformations.translation_matrix([x, y, col["height"] / 2]))
             mesh.visual.face_colors = [150, 150, 150, 255]
             scene.add_geometry(mesh)
-            
+
+        # Add floors and ceilings: triangulated, extruded slabs, one mesh each
+        for slabs, name, upward, color in ((geometry.floors, "floors", False, [180, 170, 150, 255]),
+                                           (geometry.ceilings, "ceilings", True, [235, 235, 235, 255])):
+            buffers = geometry.slab_buffers(slabs, upward=upward)
+            if len(buffers):
+                mesh = trimesh.Trimesh(vertices=buffers.vertices, faces=buffers.faces, process=False)
+                mesh.visual.face_colors = color
+                scene.add_geometry(mesh, geom_name=name)
+
         scene.export(output_path)
         return output_path
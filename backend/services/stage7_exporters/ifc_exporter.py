@@ -1,10 +1,112 @@
 """
 Stage 7: IFC Exporter
-Placeholder for IFC export functionality using IfcOpenShell
+Writes IFC4 (STEP physical file) directly; IfcOpenShell is not a dependency.
+Floors and ceilings are exported as triangulated slabs from the same buffers the glTF exporter uses.
 """
 
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from loguru import logger
+
+from backend.service.geometry.model import GeometryModel
+from backend.service.geometry.polygons import SlabBuffers
+
+_GUID_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_$"
+
+
+def ifc_guid() -> str:
+    """New IFC GlobalId: a UUID in IFC's 22-character base-64 form"""
+    n = uuid.uuid4().int
+    chars = []
+    for _ in range(22):
+        n, digit = divmod(n, 64)
+        chars.append(_GUID_CHARS[digit])
+    return "".join(reversed(chars))
+
+
+def _real(value: float) -> str:
+    """STEP REAL (always with a decimal point)"""
+    return f"{value:.4f}"
+
+
+class _StepWriter:
+    """Numbers entities as they are added and renders the DATA section"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def add(self, entity: str) -> str:
+        ref = f"#{len(self.lines) + 1}"
+        self.lines.append(f"{ref}={entity};")
+        return ref
+
+
 class IFCExporter:
-    async def export(self, geometry_data: dict, output_path: str) -> str:
-        """Export geometry to IFC"""
-        # Placeholder for future implementation
-        return ""
+    async def export(self, geometry_data, output_path: str) -> str:
+        """Export geometry (Stage 5 GeometryModel, or the per-element dict form) to IFC4"""
+        logger.info(f"Exporting IFC to {output_path}")
+        geometry = geometry_data if isinstance(geometry_data, GeometryModel) else GeometryModel.from_dict(geometry_data)
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+        step = _StepWriter()
+        units = step.add(f"IFCUNITASSIGNMENT(({step.add('IFCSIUNIT(*,.LENGTHUNIT.,.MILLI.,.METRE.)')},"
+                         f"{step.add('IFCSIUNIT(*,.PLANEANGLEUNIT.,$,.RADIAN.)')}))")
+        origin = step.add(f"IFCAXIS2PLACEMENT3D({step.add('IFCCARTESIANPOINT((0.,0.,0.))')},$,$)")
+        context = step.add(f"IFCGEOMETRICREPRESENTATIONCONTEXT($,'Model',3,1.E-05,{origin},$)")
+        project = step.add(f"IFCPROJECT('{ifc_guid()}',$,'Project',$,$,$,$,({context}),{units})")
+
+        site_place = step.add(f"IFCLOCALPLACEMENT($,{origin})")
+        site = step.add(f"IFCSITE('{ifc_guid()}',$,'Site',$,$,{site_place},$,$,.ELEMENT.,$,$,$,$,$)")
+        building_place = step.add(f"IFCLOCALPLACEMENT({site_place},{origin})")
+        building = step.add(f"IFCBUILDING('{ifc_guid()}',$,'Building',$,$,{building_place},$,$,.ELEMENT.,$,$,$)")
+        storey_place = step.add(f"IFCLOCALPLACEMENT({building_place},{origin})")
+        storey = step.add(f"IFCBUILDINGSTOREY('{ifc_guid()}',$,'Level 1',$,$,{storey_place},$,$,.ELEMENT.,0.)")
+        step.add(f"IFCRELAGGREGATES('{ifc_guid()}',$,$,$,{project},({site}))")
+        step.add(f"IFCRELAGGREGATES('{ifc_guid()}',$,$,$,{site},({building}))")
+        step.add(f"IFCRELAGGREGATES('{ifc_guid()}',$,$,$,{building},({storey}))")
+
+        elements = []
+        elements += self._slabs(step, geometry.floors, geometry.slab_buffers(geometry.floors),
+                                "IFCSLAB", ".FLOOR.", context, storey_place, origin)
+        elements += self._slabs(step, geometry.ceilings, geometry.slab_buffers(geometry.ceilings, upward=True),
+                                "IFCCOVERING", ".CEILING.", context, storey_place, origin)
+        if elements:
+            step.add(f"IFCRELCONTAINEDINSPATIALSTRUCTURE('{ifc_guid()}',$,$,$,({','.join(elements)}),{storey})")
+
+        name = Path(output_path).name
+        header = [
+            "ISO-10303-21;",
+            "HEADER;",
+            "FILE_DESCRIPTION(('ViewDefinition [ReferenceView]'),'2;1');",
+            f"FILE_NAME('{name}','{datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}',(''),(''),"
+            "'Amplify Floor Plan AI','Amplify Floor Plan AI','');",
+            "FILE_SCHEMA(('IFC4'));",
+            "ENDSEC;",
+            "DATA;"
+        ]
+        with open(output_path, "w", encoding="ascii") as f:
+            f.write("\n".join(header + step.lines + ["ENDSEC;", "END-ISO-10303-21;", ""]))
+
+        logger.info(f"IFC: {len(elements)} slabs and coverings written")
+        return output_path
+
+    def _slabs(self, step: _StepWriter, slabs: np.ndarray, buffers: SlabBuffers,
+               entity: str, predefined: str, context: str, placement: str, origin: str) -> List[str]:
+        """One product per slab, its body an IfcTriangulatedFaceSet straight from the buffers"""
+        refs = []
+        for i, row in enumerate(buffers.slab.tolist()):
+            vertices, faces = buffers.slab_mesh(i)
+            coords = ",".join(f"({_real(x)},{_real(y)},{_real(z)})" for x, y, z in vertices.tolist())
+            index = ",".join(f"({a},{b},{c})" for a, b, c in (faces + 1).tolist())
+            points = step.add(f"IFCCARTESIANPOINTLIST3D(({coords}))")
+            body = step.add(f"IFCTRIANGULATEDFACESET({points},$,.T.,({index}),$)")
+            shape = step.add(f"IFCSHAPEREPRESENTATION({context},'Body','Tessellation',({body}))")
+            product_shape = step.add(f"IFCPRODUCTDEFINITIONSHAPE($,$,({shape}))")
+            local = step.add(f"IFCLOCALPLACEMENT({placement},{origin})")
+            name = str(slabs["id"][row])
+            refs.append(step.add(f"{entity}('{ifc_guid()}',$,'{name}',$,$,{local},{product_shape},$,{predefined})"))
+        return refs
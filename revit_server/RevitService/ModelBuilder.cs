@@ -15,6 +15,8 @@ namespace RevitService
         private Application revitApp;
         private Document doc;
         private const double MM_TO_FEET = 1.0 / 304.8;
+        // Elements created in this transaction, keyed by their command id (e.g. "wall_3")
+        private readonly Dictionary<string, ElementId> createdElements = new Dictionary<string, ElementId>();
 
         public ModelBuilder()
         {
@@ -132,9 +134,44 @@ namespace RevitService
                 );
 
                 SetWallProperties(wall, wallCmd.Properties);
+                if (!string.IsNullOrEmpty(wallCmd.Id)) createdElements[wallCmd.Id] = wall.Id;
+            }
+
+            JoinWalls(walls);
+        }
+
+        private void JoinWalls(List<WallCommand> walls)
+        {
+            // Endpoints arrive snapped to shared nodes and, when solved, with the join type
+            // of every end, so Revit doesn't have to infer how each junction is cleaned up
+            foreach (var wallCmd in walls)
+            {
+                Wall? wall = GetElementById<Wall>(wallCmd.Id);
+                var joins = wallCmd.Parameters.Joins;
+                if (wall == null || joins == null) continue;
+
+                ApplyJoin(wall, 0, joins.Start);
+                ApplyJoin(wall, 1, joins.End);
             }
         }
 
+        private static void ApplyJoin(Wall wall, int end, WallJoinEnd? join)
+        {
+            if (join == null) return;
+            if (join.Type == "free")
+            {
+                WallUtils.DisallowWallJoinAtEnd(wall, end);
+                return;
+            }
+            if (!(join.Walls?.Count > 0)) return;
+
+            WallUtils.AllowWallJoinAtEnd(wall, end);
+            LocationCurve? location = wall.Location as LocationCurve;
+            if (location == null) return;
+            if (join.Type == "miter") location.set_JoinType(end, JoinType.Miter);
+            else if (join.Type == "abut" || join.Type == "butt") location.set_JoinType(end, JoinType.Abut);
+        }
+
         private void CreateDoors(List<DoorCommand>? doors)
         {
             if (doors == null) return;
@@ -321,10 +358,7 @@ namespace RevitService
         private T? GetElementById<T>(string? id) where T : Element
         {
             if (string.IsNullOrEmpty(id)) return null;
-            // TODO: Implement proper lookup (e.g. using a dictionary of created elements or ElementId)
-            // Example placeholder:
-            // return doc.GetElement(new ElementId(long.Parse(id))) as T;
-            return null;
+            return createdElements.TryGetValue(id, out ElementId elementId) ? doc.GetElement(elementId) as T : null;
         }
 
         private WallType? GetWallType(string? name)
@@ -386,7 +420,7 @@ namespace RevitService
     }
 
     public class LevelCommand { public string Name { get; set; } = default!; public double Elevation { get; set; } }
-    public class WallCommand { public WallParameters Parameters { get; set; } = default!; public WallProperties Properties { get; set; } = default!; }
+    public class WallCommand { public string Id { get; set; } = default!; public WallParameters Parameters { get; set; } = default!; public WallProperties Properties { get; set; } = default!; }
     public class WallParameters
     {
         public CurveData Curve { get; set; } = default!;
@@ -396,6 +430,15 @@ namespace RevitService
         public double Offset { get; set; }
         public bool Flip { get; set; }
         public bool Structural { get; set; }
+        public WallJoins Joins { get; set; } = default!;
+    }
+    public class WallJoins { public WallJoinEnd Start { get; set; } = default!; public WallJoinEnd End { get; set; } = default!; }
+    public class WallJoinEnd
+    {
+        public string Junction { get; set; } = default!;
+        public List<string> Walls { get; set; } = default!;
+        public string? Type { get; set; }          // free | miter | butt | abut (Stage 5 join solver)
+        public List<double>? Trim { get; set; }    // left / right face cut back from the node, mm
     }
     public class CurveData { public PointData Start { get; set; } = default!; public PointData End { get; set; } = default!; }
     public class PointData { public double X { get; set; } public double Y { get; set; } public double Z { get; set; } }
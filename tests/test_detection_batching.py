@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.service.detection.batching import DetectionService
+
+
+class _Model:
+    """Stands in for a YOLO model: one result per tile, records every batch it runs"""
+
+    def __init__(self, fail: Exception = None, drop_one: bool = False):
+        self.batches = []
+        self.fail = fail
+        self.drop_one = drop_one
+
+    def predict(self, sources, conf, iou, verbose):
+        self.batches.append(list(sources))
+        if self.fail is not None:
+            raise self.fail
+        results = [f"result-{tile}" for tile in sources]
+        return results[:-1] if self.drop_one else results
+
+
+def _service(max_batch=4, max_wait_ms=50.0) -> DetectionService:
+    service = DetectionService()
+    service.max_batch_size = max_batch
+    service.max_wait_s = max_wait_ms / 1000
+    service.idle_timeout_s = 0.05
+    return service
+
+
+async def _infer_all(service, model, tiles):
+    return await asyncio.gather(*(service.infer("all", model, tile, 0.25, 0.45) for tile in tiles),
+                                return_exceptions=True)
+
+
+def test_concurrent_tiles_share_forward_passes():
+    service, model = _service(max_batch=4), _Model()
+    results = asyncio.run(_infer_all(service, model, range(6)))
+    assert results == [f"result-{i}" for i in range(6)]
+    assert [len(b) for b in model.batches] == [4, 2]
+    assert service.metrics.batches == 2 and service.metrics.requests == 6
+
+
+def test_a_lone_tile_is_flushed_at_its_deadline():
+    service, model = _service(max_batch=8, max_wait_ms=20), _Model()
+
+    async def run():
+        started = time.monotonic()
+        result = await service.infer("all", model, 0, 0.25, 0.45)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+    assert result == "result-0"
+    assert model.batches == [[0]]
+    assert 0.015 <= elapsed < 1.0
+
+
+@pytest.mark.parametrize("model", [_Model(fail=RuntimeError("CUDA out of memory")), _Model(drop_one=True)],
+                         ids=["predict raises", "result count mismatch"])
+def test_a_failed_batch_fails_every_caller(model):
+    service = _service(max_batch=4)
+    results = asyncio.run(_infer_all(service, model, range(3)))
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_stacking_errors_fail_callers_and_the_worker_keeps_serving():
+    service, model = _service(max_batch=4), _Model()
+
+    def broken(tiles):
+        raise RuntimeError("Sizes of tensors must match")
+
+    async def run():
+        service._stack_sources = broken
+        failed = await _infer_all(service, model, range(3))
+        del service._stack_sources
+        return failed, await service.infer("all", model, 7, 0.25, 0.45)
+
+    failed, recovered = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in failed)
+    assert recovered == "result-7"
+
+
+def test_a_worker_that_dies_unregisters_and_fails_what_it_holds():
+    service, model = _service(max_batch=4), _Model()
+
+    async def crash(*args):
+        raise ValueError("worker bug")
+
+    async def run():
+        service._run_batch = crash
+        results = await _infer_all(service, model, range(3))
+        await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert service._workers == {} and service._queues == {}
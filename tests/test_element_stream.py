@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from backend.service.semantic.element_stream import ElementStream, ValidatedElementParser
+
+ANSWER = {
+    "design_intent": "Two-bedroom flat, {walls: [not an element]}",
+    "validated_elements": {
+        "walls": [{"id": 3, "function": "Exterior", "material": "Brick"}, {"id": 4, "material": "Gypsum"}],
+        "doors": [],
+        "rooms": [{"id": 1, "name": "Kitchen \"K1\"", "flooring": "Tile"}]
+    }
+}
+
+
+def _detected():
+    return {
+        "walls": [{"id": 3, "wall_function": "interior"}, {"id": 4, "resolved": True, "material": "Concrete"}],
+        "doors": [],
+        "windows": [],
+        "rooms": [{"id": 1}]
+    }
+
+
+def test_parser_emits_each_entry_once_its_object_closes():
+    text = json.dumps(ANSWER)
+    parser = ValidatedElementParser()
+    emitted = []
+    for i in range(len(text)):
+        emitted.extend((i, kind, entry) for kind, entry in parser.feed(text[i]))
+
+    assert [(kind, entry) for _, kind, entry in emitted] == [
+        ("walls", ANSWER["validated_elements"]["walls"][0]),
+        ("walls", ANSWER["validated_elements"]["walls"][1]),
+        ("rooms", ANSWER["validated_elements"]["rooms"][0])
+    ]
+    # The first wall arrives as soon as its brace closes, long before the document ends
+    assert text[emitted[0][0]] == "}" and emitted[0][0] < text.index('"rooms"')
+
+
+def test_stream_merges_by_id_and_skips_resolved_elements():
+    detected = _detected()
+    seen = []
+
+    async def on_element(kind, element):
+        seen.append((kind, element["id"]))
+
+    async def run():
+        stream = ElementStream(detected, on_element)
+        text = json.dumps(ANSWER)
+        for start in range(0, len(text), 7):
+            stream.feed(text[start:start + 7])
+        # A replay of the same answer (e.g. the final parse) applies nothing twice
+        stream.replay(ANSWER)
+        return await stream.finish()
+
+    assert asyncio.run(run()) == 2
+    assert seen == [("walls", 3), ("rooms", 1)]
+    assert detected["walls"][0]["wall_function"] == "exterior"
+    assert detected["walls"][1]["material"] == "Concrete"
+    assert detected["rooms"][0]["name"] == 'Kitchen "K1"'
+
+
+def test_replay_applies_answers_that_were_not_streamed():
+    detected = _detected()
+
+    async def run():
+        stream = ElementStream(detected)
+        stream.replay(ANSWER)
+        return await stream.finish()
+
+    assert asyncio.run(run()) == 2
+    assert detected["walls"][0]["material"] == "Brick"
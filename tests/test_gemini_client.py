@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+from google import genai
+from google.genai import errors, types
+
+from backend.service.semantic.gemini_client import GeminiClient, GeminiTimeout, gemini_limiter
+
+OK = {"candidates": [{"content": {"role": "model", "parts": [{"text": '{"rooms": []}'}]}}]}
+
+
+def _error(code: int) -> httpx.Response:
+    return httpx.Response(code, json={"error": {"code": code, "message": "fake", "status": "FAKE"}})
+
+
+def _client(handler, max_attempts: int = 4, attempt_timeout_s: float = 5.0) -> GeminiClient:
+    """GeminiClient whose HTTP requests are answered by `handler` instead of the network"""
+    client = GeminiClient("test-key", "gemini-test")
+    client.max_attempts = max_attempts
+    client.attempt_timeout_s = attempt_timeout_s
+    client.backoff_base_s = 0.001
+    client.client = genai.Client(api_key="test-key", http_options=types.HttpOptions(
+        base_url="http://gemini.test",
+        httpx_async_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    ))
+    return client
+
+
+def test_retries_rate_limits_and_server_errors():
+    answers = [_error(429), _error(503), httpx.Response(200, json=OK)]
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return answers[len(requests) - 1]
+
+    retries = gemini_limiter.retries
+    response = asyncio.run(_client(handler).generate_content("plan"))
+
+    assert response.text == '{"rooms": []}'
+    assert len(requests) == 3
+    assert gemini_limiter.retries == retries + 2
+
+
+def test_client_errors_are_not_retried():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return _error(400)
+
+    with pytest.raises(errors.APIError) as raised:
+        asyncio.run(_client(handler).generate_content("plan"))
+    assert raised.value.code == 400
+    assert len(requests) == 1
+
+
+def test_last_retryable_error_is_raised_after_max_attempts():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return _error(500)
+
+    failures = gemini_limiter.failures
+    with pytest.raises(errors.APIError) as raised:
+        asyncio.run(_client(handler, max_attempts=3).generate_content("plan"))
+    assert raised.value.code == 500
+    assert len(requests) == 3
+    assert gemini_limiter.failures == failures + 1
+
+
+def test_attempts_that_time_out_end_in_gemini_timeout():
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(1.0)
+        return httpx.Response(200, json=OK)
+
+    timeouts = gemini_limiter.timeouts
+    with pytest.raises(GeminiTimeout):
+        asyncio.run(_client(handler, max_attempts=2, attempt_timeout_s=0.05).generate_content("plan"))
+    assert len(requests) == 2
+    assert gemini_limiter.timeouts == timeouts + 1
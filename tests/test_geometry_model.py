@@ -0,0 +1,53 @@
+import numpy as np
+
+from backend.service.geometry.model import NO_ID, GeometryModel
+from backend.service.geometry.transforms import px_to_model
+
+DEFAULTS = {"wall_height": 2800, "wall_thickness": 200, "door_height": 2100, "window_height": 1200,
+            "sill_height": 900, "floor_thickness": 200}
+LONG_MATERIAL = "Reinforced concrete, 250 mm, fair-faced both sides"
+
+
+def _elements():
+    return {
+        "walls": [
+            {"id": "W-ext-1", "endpoints": [[0, 0], [500, 0]], "wall_function": "exterior", "material": LONG_MATERIAL},
+            {"id": 7, "endpoints": [[500, 0], [500, 400]]}
+        ],
+        "doors": [{"id": "D1", "center": [250, 0], "host_wall_id": "W-ext-1", "door_type": "double leaf, fire rated EI30"}],
+        "windows": [{"id": 3, "center": [500, 200], "host_wall_id": 7}, {"center": [0, 0]}],
+        "rooms": [{"id": "R 101", "center": [250, 200], "name": "Open-plan living, dining and kitchen area with bay window"}]
+    }
+
+
+def test_text_fields_are_not_truncated():
+    model = GeometryModel.from_elements(_elements(), px_to_model(1.0), DEFAULTS)
+    assert model.walls["material"][0] == LONG_MATERIAL
+    assert model.walls["material"][1] == "Concrete"
+    assert model.doors["type_name"][0] == "double leaf, fire rated EI30"
+    assert model.rooms["name"][0] == _elements()["rooms"][0]["name"]
+    # Doors and windows still concatenate for the wall mesh despite different string widths
+    assert len(np.concatenate([model.doors, model.windows])) == 3
+
+
+def test_non_integer_ids_survive_and_keep_their_references():
+    model = GeometryModel.from_elements(_elements(), px_to_model(1.0), DEFAULTS)
+    ids = model.walls["id"]
+    assert ids[1] == 7 and ids[0] < NO_ID
+    # The door's host is the same code as the wall it names
+    assert model.doors["host_wall_id"][0] == ids[0]
+    assert model.windows["host_wall_id"].tolist() == [7, NO_ID]
+
+    geometry = model.to_dict()
+    assert [w["id"] for w in geometry["walls"]] == ["W-ext-1", 7]
+    assert geometry["doors"][0]["id"] == "D1" and geometry["doors"][0]["host_wall_id"] == "W-ext-1"
+    assert [w["id"] for w in geometry["windows"]] == [3, None]
+    assert geometry["rooms"][0]["id"] == "R 101"
+
+
+def test_dict_round_trip():
+    geometry = GeometryModel.from_elements(_elements(), px_to_model(2.0), DEFAULTS).to_dict()
+    again = GeometryModel.from_dict(geometry).to_dict()
+    assert again["walls"] == geometry["walls"]
+    assert again["doors"] == geometry["doors"]
+    assert again["rooms"] == geometry["rooms"]
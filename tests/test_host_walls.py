@@ -0,0 +1,32 @@
+import numpy as np
+
+from backend.service.geometry.host_walls import assign_host_walls
+
+
+def test_wall_through_the_opening_centre_wins_ties():
+    # Window box 100 wide, 20 deep; three parallel centerlines cross the box, the middle one
+    # through its centre, listed last so index order alone would pick a face wall
+    boxes = np.array([[450, 90, 550, 110]])
+    walls = np.array([
+        [[0, 93], [1000, 93]],
+        [[0, 107], [1000, 107]],
+        [[0, 100], [1000, 100]],
+    ])
+    host, insertion, _ = assign_host_walls(boxes, walls, search_radius=50)
+    assert host.tolist() == [2]
+    assert insertion[0].tolist() == [500, 100]
+
+
+def test_openings_out_of_range_stay_unhosted():
+    boxes = np.array([[450, 90, 550, 110], [450, 900, 550, 920]])
+    walls = np.array([[[0, 100], [1000, 100]], [[0, 300], [0, 600]]])
+    host, _, score = assign_host_walls(boxes, walls, search_radius=50)
+    assert host.tolist() == [0, -1]
+    assert score[1] == 0
+
+
+def test_orientation_picks_the_wall_along_the_window():
+    boxes = np.array([[450, 95, 550, 105]])
+    walls = np.array([[[500, 0], [500, 400]], [[0, 100], [1000, 100]]])
+    host, _, _ = assign_host_walls(boxes, walls, search_radius=50)
+    assert host.tolist() == [1]
@@ -0,0 +1,137 @@
+import json
+import random
+
+from backend.service.semantic.json_constraint import JsonSchemaPrefix, max_value_chars, min_value_chars, schema_token_budget
+from backend.service.semantic.room_batches import RoomBatch, room_batch_planner
+from backend.service.semantic.room_naming import room_namer
+
+BOUNDED = {"type": "integer", "minimum": 100, "maximum": 119}
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": BOUNDED,
+        "kind": {"enum": ["a", "ab", 12, 120]},
+        "walls": {
+            "type": "array",
+            "maxItems": 2,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "n": {"type": "integer", "minimum": -5, "maximum": 5},
+                    "ok": {"type": "boolean"},
+                    "tag": {"type": "string", "maxLength": 3}
+                }
+            }
+        }
+    }
+}
+ALPHABET = list('0123456789-.{}[]":, ') + sorted(set("idkindwallsnoktagtruefalsexyz"))
+
+
+def _accepts(schema, text):
+    return JsonSchemaPrefix(schema).feed(text)
+
+
+def _complete(schema, text):
+    state = JsonSchemaPrefix(schema)
+    return state.feed(text) and state.complete
+
+
+def test_integer_prefix_that_cannot_reach_the_range_is_rejected():
+    schema = {"type": "object", "properties": {"n": BOUNDED}}
+    assert _accepts(schema, '{"n":11')
+    assert not _accepts(schema, '{"n":13')       # 13 < 100 and 130 > 119
+    assert not _accepts(schema, '{"n":9')
+    assert not _accepts(schema, '{"n":1190')
+    assert not _accepts(schema, '{"n":-')
+    assert _complete(schema, '{"n":119}')
+    assert not _accepts(schema, '{"n":11}')       # valid prefix, but 11 itself is out of range
+
+
+def test_integer_maximum_only_and_negative_ranges():
+    upper = {"type": "object", "properties": {"n": {"type": "integer", "maximum": 119}}}
+    assert _complete(upper, '{"n":13}')
+    assert not _accepts(upper, '{"n":130')
+    signed = {"type": "object", "properties": {"n": {"type": "integer", "minimum": -5, "maximum": 5}}}
+    assert _complete(signed, '{"n":-5}')
+    assert not _accepts(signed, '{"n":-6')
+    assert not _accepts(signed, '{"n":-0.')
+
+
+def test_number_bounds_with_fractions():
+    schema = {"type": "object", "properties": {"x": {"type": "number", "minimum": 0.5, "maximum": 2.25}}}
+    assert _complete(schema, '{"x":0.75}')
+    assert _complete(schema, '{"x":2.2}')
+    assert not _accepts(schema, '{"x":2.3')
+    assert not _accepts(schema, '{"x":3')
+    assert not _accepts(schema, '{"x":0.4')
+
+
+def test_remaining_chars_counts_digits_still_needed():
+    state = JsonSchemaPrefix({"type": "object", "properties": {"n": BOUNDED}})
+    assert state.feed('{"n":1')
+    # two more digits, then the closing brace
+    assert state.remaining_chars() == 3
+
+
+def test_enum_literals_that_prefix_each_other():
+    schema = {"type": "object", "properties": {"k": {"enum": ["a", "ab", 12, 120]}}}
+    assert _complete(schema, '{"k":"ab"}')
+    assert _complete(schema, '{"k":12}')
+    assert _complete(schema, '{"k":120}')
+    assert not _accepts(schema, '{"k":121')
+    assert not _accepts(schema, '{"k":"b')
+
+
+def test_nested_objects_and_arrays():
+    doc = {"id": 105, "kind": "a", "walls": [{"n": -2, "ok": True, "tag": "ext"}, {"n": 0}]}
+    assert _complete(SCHEMA, json.dumps(doc, separators=(",", ":")))
+    assert _complete(SCHEMA, json.dumps(doc, separators=(", ", ": ")))
+    assert not _accepts(SCHEMA, '{"walls":[{},{},')          # maxItems
+    assert not _accepts(SCHEMA, '{"walls":[{"tag":"long"')    # maxLength
+    assert not _accepts(SCHEMA, '{"id":105,"id"')             # repeated key
+    assert not _accepts(SCHEMA, '{"other"')                   # unknown key
+    assert not _accepts(SCHEMA, '{"walls":[{"ok":1')          # wrong type
+
+
+def test_value_length_bounds():
+    assert min_value_chars(BOUNDED) == 1
+    assert max_value_chars(BOUNDED) == 3
+    assert min_value_chars({"enum": ["ab", 12]}) == 2
+    assert min_value_chars({"enum": []}) == max_value_chars({"enum": []}) == 0
+    assert not _accepts({"enum": []}, '"')
+
+
+def test_room_schema_without_a_vocabulary(monkeypatch):
+    """A missing room_vocabulary.json leaves no floorings: the field is dropped, not an empty enum"""
+    monkeypatch.setattr(room_namer, "finishes", {})
+    schema = room_batch_planner.schema(RoomBatch())
+    properties = schema["properties"]["rooms"]["items"]["properties"]
+
+    assert "flooring" not in properties and properties["purpose"] == {"enum": ["other"]}
+    assert "flooring" not in room_batch_planner.instructions()
+    assert schema_token_budget(schema, 4096) > 0
+
+
+def test_random_walks_never_reach_a_dead_end():
+    """Whatever valid characters the decoder picks, some character always keeps the document open"""
+    rng = random.Random(0)
+    for _ in range(300):
+        state, text = JsonSchemaPrefix(SCHEMA), ""
+        for _ in range(400):
+            if state.complete:
+                break
+            options = []
+            for ch in ALPHABET:
+                candidate = state.copy()
+                if candidate.feed(ch):
+                    options.append((candidate.remaining_chars(), ch, candidate))
+            assert options, f"dead end after {text!r}"
+            # Mostly head for the shortest close, sometimes wander
+            options.sort(key=lambda o: o[0])
+            _, ch, state = options[0] if rng.random() < 0.4 else rng.choice(options)
+            text += ch
+        assert state.complete, text
+        doc = json.loads(text)
+        assert 100 <= doc.get("id", 100) <= 119
+        assert all(-5 <= w.get("n", 0) <= 5 for w in doc.get("walls", []))
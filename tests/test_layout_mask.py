@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+from backend.service.pdf_processing.layout import LayoutMasker
+
+H, W = 700, 1000
+
+
+def _sheet():
+    """White sheet with a border frame and a plan of walls in the left part"""
+    image = np.full((H, W, 3), 255, dtype=np.uint8)
+    cv2.rectangle(image, (10, 10), (W - 11, H - 11), (0, 0, 0), 3)
+    for x0, y0, x1, y1 in [(150, 80, 560, 80), (150, 80, 150, 600), (150, 600, 560, 600), (320, 80, 320, 600)]:
+        cv2.line(image, (x0, y0), (x1, y1), (0, 0, 0), 6)
+    return image
+
+
+def _masker():
+    masker = LayoutMasker()
+    masker.enabled = True
+    return masker
+
+
+def test_title_strip_beside_a_full_height_rule_is_masked():
+    image = _sheet()
+    cv2.line(image, (800, 10), (800, H - 11), (0, 0, 0), 3)
+    for y in range(60, H - 40, 70):
+        cv2.line(image, (800, y + 25), (W - 11, y + 25), (0, 0, 0), 1)
+        cv2.putText(image, "PROJECT 01 A", (815, y + 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+        cv2.putText(image, "DWG 12/B", (815, y + 20), cv2.FONT_HERSHEY_PLAIN, 0.8, (0, 0, 0), 1)
+
+    x0, _, x1, _ = _masker().compute(image).bbox("drawable")
+    assert x0 < 200 and x1 <= 800
+
+
+def test_hatched_right_edge_is_kept():
+    image = _sheet()
+    # The plan runs on to the right edge: a thick exterior wall with a hatched zone behind it
+    cv2.line(image, (560, 80), (880, 80), (0, 0, 0), 6)
+    cv2.line(image, (560, 600), (880, 600), (0, 0, 0), 6)
+    cv2.line(image, (880, 80), (880, 600), (0, 0, 0), 14)
+    hatch = np.full((520, 90), 255, dtype=np.uint8)
+    for c in range(0, 90 + 520, 6):
+        cv2.line(hatch, (c, 0), (c - 520, 520), 0, 1)
+    image[80:600, 888:978] = hatch[:, :, None]
+
+    x0, _, x1, _ = _masker().compute(image).bbox("drawable")
+    assert x0 < 200 and x1 >= 970
+
+
+def test_boxed_title_block_in_the_corner_is_masked():
+    image = _sheet()
+    cv2.rectangle(image, (700, 500), (W - 11, H - 11), (0, 0, 0), 3)
+    for y in range(520, H - 20, 30):
+        cv2.putText(image, "SHEET A-101 REV 2", (712, y), cv2.FONT_HERSHEY_PLAIN, 0.9, (0, 0, 0), 1)
+
+    mask = _masker().compute(image)
+    x0, y0 = int(750 / mask.cell_size), int(600 / mask.cell_size)
+    assert not mask.drawable[y0, x0]
+    assert mask.bbox("drawable")[0] < 200
@@ -0,0 +1,37 @@
+import asyncio
+
+from backend.service.detection.registry import ModelRegistry
+
+
+def _registry(load):
+    registry = ModelRegistry()
+    registry._load_sync = load
+    registry._warmup_sync = lambda models: None
+    return registry
+
+
+def test_reload_swaps_in_new_models():
+    registry = _registry(lambda: ({"all": "v1"}, {"all": "a"}))
+    status = asyncio.run(registry.reload())
+    assert status["reloaded"] and status["state"] == "ready"
+    assert registry.models == {"all": "v1"}
+
+
+def test_failed_reload_keeps_previous_models_and_reports_it():
+    registry = _registry(lambda: ({"all": "v1"}, {"all": "a"}))
+    asyncio.run(registry.reload())
+
+    def broken():
+        raise FileNotFoundError("no weights")
+    registry._load_sync = broken
+    status = asyncio.run(registry.reload())
+    assert not status["reloaded"]
+    assert status["state"] == "ready" and status["error"] == "no weights"
+    assert registry.models == {"all": "v1"}
+
+
+def test_failed_first_load_is_failed():
+    def broken():
+        raise FileNotFoundError("no weights")
+    status = asyncio.run(_registry(broken).reload())
+    assert not status["reloaded"] and status["state"] == "failed"
@@ -0,0 +1,61 @@
+import numpy as np
+
+from backend.service.geometry.polygons import clean_rings, extrude_rings, signed_area, triangulate_rings
+
+SQUARE_CW = [(0, 0), (0, 5), (5, 5), (5, 0)]
+L_SHAPE = [(0, 0), (10, 0), (10, 4), (4, 4), (4, 10), (0, 10)]
+# 10 x 10 room around a 4 x 4 courtyard, joined to the outline by a zero-width cut
+COURTYARD = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 5), (3, 5), (3, 7), (7, 7), (7, 3), (3, 3), (3, 5), (0, 5)]
+
+
+def _pack(*rings):
+    points = np.concatenate([np.asarray(r, dtype=np.float64) for r in rings])
+    counts = np.array([len(r) for r in rings])
+    return points, np.concatenate([[0], np.cumsum(counts)[:-1]]), counts
+
+
+def _triangle_areas(points, triangles):
+    a, b, c = points[triangles[:, 0]], points[triangles[:, 1]], points[triangles[:, 2]]
+    return 0.5 * ((b - a)[:, 0] * (c - a)[:, 1] - (b - a)[:, 1] * (c - a)[:, 0])
+
+
+def _volume(vertices, faces):
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    return float(np.einsum("ij,ij->i", a, np.cross(b, c)).sum() / 6)
+
+
+def test_triangulation_covers_each_ring_exactly():
+    points, starts, counts, keep = clean_rings(*_pack(COURTYARD, L_SHAPE, SQUARE_CW))
+    assert keep.all()
+    triangles = triangulate_rings(points, starts, counts)
+    areas = _triangle_areas(points, triangles)
+    # Every triangle counter-clockwise, and per ring they add up to the ring's area
+    assert (areas > 0).all()
+    ring = np.repeat(np.arange(len(counts)), counts)[triangles[:, 0]]
+    np.testing.assert_allclose(np.bincount(ring, weights=areas), [84, 64, 25])
+
+
+def test_hole_is_left_open():
+    points, starts, counts, _ = clean_rings(*_pack(COURTYARD))
+    triangles = triangulate_rings(points, starts, counts)
+    centroids = points[triangles].mean(axis=1)
+    assert not ((centroids > 3) & (centroids < 7)).all(axis=1).any()
+
+
+def test_degenerate_rings_are_dropped_and_the_rest_wound_counter_clockwise():
+    sliver = [(0, 0), (5, 0), (10, 0), (5, 0)]
+    with_repeats = [(0, 0), (0, 0), (4, 0), (8, 0), (8, 8), (0, 8), (0, 0)]
+    points, starts, counts, keep = clean_rings(*_pack(sliver, with_repeats, SQUARE_CW))
+    assert keep.tolist() == [False, True, True]
+    assert counts.tolist() == [4, 4]
+    # The clockwise square comes back reversed
+    square = points[starts[1]:starts[1] + counts[1]]
+    assert signed_area(square) == 25
+
+
+def test_extruded_slabs_have_outward_faces_and_the_right_volume():
+    points, starts, counts, _ = clean_rings(*_pack(COURTYARD, L_SHAPE))
+    buffers = extrude_rings(points, starts, counts, bottom=np.array([-200.0, 0.0]), top=np.array([0.0, 20.0]))
+    assert len(buffers) == 2
+    volumes = [_volume(*buffers.slab_mesh(i)) for i in range(2)]
+    np.testing.assert_allclose(volumes, [84 * 200, 64 * 20])
@@ -0,0 +1,27 @@
+import asyncio
+import functools
+
+import httpx
+
+from backend.service.semantic import qwen_service as qwen_module
+from backend.service.semantic.qwen_service import RemoteQwenClient
+
+
+def test_remote_model_id_comes_from_the_sidecar(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"state": "ready", "model": "Qwen/Qwen2.5-VL-7B-Instruct"})
+
+    monkeypatch.setenv("Qwen_MODEL_PATH", "Qwen/Qwen2.5-VL-3B-Instruct")
+    monkeypatch.setattr(qwen_module.httpx, "AsyncClient",
+                        functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(handler)))
+    client = RemoteQwenClient("http://sidecar:8100/")
+
+    async def ids():
+        return await client.model_id(), await client.model_id()
+
+    assert asyncio.run(ids()) == ("Qwen/Qwen2.5-VL-7B-Instruct",) * 2
+    # Asked once; the sidecar can't swap weights without a restart
+    assert calls == ["/health"]
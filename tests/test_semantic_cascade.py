@@ -0,0 +1,48 @@
+from backend.service.detection.table import EXTERIOR_WALL_THICKNESS_MM
+from backend.service.semantic.cascade import SemanticCascade
+from backend.service.semantic.room_naming import merge_element_analysis
+
+
+def _wall(wall_id, thickness, **extra):
+    return {
+        "id": wall_id, "confidence": 0.95, "thickness": thickness, "thickness_measured": True,
+        "wall_function": "exterior" if thickness > EXTERIOR_WALL_THICKNESS_MM else "interior", **extra
+    }
+
+
+def test_rules_write_the_wall_function_stage5_reads():
+    cascade = SemanticCascade()
+    walls = [
+        _wall(0, EXTERIOR_WALL_THICKNESS_MM + 100),
+        _wall(1, 150),
+        _wall(2, 80),
+        _wall(3, EXTERIOR_WALL_THICKNESS_MM),                 # too close to the threshold
+        _wall(4, 150, thickness_measured=False)               # default thickness
+    ]
+    routing = cascade.route({"walls": walls}, kinds=("walls",))
+
+    assert routing["resolved_locally"] == 3
+    assert [w.get("wall_function") for w in walls[:3]] == ["exterior", "interior", "interior"]
+    assert [w.get("material") for w in walls[:3]] == ["Concrete", "Brick", "Gypsum"]
+    assert all("function" not in w for w in walls)
+    assert not walls[3].get("resolved") and not walls[4].get("resolved")
+
+
+def test_openings_are_left_to_the_llm():
+    cascade = SemanticCascade()
+    doors = [{"id": 0, "confidence": 0.99, "host_wall_id": 0}]
+    windows = [{"id": 0, "confidence": 0.99, "host_wall_id": 0}]
+    routing = cascade.route({"walls": [_wall(0, 150)], "doors": doors, "windows": windows})
+
+    assert routing["resolved_locally"] == 1 and routing["sent_to_llm"] == 2
+    assert not doors[0].get("resolved") and not windows[0].get("resolved")
+    assert cascade.needs_llm({"doors": doors, "windows": windows})
+
+
+def test_llm_answers_update_only_the_residue():
+    walls = [{"id": 7, "wall_function": "interior", "resolved": True}, {"id": 9, "wall_function": "interior"}]
+    merge_element_analysis(walls, [{"id": 7, "function": "Exterior"}, {"id": 9, "function": "Exterior", "material": "Brick"}])
+
+    assert walls[0]["wall_function"] == "interior"
+    assert walls[1]["wall_function"] == "exterior" and walls[1]["material"] == "Brick"
+    assert "function" not in walls[1]
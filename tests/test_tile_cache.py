@@ -0,0 +1,56 @@
+import numpy as np
+
+from backend.service.detection.tile_cache import TileDetectionCache, tile_grid
+
+
+def _cache(tmp_path, max_disk_bytes=None):
+    cache = TileDetectionCache()
+    cache.enabled = True
+    cache.cache_dir = tmp_path
+    if max_disk_bytes is not None:
+        cache.max_disk_bytes = max_disk_bytes
+    return cache
+
+
+def _entry(n):
+    return np.zeros((n, 4)), np.zeros(n), np.zeros(n, dtype=np.int64)
+
+
+def _tiles(count):
+    return [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(count)]
+
+
+def test_tile_grid_is_origin_anchored():
+    grid = tile_grid(2000, 3000, 1024, 128)
+    assert grid[0].tolist() == [0, 0, 1024, 1024]
+    assert grid[:, 2].max() == 3000 and grid[:, 3].max() == 2000
+
+
+def test_lookup_hits_after_store_and_survives_restart(tmp_path):
+    cache = _cache(tmp_path)
+    keys, cached = cache.lookup(_tiles(3), "sig")
+    assert cached == [None, None, None]
+    cache.store(keys, [_entry(i) for i in range(3)])
+
+    reopened = _cache(tmp_path)
+    _, cached = reopened.lookup(_tiles(3), "sig")
+    assert [len(c[0]) for c in cached] == [0, 1, 2]
+    # A different signature (new weights or thresholds) never reuses boxes
+    assert reopened.lookup(_tiles(1), "other")[1] == [None]
+
+
+def test_disk_store_is_bounded_and_evicts_least_recently_used(tmp_path):
+    cache = _cache(tmp_path)
+    keys, _ = cache.lookup(_tiles(4), "sig")
+    cache.put(keys[0], _entry(5))
+    entry_bytes = (tmp_path / keys[0][:2] / f"{keys[0]}.npz").stat().st_size
+    cache.max_disk_bytes = 3 * entry_bytes
+
+    cache.put(keys[1], _entry(5))
+    cache.put(keys[2], _entry(5))
+    cache.get(keys[0])                  # touch: keys[1] is now the oldest
+    cache.put(keys[3], _entry(5))
+
+    on_disk = {p.stem for p in tmp_path.glob("*/*.npz")}
+    assert on_disk == {keys[0], keys[2], keys[3]}
+    assert _cache(tmp_path).get(keys[1]) is None
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from backend.service.geometry.transforms import (
+    PageFrames, apply_affine, apply_affine_boxes, offset_boxes, px_to_model, scale_matrix, translation_matrix
+)
+
+WIDTH, HEIGHT = 842.0, 595.0
+# PyMuPDF's page.rotation_matrix (a, b, c, d, e, f) for each /Rotate of an A4 landscape page
+ROTATIONS = {
+    0: [1, 0, 0, 1, 0, 0],
+    90: [0, 1, -1, 0, HEIGHT, 0],
+    180: [-1, 0, 0, -1, WIDTH, HEIGHT],
+    270: [0, -1, 1, 0, 0, WIDTH]
+}
+
+
+def _frames(rotation: int, dpi: float = 150) -> PageFrames:
+    return PageFrames.from_image_data({"dpi": dpi, "rotation_matrix": ROTATIONS[rotation]})
+
+
+@pytest.mark.parametrize("rotation", sorted(ROTATIONS))
+def test_points_round_trip_through_pixels(rotation):
+    frames = _frames(rotation)
+    points = np.random.default_rng(rotation).uniform([0, 0], [WIDTH, HEIGHT], size=(50, 2))
+    px = apply_affine(frames.pt_to_px, points)
+    np.testing.assert_allclose(apply_affine(frames.px_to_pt, px), points, atol=1e-9)
+    # The rotated page lands inside the raster, scaled by dpi / 72
+    size = np.array([WIDTH, HEIGHT] if rotation in (0, 180) else [HEIGHT, WIDTH]) * frames.pixels_per_point
+    assert (px >= -1e-9).all() and (px <= size + 1e-9).all()
+
+
+@pytest.mark.parametrize("rotation", sorted(ROTATIONS))
+def test_frames_round_trip_through_image_data(rotation):
+    frames = _frames(rotation, dpi=200)
+    again = PageFrames.from_image_data(frames.to_dict())
+    assert again.dpi == pytest.approx(200)
+    np.testing.assert_allclose(again.pt_to_px, frames.pt_to_px)
+
+
+def test_boxes_stay_ordered_under_rotation():
+    boxes = np.array([[10.0, 20.0, 110.0, 70.0]])
+    px = apply_affine_boxes(_frames(90).pt_to_px, boxes)
+    assert (px[:, 2:] > px[:, :2]).all()
+    np.testing.assert_allclose(apply_affine_boxes(_frames(90).px_to_pt, px), boxes, atol=1e-9)
+
+
+def test_tile_offsets_match_translation():
+    boxes = np.array([[1.0, 2.0, 5.0, 9.0], [0.0, 0.0, 3.0, 3.0]])
+    origins = np.array([[640.0, 0.0], [0.0, 1280.0]])
+    expected = [apply_affine_boxes(translation_matrix(*o), b[None])[0] for b, o in zip(boxes, origins)]
+    np.testing.assert_allclose(offset_boxes(boxes, origins), expected)
+
+
+def test_px_to_model_scales_then_places():
+    place = translation_matrix(1000.0, -500.0) @ scale_matrix(1.0, -1.0)
+    matrix = px_to_model(4.0, place)
+    np.testing.assert_allclose(apply_affine(matrix, [[40.0, 80.0]]), [[1010.0, -520.0]])
@@ -0,0 +1,67 @@
+import numpy as np
+
+from backend.service.geometry.model import WALL_DTYPE
+from backend.service.geometry.wall_graph import build_wall_graph
+from backend.service.geometry.wall_joins import solve_wall_joins
+
+
+def _solve(segments, thickness=200.0, miter_limit=4.0):
+    segments = np.asarray(segments, dtype=np.float64)
+    walls = np.zeros(len(segments), dtype=WALL_DTYPE)
+    walls["id"] = np.arange(len(segments))
+    walls["start"][:, :2] = segments[:, 0]
+    walls["end"][:, :2] = segments[:, 1]
+    walls["thickness"] = thickness
+    walls["height"] = 2800
+    counts = solve_wall_joins(walls, build_wall_graph(segments, snap_tolerance=5.0), miter_limit)
+    return walls, counts
+
+
+def _face_corners(wall, end):
+    """Where the left and right faces of one wall end after trimming"""
+    start, stop = wall["start"][:2], wall["end"][:2]
+    d = (stop - start) / np.linalg.norm(stop - start)
+    left = np.array([-d[1], d[0]]) * wall["thickness"] / 2
+    node, into = (start, d) if end == 0 else (stop, -d)
+    return node + into * wall["trim"][end, 0] + left, node + into * wall["trim"][end, 1] - left
+
+
+def test_l_corner_is_mitred_so_the_faces_meet():
+    walls, counts = _solve([[[0, 0], [1000, 0]], [[0, 0], [0, 1000]]])
+    assert counts["miter"] == 2 and counts["free"] == 2
+    assert walls["join_type"].tolist() == [["miter", "free"], ["miter", "free"]]
+    # Outer faces run 100 past the node, inner faces stop 100 short: both walls end on the same cut
+    a, b = _face_corners(walls[0], 0), _face_corners(walls[1], 0)
+    assert {tuple(np.round(p, 6)) for p in a} == {tuple(np.round(p, 6)) for p in b} == {(-100, -100), (100, 100)}
+
+
+def test_t_stem_abuts_the_face_of_the_through_wall():
+    walls, counts = _solve([[[0, 0], [2000, 0]], [[1000, 0], [1000, 1000]]], thickness=np.array([300.0, 100.0]))
+    assert walls["join_type"].tolist() == [["free", "free"], ["abut", "free"]]
+    # Both faces of the stem stop at the host face, half the host's thickness from its centreline
+    assert walls["trim"][1, 0].tolist() == [150, 150]
+    assert not walls["trim"][0].any()
+    assert counts["abut"] == 1
+
+
+def test_x_of_four_ends_continues_one_pair_and_abuts_the_others():
+    walls, counts = _solve(
+        [[[0, 0], [1000, 0]], [[0, 0], [-1000, 0]], [[0, 0], [0, 1000]], [[0, 0], [0, -1000]]],
+        thickness=np.array([300.0, 300.0, 100.0, 100.0])
+    )
+    assert counts == {"free": 4, "miter": 0, "butt": 2, "abut": 2}
+    # The thick pair runs through; the thin walls stop at its faces
+    assert walls["join_type"][:, 0].tolist() == ["butt", "butt", "abut", "abut"]
+    np.testing.assert_allclose(walls["trim"][2:, 0], 150)
+
+
+def test_inline_walls_butt_and_acute_corners_fall_back_to_butt():
+    walls, _ = _solve([[[0, 0], [1000, 0]], [[1000, 0], [2000, 0]]])
+    assert walls["join_type"].tolist() == [["free", "butt"], ["butt", "free"]]
+    assert not walls["trim"].any()
+
+    # 10 degrees apart: the miter would reach ~5.7 thicknesses past the node
+    angle = np.radians(10)
+    walls, counts = _solve([[[0, 0], [1000, 0]], [[0, 0], [1000 * np.cos(angle), 1000 * np.sin(angle)]]])
+    assert walls["join_type"][:, 0].tolist() == ["butt", "butt"]
+    assert counts["miter"] == 0
@@ -0,0 +1,59 @@
+import numpy as np
+
+from backend.service.geometry.model import NO_ID, OPENING_DTYPE, WALL_DTYPE
+from backend.service.geometry.wall_graph import build_wall_graph
+from backend.service.geometry.wall_joins import solve_wall_joins
+from backend.service.geometry.wall_mesh import wall_mesh
+
+
+def _walls(segments, thickness=200.0, height=2800.0, joins=False):
+    segments = np.asarray(segments, dtype=np.float64)
+    walls = np.zeros(len(segments), dtype=WALL_DTYPE)
+    walls["id"] = np.arange(len(segments))
+    walls["start"][:, :2] = segments[:, 0]
+    walls["end"][:, :2] = segments[:, 1]
+    walls["thickness"] = thickness
+    walls["height"] = height
+    if joins:
+        solve_wall_joins(walls, build_wall_graph(segments, snap_tolerance=5.0))
+    return walls
+
+
+def _openings(*specs):
+    """(host, x, y, sill, width, height) per opening"""
+    openings = np.zeros(len(specs), dtype=OPENING_DTYPE)
+    for i, (host, x, y, sill, width, height) in enumerate(specs):
+        openings[i] = (i, (x, y, sill), width, height, "Standard", host, "")
+    return openings
+
+
+def _volume(vertices, faces):
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    return float(np.einsum("ij,ij->i", a, np.cross(b, c)).sum() / 6)
+
+
+def test_openings_are_cut_out_of_the_wall_volume():
+    walls = _walls([[[0, 0], [4000, 0]]])
+    openings = _openings((0, 1000, 0, 0, 900, 2100), (0, 3000, 0, 900, 1200, 1200))
+    vertices, faces = wall_mesh(walls, openings)
+    solid = 4000 * 200 * 2800
+    np.testing.assert_allclose(_volume(vertices, faces), solid - 900 * 200 * 2100 - 1200 * 200 * 1200)
+
+
+def test_overlapping_flush_and_unhosted_openings():
+    walls = _walls([[[0, 0], [4000, 0]]])
+    openings = _openings(
+        (0, 450, 0, 0, 900, 2100),          # flush with the wall start
+        (0, 1200, 0, 0, 1000, 2100),        # overlaps the first by 150
+        (NO_ID, 3000, 0, 0, 900, 2100)      # no host: left uncut
+    )
+    vertices, faces = wall_mesh(walls, openings)
+    cut = 1700 * 200 * 2100
+    np.testing.assert_allclose(_volume(vertices, faces), 4000 * 200 * 2800 - cut)
+
+
+def test_mitred_corner_with_a_window_keeps_the_l_footprint():
+    walls = _walls([[[0, 0], [3000, 0]], [[0, 0], [0, 3000]]], joins=True)
+    vertices, faces = wall_mesh(walls, _openings((1, 0, 1500, 900, 1000, 1200)))
+    footprint = 3100 * 200 + 200 * 2900
+    np.testing.assert_allclose(_volume(vertices, faces), footprint * 2800 - 1000 * 200 * 1200)